@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency benchmark for AI Bash.
+Drives the real request pipeline (get_system_context -> generate_command
+-> validate_command -> execute_command) against mock_llm_server.py with
+a deterministic latency, and reports p50/p95/p99 per stage, throughput,
+startup time and peak RSS.
+
+With --redos it instead times validate_command on adversarial commands
+(repeated rule prefixes, long whitespace runs and argument lists,
+multi-KB heredocs) of growing size, to show validation time stays
+linear in command length, and typical commands with and without the
+parse and verdict caches. With --history it times recall from the
+command history over a large synthetic store.
+
+Usage:
+    python3 benchmark.py --requests 200 --output baseline.json
+    python3 benchmark.py --baseline baseline.json --threshold 0.2
+    python3 benchmark.py --redos --legacy
+    python3 benchmark.py --history 100000
+
+With --baseline the exit status is 1 if any metric regressed by more
+than the threshold.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from executor import ShellSession, execute_command
+from mock_llm_server import MockLLMServer
+from safety import (DANGEROUS_PATTERNS, PROTECTED_PATHS, clear_verdict_cache, parse_command,
+                    validate_command)
+from system_detect import get_system_context
+
+
+# (request, command the fake LLM answers with); all harmless and quick
+DEFAULT_CORPUS = [
+    ("print a greeting", "echo hello"),
+    ("show the kernel version", "uname -r"),
+    ("list files in the root directory", "ls -la /"),
+    ("show disk usage", "df -h"),
+    ("how long has the system been up", "uptime"),
+    ("count lines in os-release", "wc -l /etc/os-release"),
+    ("show the current user", "id -un"),
+    ("do nothing", "true"),
+]
+
+STAGES = ["detect", "generate", "validate", "execute", "total"]
+
+DEFAULT_REQUESTS = 200
+DEFAULT_WARMUP = 10
+DEFAULT_STARTUP_RUNS = 5
+DEFAULT_LLM_LATENCY = "fixed:0.01"
+DEFAULT_THRESHOLD = 0.2
+
+# Latency differences below this are noise, whatever the ratio
+MIN_DELTA_MS = 0.05
+
+# Adversarial commands for --redos: name -> builder taking a size in
+# bytes. Each repeats what a backtracking regex retries from every
+# position: a rule prefix whose wildcard rest never matches, or a long
+# run the rule has to scan past.
+ADVERSARIAL_CASES = {
+    "chmod repeated": lambda size: "chmod " * (size // 6),
+    "chown + spaces": lambda size: "chown -R" + " " * size + "x",
+    "rm argument list": lambda size: "rm -f " + " ".join(
+        f"build/obj{i}.o" for i in range(size // 16)),
+    "rm repeated": lambda size: "rm " * (size // 3),
+    "mkfs repeated": lambda size: "mkfs " * (size // 5),
+    "heredoc": lambda size: "cat <<'EOF' > notes.txt\n" + "".join(
+        f"chmod 777 rm -rf mkfs line {i}\n" for i in range(size // 32)) + "EOF",
+}
+
+DEFAULT_REDOS_SIZES = [1024, 4096, 16384, 65536]
+
+DEFAULT_HISTORY_ENTRIES = 100000
+
+# Everyday commands for the typical-command timings of --redos
+TYPICAL_COMMANDS = [
+    "apt install -y nginx",
+    "find /home -type f -size +500M 2>/dev/null || true",
+    "sudo systemctl restart nginx",
+    "du -sh /var/* 2>/dev/null | sort -rh | head -10",
+    "grep -r 'error' /var/log/syslog | tail -n 50",
+    "rm -rf /tmp/build",
+]
+
+# Legacy matching is quadratic on these inputs; larger sizes take minutes
+LEGACY_MAX_SIZE = 16384
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@contextlib.contextmanager
+def _environment(**values):
+    """Temporarily set environment variables (None removes one)."""
+    saved = {name: os.environ.get(name) for name in values}
+    try:
+        for name, value in values.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def summarize(samples):
+    """
+    Summarize latency samples.
+
+    Args:
+        samples (list): Durations in seconds
+
+    Returns:
+        dict: count, mean, p50, p95, p99 and max in milliseconds
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(percent):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100.0))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) * 1000,
+        "p50": pick(50),
+        "p95": pick(95),
+        "p99": pick(99),
+        "max": ordered[-1] * 1000,
+    }
+
+
+def measure_startup(runs, env):
+    """
+    Time full CLI startups: interpreter, imports, detection and generator
+    construction, with no requests (``cli.py --batch`` on empty input).
+
+    Args:
+        runs (int): Number of startups
+        env (dict): Environment for the child processes
+
+    Returns:
+        tuple: (durations in seconds, peak child RSS in KiB)
+    """
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.join(SCRIPT_DIR, "cli.py"), "--batch", "-"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, env=env, check=True,
+        )
+        durations.append(time.perf_counter() - start)
+    return durations, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+
+def run_benchmark(requests=DEFAULT_REQUESTS, warmup=DEFAULT_WARMUP,
+                  startup_runs=DEFAULT_STARTUP_RUNS, llm_latency=DEFAULT_LLM_LATENCY,
+                  local=False, session=False, concurrency=8, corpus=None, seed=0):
+    """
+    Run the benchmark.
+
+    Args:
+        requests (int): Measured requests through the pipeline
+        warmup (int): Unmeasured requests first
+        startup_runs (int): CLI startups to time (0 skips)
+        llm_latency (str): Fake LLM latency spec (see mock_llm_server.parse_latency)
+        local (bool): Keep the generation cache, intents and similarity index
+            on; by default every request goes to the (fake) LLM
+        session (bool): Execute in a persistent ShellSession instead of a
+            fresh shell per command
+        concurrency (int): Requests in flight for the batch throughput run
+        corpus (list, optional): (request, command) pairs (default: DEFAULT_CORPUS)
+        seed (int): Seed for the fake LLM
+
+    Returns:
+        dict: Results (see main() for the layout)
+    """
+    corpus = corpus or DEFAULT_CORPUS
+    off = None if local else "1"
+
+    with tempfile.TemporaryDirectory() as cache_dir, \
+            MockLLMServer(latency=llm_latency, responses=dict(corpus), seed=seed) as server, \
+            _environment(AI_BASH_BACKEND="openai", AI_BASH_OPENAI_URL=server.url,
+                         AI_BASH_CACHE_DIR=cache_dir, AI_BASH_NO_CACHE=off,
+                         AI_BASH_NO_INTENTS=off, AI_BASH_NO_SIMILAR=off):
+        startup = []
+        startup_rss = None
+        if startup_runs:
+            startup, startup_rss = measure_startup(startup_runs, dict(os.environ))
+
+        from llm_backend import create_generator
+        generator = create_generator(get_system_context())
+        shell = ShellSession() if session else None
+
+        timings = {stage: [] for stage in STAGES}
+        failures = 0
+        try:
+            pipeline_start = None
+            for i in range(warmup + requests):
+                if i == warmup:
+                    pipeline_start = time.perf_counter()
+                request = corpus[i % len(corpus)][0]
+
+                t0 = time.perf_counter()
+                get_system_context()
+                t1 = time.perf_counter()
+                command = generator.generate_command(request)
+                t2 = time.perf_counter()
+                is_safe, _ = validate_command(command)
+                t3 = time.perf_counter()
+                success = False
+                if is_safe:
+                    success, _, _ = execute_command(command, session=shell)
+                t4 = time.perf_counter()
+
+                if i < warmup:
+                    continue
+                failures += not success
+                for stage, duration in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t4 - t0)):
+                    timings[stage].append(duration)
+            pipeline_elapsed = time.perf_counter() - pipeline_start
+        finally:
+            if shell is not None:
+                shell.close()
+
+        batch = [corpus[i % len(corpus)][0] for i in range(requests)]
+        batch_start = time.perf_counter()
+        generator.generate_batch(batch, concurrency=concurrency)
+        batch_elapsed = time.perf_counter() - batch_start
+        llm_stats = server.stats()
+
+    return {
+        "version": 1,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {
+            "requests": requests, "warmup": warmup, "startup_runs": startup_runs,
+            "llm_latency": llm_latency, "local": local, "session": session,
+            "concurrency": concurrency,
+        },
+        "startup": summarize(startup),
+        "stages": {stage: summarize(samples) for stage, samples in timings.items()},
+        "throughput": {
+            "pipeline_rps": requests / pipeline_elapsed if pipeline_elapsed else None,
+            "generate_batch_rps": requests / batch_elapsed if batch_elapsed else None,
+        },
+        "rss_peak_kb": {
+            "benchmark": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "startup": startup_rss,
+        },
+        "failures": failures,
+        "llm_requests": llm_stats["requests"],
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Find metrics that regressed against a baseline.
+
+    Latencies (p50/p95 per stage and startup) regress when they grow by
+    more than the threshold and MIN_DELTA_MS; throughputs regress when
+    they shrink by more than the threshold.
+
+    Args:
+        results (dict): Current run_benchmark() results
+        baseline (dict): Earlier results
+        threshold (float): Allowed relative change, e.g. 0.2 for 20%
+
+    Returns:
+        list: Human-readable regression descriptions (empty if none)
+    """
+    regressions = []
+
+    latencies = [("startup", results.get("startup", {}), baseline.get("startup", {}))]
+    for stage, current in results.get("stages", {}).items():
+        latencies.append((stage, current, baseline.get("stages", {}).get(stage, {})))
+
+    for name, current, base in latencies:
+        for key in ("p50", "p95"):
+            if current.get(key) is None or not base.get(key):
+                continue
+            if (current[key] > base[key] * (1 + threshold)
+                    and current[key] - base[key] > MIN_DELTA_MS):
+                regressions.append(
+                    f"{name} {key}: {base[key]:.2f} ms -> {current[key]:.2f} ms "
+                    f"(+{(current[key] / base[key] - 1) * 100:.0f}%)"
+                )
+
+    for key, current in results.get("throughput", {}).items():
+        base = baseline.get("throughput", {}).get(key)
+        if current is None or not base:
+            continue
+        if current < base * (1 - threshold):
+            regressions.append(
+                f"{key}: {base:.1f}/s -> {current:.1f}/s "
+                f"(-{(1 - current / base) * 100:.0f}%)"
+            )
+
+    return regressions
+
+
+def _legacy_is_dangerous(command):
+    """The rule set as plain re.search() calls, as before linear matching."""
+    command = command.strip().lower()
+    patterns = list(DANGEROUS_PATTERNS)
+    for path in PROTECTED_PATHS:
+        patterns.append(rf'rm\s+.*{re.escape(path)}(?:\s|$)')
+        patterns.append(rf'mkfs.*{re.escape(path)}')
+    return any(re.search(pattern, command, re.IGNORECASE) for pattern in patterns)
+
+
+def _validate_uncached(command):
+    """validate_command on a command neither the parse nor verdict cache has seen."""
+    parse_command.cache_clear()
+    clear_verdict_cache()
+    return validate_command(command)
+
+
+def _typical_times(function, repeats, rounds=200):
+    """Best mean microseconds per TYPICAL_COMMANDS entry over `repeats` runs."""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for command in TYPICAL_COMMANDS:
+                function(command)
+        elapsed = (time.perf_counter() - start) / (rounds * len(TYPICAL_COMMANDS))
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6
+
+
+def _best_time(function, argument, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_redos_benchmark(sizes=None, repeats=3, legacy=False, cases=None):
+    """
+    Time validation of adversarial commands at growing sizes.
+
+    Args:
+        sizes (list, optional): Command sizes in bytes (default: DEFAULT_REDOS_SIZES)
+        repeats (int): Runs per command; the fastest counts
+        legacy (bool): Also time plain re.search() matching, up to LEGACY_MAX_SIZE
+        cases (dict, optional): name -> command builder (default: ADVERSARIAL_CASES)
+
+    Returns:
+        dict: Per case, the size, ms and legacy_ms per command size, and
+            growth: time ratio between the largest and smallest size
+            divided by their size ratio (about 1 when linear); and
+            typical: microseconds per TYPICAL_COMMANDS entry with the
+            parse and verdict caches cleared (cold_us) and warm (cached_us)
+    """
+    sizes = sorted(sizes or DEFAULT_REDOS_SIZES)
+    results = {}
+    for name, build in (cases or ADVERSARIAL_CASES).items():
+        rows = []
+        for size in sizes:
+            command = build(size)
+            row = {
+                "size": len(command),
+                "ms": _best_time(_validate_uncached, command, repeats) * 1000,
+            }
+            if legacy and size <= LEGACY_MAX_SIZE:
+                row["legacy_ms"] = _best_time(_legacy_is_dangerous, command, repeats) * 1000
+            rows.append(row)
+        first, last = rows[0], rows[-1]
+        growth = None
+        if first["ms"] > 0 and last["size"] > first["size"]:
+            growth = (last["ms"] / first["ms"]) / (last["size"] / first["size"])
+        results[name] = {"rows": rows, "growth": growth}
+    typical = {
+        "cold_us": _typical_times(_validate_uncached, repeats),
+        "cached_us": _typical_times(validate_command, repeats),
+    }
+    if legacy:
+        typical["legacy_us"] = _typical_times(_legacy_is_dangerous, repeats)
+    return {
+        "version": 1,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "redos": results,
+        "typical": typical,
+    }
+
+
+def run_history_benchmark(entries=DEFAULT_HISTORY_ENTRIES, lookups=200):
+    """
+    Time history recall over a store filled with synthetic entries.
+
+    Args:
+        entries (int): Entries written before timing lookups
+        lookups (int): Lookups timed per kind
+
+    Returns:
+        dict: entries, fill seconds, record_us (time record() blocks the
+            caller) and p50/max ms per lookup kind (prefix, search, recall)
+    """
+    from history import HistoryStore
+
+    words = ["find", "large", "files", "show", "disk", "usage", "restart", "nginx",
+             "list", "open", "ports", "tail", "logs", "memory", "docker", "clean"]
+    queries = [" ".join(words[(i + j * 5) % len(words)] for j in range(2)) for i in range(lookups)]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(os.path.join(tmp, "history.db"), batch_size=4096)
+        try:
+            start = time.perf_counter()
+            for i in range(entries):
+                request = " ".join(words[(i * k) % len(words)] for k in (1, 3, 7)) + f" {i}"
+                store.record(request, f"echo {i}", True, "ok", 0, 0.01)
+            record_us = (time.perf_counter() - start) / max(1, entries) * 1e6
+            store.flush()
+            fill = time.perf_counter() - start
+
+            kinds = {"prefix": store.prefix, "search": store.search, "recall": store.recall}
+            timings = {}
+            for kind, lookup in kinds.items():
+                samples = []
+                for query in queries:
+                    t0 = time.perf_counter()
+                    lookup(query)
+                    samples.append((time.perf_counter() - t0) * 1000)
+                samples.sort()
+                timings[kind] = {"p50": samples[len(samples) // 2], "max": samples[-1]}
+        finally:
+            store.close()
+    return {"entries": entries, "fill_s": fill, "record_us": record_us, "lookups": timings}
+
+
+def print_history_report(results, out=None):
+    """Print history recall timings."""
+    out = out or sys.stdout
+    print(f"AI Bash history benchmark: {results['entries']} entries "
+          f"(filled in {results['fill_s']:.1f} s, record() {results['record_us']:.1f} us)",
+          file=out)
+    for kind, stats in results["lookups"].items():
+        print(f"  {kind:<8} p50 {stats['p50']:7.2f} ms  max {stats['max']:7.2f} ms", file=out)
+
+
+def print_redos_report(results, out=None):
+    """Print adversarial validation timings as a table."""
+    out = out or sys.stdout
+    print("AI Bash adversarial validation benchmark (ms per command)", file=out)
+    for name, case in results["redos"].items():
+        print(f"  {name}", file=out)
+        for row in case["rows"]:
+            legacy = row.get("legacy_ms")
+            legacy = f"  legacy {legacy:9.3f}" if legacy is not None else ""
+            per_kb = row["ms"] * 1000 / (row["size"] / 1024.0)
+            print(f"    {row['size']:>8} B {row['ms']:9.3f} ({per_kb:6.1f} us/KB){legacy}",
+                  file=out)
+        if case["growth"] is not None:
+            print(f"    growth vs linear: {case['growth']:.2f}x", file=out)
+    typical = results.get("typical")
+    if typical:
+        legacy = typical.get("legacy_us")
+        legacy = f", legacy {legacy:.1f}" if legacy is not None else ""
+        print(f"  typical commands (us per command): uncached {typical['cold_us']:.1f}, "
+              f"cached {typical['cached_us']:.1f}{legacy}", file=out)
+
+
+def print_report(results, out=None):
+    """Print results as a table."""
+    out = out or sys.stdout
+    config = results["config"]
+    print(f"AI Bash benchmark: {config['requests']} requests, "
+          f"LLM latency {config['llm_latency']}", file=out)
+    print(f"  {'stage':<10} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)", file=out)
+    rows = [("startup", results["startup"])] + list(results["stages"].items())
+    for name, stats in rows:
+        if not stats.get("count"):
+            continue
+        print(f"  {name:<10} {stats['p50']:9.2f} {stats['p95']:9.2f} "
+              f"{stats['p99']:9.2f} {stats['max']:9.2f}", file=out)
+    throughput = results["throughput"]
+    print(f"  throughput: pipeline {throughput['pipeline_rps']:.1f}/s, "
+          f"batch generation {throughput['generate_batch_rps']:.1f}/s", file=out)
+    rss = results["rss_peak_kb"]
+    startup_rss = f"{rss['startup'] / 1024:.1f} MiB" if rss["startup"] else "-"
+    print(f"  peak RSS: benchmark {rss['benchmark'] / 1024:.1f} MiB, "
+          f"startup {startup_rss}", file=out)
+    if results["failures"]:
+        print(f"  {results['failures']} commands failed", file=out)
+
+
+def main(argv=None):
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description="AI Bash end-to-end latency benchmark")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    parser.add_argument("--startup-runs", type=int, default=DEFAULT_STARTUP_RUNS)
+    parser.add_argument("--llm-latency", default=DEFAULT_LLM_LATENCY,
+                        help=f"fake LLM latency spec (default {DEFAULT_LLM_LATENCY})")
+    parser.add_argument("--local", action="store_true",
+                        help="keep cache, intents and similarity lookups enabled")
+    parser.add_argument("--session", action="store_true",
+                        help="execute in a persistent shell session")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="requests in flight for batch throughput (default 8)")
+    parser.add_argument("--output", metavar="FILE", help="write results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against earlier results")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative regression (default 0.2)")
+    parser.add_argument("--redos", action="store_true",
+                        help="time validation of adversarial commands instead")
+    parser.add_argument("--sizes", type=int, nargs="+", metavar="BYTES",
+                        help="adversarial command sizes (default: "
+                             f"{' '.join(map(str, DEFAULT_REDOS_SIZES))})")
+    parser.add_argument("--legacy", action="store_true",
+                        help="with --redos, also time plain regex matching")
+    parser.add_argument("--history", type=int, nargs="?", const=DEFAULT_HISTORY_ENTRIES,
+                        metavar="ENTRIES",
+                        help="time history recall over this many entries instead "
+                             f"(default {DEFAULT_HISTORY_ENTRIES})")
+    args = parser.parse_args(argv)
+
+    if args.history:
+        results = run_history_benchmark(entries=args.history)
+        print_history_report(results)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {args.output}")
+        return 0
+
+    if args.redos:
+        results = run_redos_benchmark(sizes=args.sizes, legacy=args.legacy)
+        print_redos_report(results)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {args.output}")
+        return 0
+
+    results = run_benchmark(
+        requests=args.requests, warmup=args.warmup, startup_runs=args.startup_runs,
+        llm_latency=args.llm_latency, local=args.local, session=args.session,
+        concurrency=args.concurrency,
+    )
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\n✓ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
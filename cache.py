@@ -0,0 +1,215 @@
+"""
+On-disk caching for AI Bash.
+Stores generated commands so repeated requests skip the LLM round trip.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_TTL = 7 * 24 * 3600  # one week
+
+
+def get_cache_dir():
+    """
+    Get the directory AI Bash keeps its caches in.
+
+    Honours AI_BASH_CACHE_DIR, then XDG_CACHE_HOME, then ~/.cache.
+
+    Returns:
+        str: Cache directory path (not necessarily created yet)
+    """
+    cache_dir = os.getenv("AI_BASH_CACHE_DIR")
+    if cache_dir:
+        return cache_dir
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ai-bash")
+
+
+def write_json_atomic(path, data):
+    """
+    Write JSON to a file via rename so readers never see a partial file.
+
+    Args:
+        path (str): Destination file
+        data: JSON-serializable object
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_json(path, default=None):
+    """
+    Read a JSON file, returning a default if it is missing or corrupt.
+
+    Args:
+        path (str): File to read
+        default: Value returned on any error
+
+    Returns:
+        Parsed JSON or default
+    """
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def normalize_request(user_request):
+    """
+    Normalize a natural language request for use as a cache key.
+
+    Args:
+        user_request (str): Raw request text
+
+    Returns:
+        str: Lowercased request with collapsed whitespace
+    """
+    return " ".join(user_request.lower().split())
+
+
+def make_key(*parts):
+    """
+    Build a stable cache key from JSON-serializable parts.
+
+    Returns:
+        str: Hex digest of the parts
+    """
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    Size-bounded LRU cache with TTL eviction, persisted as a JSON file.
+
+    Lookups are served from memory; every store rewrites the file.
+    """
+
+    def __init__(self, path=None, max_entries=None, ttl=None):
+        """
+        Load the cache from disk.
+
+        Args:
+            path (str, optional): Cache file. Defaults to generations.json in get_cache_dir().
+            max_entries (int, optional): Entry limit (AI_BASH_CACHE_SIZE, default 1000)
+            ttl (float, optional): Seconds an entry stays valid (AI_BASH_CACHE_TTL, default one week)
+        """
+        if path is None:
+            path = os.path.join(get_cache_dir(), "generations.json")
+        if max_entries is None:
+            max_entries = int(os.getenv("AI_BASH_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+        if ttl is None:
+            ttl = float(os.getenv("AI_BASH_CACHE_TTL", DEFAULT_TTL))
+
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # key -> [value, stored_at]; order is least to most recently used
+        self._entries = OrderedDict()
+        stored = read_json(path, default=[])
+        if isinstance(stored, list):
+            now = time.time()
+            for item in stored:
+                try:
+                    key, value, stored_at = item
+                except (TypeError, ValueError):
+                    continue
+                if now - stored_at < ttl:
+                    self._entries[key] = [value, stored_at]
+        self._evict()
+
+    def get(self, key):
+        """
+        Look up a cached value.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            The cached value, or None on a miss or expired entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Store a value and persist the cache.
+
+        Args:
+            key (str): Cache key
+            value: JSON-serializable value
+        """
+        with self._lock:
+            self._entries[key] = [value, time.time()]
+            self._entries.move_to_end(key)
+            self._evict()
+            self._save()
+
+    def discard(self, key):
+        """
+        Remove an entry, e.g. one that no longer passes validation.
+
+        Args:
+            key (str): Cache key
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._save()
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: hits, misses, size and max_entries
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        data = [[key, value, stored_at] for key, (value, stored_at) in self._entries.items()]
+        try:
+            write_json_atomic(self.path, data)
+        except OSError:
+            # A read-only or full disk should never break command generation
+            pass
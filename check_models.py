@@ -2,10 +2,13 @@
 """
 Check available Gemini models for your API key.
 Run this to see which models you can use.
+Shows the cached discovery result, then refreshes the cache AI Bash reads at startup.
 """
 
 import os
+import time
 import google.generativeai as genai
+from llm_gemini import load_cached_models, refresh_model_cache
 
 # Get API key from environment or .env file
 api_key = os.getenv("GEMINI_API_KEY")
@@ -25,26 +28,30 @@ if not api_key:
     print("Set it in .env file or as environment variable")
     exit(1)
 
-print("Checking available Gemini models...\n")
+cached = load_cached_models(api_key)
+if cached:
+    age = int(time.time() - cached.get("fetched_at", 0))
+    print(f"Cached model: {cached['model']} ({len(cached.get('models', []))} model(s), {age}s old)")
+else:
+    print("No cached model list for this API key")
+
+pinned = os.getenv("AI_BASH_MODEL")
+if pinned:
+    print(f"Pinned via AI_BASH_MODEL: {pinned}")
+
+print("\nChecking available Gemini models...\n")
 
 genai.configure(api_key=api_key)
 
-available_models = []
-for m in genai.list_models():
-    if "generateContent" in m.supported_generation_methods:
-        available_models.append(m.name)
-        print(f"✓ {m.name}")
+entry = refresh_model_cache(api_key)
+available_models = entry["models"]
+for name in available_models:
+    print(f"✓ {name}")
 
 if not available_models:
     print("❌ No models available for your API key!")
 else:
     print(f"\n✓ Found {len(available_models)} available model(s)")
     print("\nRecommended for AI Bash:")
-    if "models/gemini-1.5-flash" in available_models:
-        print("  → gemini-1.5-flash (fast and efficient)")
-    elif "models/gemini-1.5-pro" in available_models:
-        print("  → gemini-1.5-pro (most capable)")
-    elif "models/gemini-pro" in available_models:
-        print("  → gemini-pro (standard)")
-    else:
-        print(f"  → {available_models[0].replace('models/', '')}")
+    print(f"  → {entry['model'].replace('models/', '')}")
+    print("\n✓ Model cache refreshed")
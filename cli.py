@@ -5,14 +5,31 @@ Main CLI interface.
 
 Usage:
     sudo ai
+    ai "free up space in /tmp"
+    ai --daemon
+    ai --batch requests.txt [--execute] > commands.jsonl
 """
 
+import time
+
+# Reference point for --startup-profile; set before any other import
+_STARTUP = time.perf_counter()
+
+import argparse
+import json
 import sys
 import os
-from system_detect import get_system_context
-from llm_gemini import GeminiCommandGenerator
-from safety import validate_command
-from executor import get_user_confirmation, execute_command, display_result
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from system_detect import get_executable_index, get_system_context
+from safety import split_independent, validate_command
+from executor import (CANCELLED_STATUS, ShellSession, get_user_confirmation, offer_rewrite,
+                      run_command, run_parallel, parallel_exit_status, display_result,
+                      display_parallel_results)
+from cost import review_command
 
 
 def print_banner():
@@ -32,25 +49,384 @@ def print_system_info(context):
     print("Type 'exit' or 'quit' to exit\n")
 
 
-def main():
+class StartupProfile:
+    """
+    Record when each startup phase ran and how long it took (--startup-profile).
+    """
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = []
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as one phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start, time.perf_counter() - start)
+    
+    def mark(self, name):
+        """Record an instant, e.g. the moment the prompt is shown."""
+        self._record(name, time.perf_counter(), 0.0)
+    
+    def _record(self, name, start, duration):
+        with self._lock:
+            self.phases.append(
+                (name, threading.current_thread().name, start - _STARTUP, duration)
+            )
+    
+    def report(self, out=None):
+        """Print phases in start order, offsets relative to process startup."""
+        out = out or sys.stderr
+        print("\nStartup profile (ms):", file=out)
+        print(f"  {'phase':<24} {'thread':<12} {'start':>8} {'duration':>9}", file=out)
+        for name, thread, start, duration in sorted(self.phases, key=lambda p: p[2]):
+            print(f"  {name:<24} {thread:<12} {start * 1000:8.1f} {duration * 1000:9.1f}",
+                  file=out)
+
+
+class GeneratorWarmup:
+    """
+    Build the command generator on a background thread.
+    
+    Importing google.generativeai starts immediately; construction waits
+    for the system context, which the main thread detects meanwhile.
+    """
+    
+    def __init__(self, profile):
+        self.profile = profile
+        self.generator = None
+        self.error = None
+        self._context = None
+        self._context_ready = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        try:
+            with self.profile.phase("import backend"):
+                import llm_backend
+                llm_backend.load_backend().preload()
+            self._context_ready.wait()
+            with self.profile.phase("generator init"):
+                self.generator = create_generator(self._context)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._done.set()
+    
+    def set_context(self, system_context):
+        """Hand over the detected system context."""
+        self._context = system_context
+        self._context_ready.set()
+    
+    @property
+    def ready(self):
+        return self._done.is_set()
+    
+    def wait(self):
+        """Block until warm-up has finished (successfully or not)."""
+        self._done.wait()
+    
+    def result(self):
+        """
+        Get the generator, blocking until warm-up has finished.
+        
+        Returns:
+            CommandGenerator: Ready generator
+            
+        Raises:
+            Exception: Whatever construction raised (e.g. ValueError for a missing key)
+        """
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.generator
+
+
+def open_history():
+    """
+    Open the command history and load it into readline.
+    
+    Returns:
+        HistoryStore: The store, or None if disabled (AI_BASH_NO_HISTORY) or unavailable
+    """
+    if os.getenv("AI_BASH_NO_HISTORY"):
+        return None
+    import sqlite3
+    from history import HistoryStore, setup_readline
+    try:
+        store = HistoryStore()
+    except (OSError, sqlite3.Error) as e:
+        print(f"(history disabled: {e})")
+        return None
+    setup_readline(store)
+    return store
+
+
+def show_history(store, query=""):
+    """
+    List history entries, newest last.
+    
+    Args:
+        store (HistoryStore): Store to read, or None if history is off
+        query (str): Search text; empty lists the most recent entries
+    """
+    if store is None:
+        print("History is disabled")
+        return
+    from history import format_entry
+    entries = store.search(query, 20) if query else store.recent(20)
+    if not entries:
+        print("No matching history entries")
+        return
+    for entry in reversed(entries):
+        print(format_entry(entry))
+    print("Rerun one with !<number>, or !<text> for the newest match")
+
+
+def show_partial_command(partial):
+    """Redraw the command line while generation is streaming."""
+    sys.stdout.write(f"\r\x1b[K  {partial}")
+    sys.stdout.flush()
+
+
+def parse_args(argv=None):
+    """
+    Parse command line arguments.
+    
+    Args:
+        argv (list, optional): Arguments (default: sys.argv[1:])
+        
+    Returns:
+        argparse.Namespace: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="ai", description="Natural language to Linux shell commands"
+    )
+    parser.add_argument(
+        "request", nargs="*",
+        help="translate a single request and exit (served by the daemon if running)"
+    )
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="run the resident daemon that serves one-shot requests"
+    )
+    parser.add_argument(
+        "--batch", metavar="FILE", nargs="?", const="-",
+        help="read one request per line from FILE (default: stdin) and write JSONL"
+    )
+    parser.add_argument(
+        "--execute", action="store_true",
+        help="in batch mode, also execute every command that passes validation"
+    )
+    parser.add_argument(
+        "--output", metavar="FILE", default="-",
+        help="batch output file (default: stdout)"
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="stream generation, showing the command as it forms"
+    )
+    parser.add_argument(
+        "--startup-profile", action="store_true",
+        help="report import and initialization time per startup phase"
+    )
+    parser.add_argument(
+        "--lookahead", type=int, default=4,
+        help="requests generated ahead of the one being executed (default: 4)"
+    )
+    return parser.parse_args(argv)
+
+
+def read_requests(lines):
+    """
+    Yield requests from batch input, skipping blank lines and # comments.
+    
+    Args:
+        lines (iterable): Input lines
+        
+    Yields:
+        tuple: (line_number, request)
+    """
+    for line_number, line in enumerate(lines, 1):
+        request = line.strip()
+        if request and not request.startswith("#"):
+            yield line_number, request
+
+
+def run_batch(generator, lines, out, execute=False, lookahead=4, session=None,
+              installed=None):
+    """
+    Translate requests in a pipeline and write one JSON record per request.
+    
+    Up to `lookahead` requests are generated in the background while the
+    current one is validated and executed, so LLM latency overlaps with
+    execution time. Records are written in input order.
+    
+    Args:
+        generator: Command generator with generate_command()
+        lines (iterable): Input lines, one request each
+        out: Text stream for JSONL output
+        execute (bool): Execute commands that pass validation
+        lookahead (int): Requests generated ahead of the current one
+        session (ShellSession, optional): Shell to execute in
+        installed (ExecutableIndex, optional): Reject commands naming
+            executables not in it
+        
+    Returns:
+        bool: True if every command was safe (and succeeded, when executing)
+    """
+    all_ok = True
+    pending = deque()
+    requests = read_requests(lines)
+    
+    with ThreadPoolExecutor(max_workers=max(1, lookahead)) as pool:
+        def fill():
+            while len(pending) <= lookahead:
+                item = next(requests, None)
+                if item is None:
+                    return
+                line_number, request = item
+                pending.append(
+                    (line_number, request, pool.submit(generator.generate_command, request))
+                )
+        
+        fill()
+        while pending:
+            line_number, request, future = pending.popleft()
+            fill()
+            
+            command = future.result()
+            is_safe, message = validate_command(command, installed)
+            if not is_safe:
+                metrics.incr("blocked_commands")
+            record = {
+                "line": line_number,
+                "request": request,
+                "command": command,
+                "safe": is_safe,
+                "message": message,
+            }
+            
+            if is_safe and execute:
+                result = run_command(command, session=session)
+                record.update(executed=True, success=result.success, output=result.output,
+                              error=result.error, returncode=result.returncode)
+                if result.usage is not None:
+                    record.update(cpu_time=result.usage.cpu_time, max_rss=result.usage.max_rss)
+                all_ok = all_ok and result.success
+            else:
+                record["executed"] = False
+            
+            all_ok = all_ok and is_safe
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+    
+    return all_ok
+
+
+def create_generator(system_context):
+    """
+    Create the command generator for the configured backend (AI_BASH_BACKEND).
+    
+    The backend (and its client library) is imported here rather than at
+    module level so one-shot and daemon-client paths never load it.
+    
+    Args:
+        system_context (dict): System detection context
+        
+    Returns:
+        CommandGenerator: Ready generator
+    """
+    from llm_backend import create_generator as create_backend_generator
+    return create_backend_generator(system_context)
+
+
+def batch_main(args):
+    """
+    Run non-interactive batch mode.
+    
+    Args:
+        args (argparse.Namespace): Parsed arguments
+        
+    Returns:
+        int: Process exit code
+    """
+    system_context = get_system_context()
+    try:
+        generator = create_generator(system_context)
+    except ValueError as e:
+        print(f"✗ Error: {e}", file=sys.stderr)
+        return 1
+    
+    session = None
+    if args.execute and not os.getenv("AI_BASH_NO_SESSION"):
+        session = ShellSession()
+    
+    source = sys.stdin if args.batch == "-" else open(args.batch, "r")
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        ok = run_batch(generator, source, out, execute=args.execute,
+                       lookahead=args.lookahead, session=session,
+                       installed=get_executable_index(system_context["pkg_manager"]))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+        if session is not None:
+            session.close()
+    
+    return 0 if ok else 1
+
+
+def main(argv=None):
     """Main CLI loop for AI Bash."""
+    args = parse_args(argv)
+    if args.daemon:
+        import daemon
+        sys.exit(daemon.main())
+    if args.batch is not None:
+        sys.exit(batch_main(args))
+    if args.request:
+        import client
+        sys.exit(client.run_once(" ".join(args.request)))
+    
+    profile = StartupProfile(args.startup_profile)
+    
     try:
+        # Import and initialize the backend while the banner and detection run
+        warmup = GeneratorWarmup(profile)
+        
         # Display banner
-        print_banner()
+        with profile.phase("banner"):
+            print_banner()
         
         # Detect system context
         print("Detecting system environment...")
-        system_context = get_system_context()
+        with profile.phase("system detection"):
+            system_context = get_system_context()
+        warmup.set_context(system_context)
         print_system_info(system_context)
+        installed = get_executable_index(system_context["pkg_manager"])
         
-        # Initialize Gemini command generator
-        try:
-            generator = GeminiCommandGenerator(system_context)
-        except ValueError as e:
-            print(f"✗ Error: {e}")
-            print("\nPlease set your Gemini API key:")
-            print("  export GEMINI_API_KEY='your-api-key-here'")
-            sys.exit(1)
+        # One shell for the whole REPL so cd and exports carry over
+        session = None if os.getenv("AI_BASH_NO_SESSION") else ShellSession()
+        
+        with profile.phase("history"):
+            history = open_history()
+        
+        profile.mark("time to prompt")
+        if profile.enabled:
+            warmup.wait()
+            profile.report()
+        
+        generator = None
         
         # Main command loop
         while True:
@@ -67,24 +443,96 @@ def main():
                 if not user_input:
                     continue
                 
-                # Generate command from natural language
-                print("Generating command...")
-                command = generator.generate_command(user_input)
+                # History listing and recall need no model
+                if user_input == "history" or user_input.startswith("history "):
+                    show_history(history, user_input[len("history"):].strip())
+                    continue
                 
-                # Validate command safety
-                is_safe, message = validate_command(command)
+                request = user_input
+                if user_input.startswith("!") and history is not None:
+                    entry = history.recall(user_input[1:])
+                    if entry is None:
+                        print("✗ No matching history entry")
+                        continue
+                    request, command = entry.request, entry.command
+                    print(f"(recalled #{entry.id} \"{request}\")")
+                else:
+                    # First request blocks only if warm-up is still running
+                    if generator is None:
+                        if not warmup.ready:
+                            print("Waiting for model initialization...")
+                        try:
+                            generator = warmup.result()
+                        except ValueError as e:
+                            print(f"✗ Error: {e}")
+                            if "GEMINI_API_KEY" in str(e):
+                                print("\nPlease set your Gemini API key:")
+                                print("  export GEMINI_API_KEY='your-api-key-here'")
+                            sys.exit(1)
+                    
+                    # Generate command from natural language
+                    print("Generating command...")
+                    if args.stream:
+                        command = generator.generate_command_stream(
+                            user_input, on_update=show_partial_command
+                        )
+                        print()
+                    else:
+                        command = generator.generate_command(user_input)
+                    if getattr(generator, "last_source", None) == "similar":
+                        score, similar_request, _ = generator.last_similar
+                        print(f"(reused from similar request \"{similar_request}\", "
+                              f"similarity {score:.2f})")
+                
+                # Validate command safety (and that its tools are installed)
+                is_safe, message = validate_command(command, installed)
                 
                 if not is_safe:
+                    metrics.incr("blocked_commands")
                     print(f"\n✗ {message}")
+                    if history is not None:
+                        history.record(request, command, False, message)
                     continue
                 
+                # Offer a cheaper form of expensive scans, then estimate their cost
+                command, estimate = review_command(
+                    command, installed, ask=offer_rewrite,
+                    cwd=session.cwd if session is not None else None)
+                
                 # Get user confirmation
-                if get_user_confirmation(command):
-                    print("Executing...")
-                    success, output, error = execute_command(command)
-                    display_result(success, output, error)
+                exit_status = duration = None
+                if get_user_confirmation(command, estimate):
+                    pieces = ([command] if os.getenv("AI_BASH_NO_PARALLEL")
+                              else split_independent(command))
+                    started = time.monotonic()
+                    if len(pieces) > 1:
+                        # Independent read-only commands: run them side by side
+                        print(f"Executing {len(pieces)} commands in parallel...")
+                        try:
+                            results = run_parallel(
+                                pieces, stream=True,
+                                cwd=session.cwd if session is not None else None)
+                        except KeyboardInterrupt:
+                            # Running commands were stopped, waiting ones skipped
+                            results = None
+                            print("\nExecution interrupted")
+                        duration = time.monotonic() - started
+                        if results is None:
+                            exit_status = CANCELLED_STATUS
+                        else:
+                            exit_status = parallel_exit_status(results)
+                            display_parallel_results(results, streamed=True)
+                    else:
+                        print("Executing...")
+                        result = run_command(command, stream=True, session=session)
+                        duration = time.monotonic() - started
+                        exit_status = result.returncode
+                        display_result(result.success, result.output, result.error,
+                                       streamed=True, usage=result.usage)
                 else:
                     print("Execution cancelled")
+                if history is not None:
+                    history.record(request, command, True, message, exit_status, duration)
                     
             except KeyboardInterrupt:
                 print("\n\nUse 'exit' to quit")
@@ -92,6 +540,11 @@ def main():
             except EOFError:
                 print("\nGoodbye!")
                 break
+        
+        if session is not None:
+            session.close()
+        if history is not None:
+            history.close()
                 
     except KeyboardInterrupt:
         print("\n\nGoodbye!")
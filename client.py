@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Thin client for the AI Bash daemon.
+Uses only the standard library; falls back to in-process generation
+when no daemon is running.
+
+Usage:
+    python3 client.py "free up space in /tmp"
+"""
+
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+
+import metrics
+from safety import split_independent, validate_command
+from executor import (get_user_confirmation, offer_rewrite, run_command, run_parallel,
+                      display_result, display_parallel_results)
+
+
+# Seconds to wait for the daemon to answer a generation request
+DEFAULT_REQUEST_TIMEOUT = 120
+
+
+def get_socket_path():
+    """
+    Get the daemon's Unix socket path.
+
+    Honours AI_BASH_SOCKET, then $XDG_RUNTIME_DIR, then a per-user
+    directory in /tmp (/tmp/ai-bash-<uid>, created 0700 by the daemon).
+    Whichever it is, the socket's directory must be private (see
+    check_private_directory).
+
+    Returns:
+        str: Socket path
+    """
+    path = os.getenv("AI_BASH_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "ai-bash.sock")
+    return os.path.join("/tmp", f"ai-bash-{os.getuid()}", "ai-bash.sock")
+
+
+def check_private_directory(directory):
+    """
+    Make sure no other user can create or replace files in a directory.
+
+    Args:
+        directory (str): Directory holding the daemon socket
+
+    Raises:
+        PermissionError: If it is a symlink, not a directory, not owned by
+            the current user, or open to group or others
+    """
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"{directory} is not a directory")
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"{directory} is owned by uid {info.st_uid}, not {os.getuid()}")
+    if info.st_mode & 0o077:
+        raise PermissionError(f"{directory} is not private (mode {info.st_mode & 0o777:o}, "
+                              "expected 0700)")
+
+
+def _check_peer(sock, socket_path):
+    """Refuse a daemon run by another user (Linux SO_PEERCRED)."""
+    option = getattr(socket, "SO_PEERCRED", None)
+    if option is None:
+        return
+    _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, option,
+                                                    struct.calcsize("3i")))
+    if uid != os.getuid():
+        raise PermissionError(f"{socket_path} is served by uid {uid}, not {os.getuid()}")
+
+
+def send_request(message, socket_path=None, timeout=DEFAULT_REQUEST_TIMEOUT):
+    """
+    Send one JSON message to the daemon and return its reply.
+
+    Args:
+        message (dict): Request, e.g. {"op": "generate", "request": "..."}
+        socket_path (str, optional): Socket to connect to
+        timeout (float): Seconds to wait for the reply
+
+    Returns:
+        dict: The daemon's reply, or None if no daemon is listening
+
+    Raises:
+        PermissionError: If the socket, its directory or the daemon
+            belongs to another user; the command it sent could not be trusted
+    """
+    if socket_path is None:
+        socket_path = get_socket_path()
+
+    try:
+        check_private_directory(os.path.dirname(os.path.abspath(socket_path)))
+        info = os.lstat(socket_path)
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"{socket_path} is not a socket owned by uid {os.getuid()}")
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        _check_peer(sock, socket_path)
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        sock.close()
+
+    if not data:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+
+def generate(user_request, socket_path=None):
+    """
+    Generate a command through the daemon, or in-process if it is not running.
+
+    Args:
+        user_request (str): Natural language command request
+        socket_path (str, optional): Daemon socket
+
+    Returns:
+        str: Generated shell command (or ERROR message)
+    """
+    try:
+        reply = send_request({"op": "generate", "request": user_request}, socket_path)
+    except PermissionError as e:
+        print(f"⚠ Not using the daemon: {e}", file=sys.stderr)
+        reply = None
+    except (OSError, ValueError):
+        reply = None
+
+    if reply is not None and "command" in reply:
+        return reply["command"]
+
+    # No daemon: pay the full startup cost once
+    from system_detect import get_system_context
+    from llm_backend import create_generator
+
+    generator = create_generator(get_system_context())
+    return generator.generate_command(user_request)
+
+
+def run_once(user_request):
+    """
+    Translate, validate, confirm and execute a single request.
+
+    Args:
+        user_request (str): Natural language command request
+
+    Returns:
+        int: Process exit code
+    """
+    try:
+        command = generate(user_request)
+    except ValueError as e:
+        print(f"✗ Error: {e}")
+        return 1
+
+    # Never trust the daemon's verdict; validate locally
+    from system_detect import get_executable_index
+    installed = get_executable_index()
+    is_safe, message = validate_command(command, installed)
+    if not is_safe:
+        metrics.incr("blocked_commands")
+        print(f"✗ {message}")
+        return 1
+
+    from cost import review_command
+    command, estimate = review_command(command, installed, ask=offer_rewrite)
+    if not get_user_confirmation(command, estimate):
+        print("Execution cancelled")
+        return 0
+
+    pieces = [command] if os.getenv("AI_BASH_NO_PARALLEL") else split_independent(command)
+    if len(pieces) > 1:
+        results = run_parallel(pieces, stream=True)
+        display_parallel_results(results, streamed=True)
+        return 0 if all(item.result.success for item in results) else 1
+
+    result = run_command(command, stream=True)
+    display_result(result.success, result.output, result.error, streamed=True,
+                   usage=result.usage)
+    return 0 if result.success else 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        sys.exit(2)
+    sys.exit(run_once(" ".join(sys.argv[1:])))
@@ -0,0 +1,539 @@
+"""
+Cost analysis for AI Bash.
+Spots recursive scans (find, grep -r, du) that would walk the whole
+system, pseudo filesystems or network mounts, estimates how many inodes
+they visit from statvfs, and proposes cheaper equivalents before the
+command is confirmed.
+"""
+
+import os
+import re
+import shlex
+import time
+from collections import namedtuple
+
+import metrics
+from safety import parse_command, source_offsets, validate_command
+
+
+# AI_BASH_REWRITE: "suggest" offers the cheaper command, "auto" applies it, "off"
+DEFAULT_REWRITE_MODE = "suggest"
+
+# Scans estimated to visit more inodes than this run under ionice -c3 nice
+EXPENSIVE_INODES = 100000
+
+# A locate database older than this is not trusted to replace find
+LOCATE_MAX_AGE = 24 * 3600
+
+# (command, database) pairs, preferred first
+LOCATE_DATABASES = [
+    ("plocate", "/var/lib/plocate/plocate.db"),
+    ("locate", "/var/lib/mlocate/mlocate.db"),
+    ("locate", "/var/lib/locate/locatedb"),
+]
+
+MOUNTS_FILE = "/proc/self/mounts"
+
+# Kernel interfaces: nothing worth finding, and reading some of it is slow
+PSEUDO_FILESYSTEMS = frozenset([
+    "proc", "sysfs", "devtmpfs", "devpts", "cgroup", "cgroup2", "securityfs", "debugfs",
+    "tracefs", "pstore", "bpf", "configfs", "fusectl", "mqueue", "hugetlbfs",
+    "binfmt_misc", "autofs", "efivarfs", "rpc_pipefs", "nsfs",
+])
+
+# Every file visited is a round trip to another machine
+NETWORK_FILESYSTEMS = frozenset([
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p", "ceph", "glusterfs",
+    "lustre", "davfs", "fuse.sshfs", "fuse.glusterfs", "fuse.ceph", "fuse.rclone",
+    "fuse.s3fs", "fuse.gcsfuse",
+])
+
+# A raw shell word, quotes kept
+_RAW_WORD = re.compile(r"""(?:[^\s'"\\]+|'[^']*'|"(?:[^"\\]|\\.)*"|\\.)+""")
+
+# A redirection operator, possibly with its target attached ("2>/dev/null")
+_REDIRECTION = re.compile(r"(?:\d+|&)?(?:>>|>&|>\||<>|<<<|<<-?|<&|>|<)")
+
+# find options that come before the starting points; -D and -O take a value
+_FIND_LEADING = frozenset(["-H", "-L", "-P", "-D", "-O"])
+
+# find actions: without one, find adds an implicit -print
+_FIND_ACTIONS = frozenset([
+    "-print", "-print0", "-printf", "-fprint", "-fprint0", "-fprintf", "-ls", "-fls",
+    "-exec", "-execdir", "-ok", "-okdir", "-delete", "-quit", "-prune",
+])
+
+# find options that apply to the whole expression
+_FIND_GLOBALS = frozenset([
+    "-maxdepth", "-mindepth", "-xdev", "-mount", "-depth", "-follow", "-noleaf",
+    "-ignore_readdir_race", "-noignore_readdir_race",
+])
+
+# Already running at reduced priority
+_WRAPPED = re.compile(r"\b(?:ionice|nice)\b[^|;&()]*$")
+
+
+Mount = namedtuple("Mount", ["path", "fstype"])
+
+
+class CostReport(namedtuple("CostReport", ["command", "inodes", "filesystems", "network",
+                                           "reasons", "rewrite", "changes"])):
+    """
+    Estimated cost of the recursive scans in a command.
+
+    Attributes:
+        command (str): Command analyzed
+        inodes (int): Used inodes of the local filesystems scanned, an
+            upper bound on what the scans visit
+        filesystems (int): Local filesystems scanned
+        network (tuple): Network mount points the scans enter
+        reasons (tuple): Why the scans are expensive; empty if they are not
+        rewrite (str): Cheaper equivalent, or None
+        changes (tuple): What the rewrite changes
+    """
+    __slots__ = ()
+
+
+def read_mounts(path=MOUNTS_FILE):
+    """
+    Read the mount table.
+
+    Args:
+        path (str): mounts file (default: /proc/self/mounts)
+
+    Returns:
+        list: Mount tuples, one per mount point (the last mount wins)
+    """
+    mounts = {}
+    try:
+        with open(path, "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 3:
+            # Spaces and tabs in mount points are octal escapes
+            point = re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[1])
+            mounts[point] = Mount(point, fields[2])
+    return list(mounts.values())
+
+
+def _plain(word):
+    """Strip quotes and backslashes from a raw word (good enough for option names)."""
+    return re.sub(r"""['"\\]""", "", word)
+
+
+def _under(path, root):
+    """True if `path` is `root` or inside it."""
+    return path == root or path.startswith(root.rstrip("/") + "/")
+
+
+def _split_redirections(words):
+    """
+    Separate redirections from a command's raw words.
+
+    Returns:
+        tuple: (the other words, the redirection words in order)
+    """
+    kept = []
+    redirections = []
+    index = 0
+    while index < len(words):
+        match = _REDIRECTION.match(words[index])
+        if match is None:
+            kept.append(words[index])
+            index += 1
+            continue
+        # A bare operator takes the next word as its target
+        width = 2 if match.end() == len(words[index]) else 1
+        redirections += words[index:index + width]
+        index += width
+    return kept, redirections
+
+
+def _root_path(operand, cwd):
+    """
+    Turn a path operand into the absolute directory a scan starts from.
+
+    "/*" and "/var/log/*.log" scan from "/" and "/var/log".
+    """
+    path = os.path.expanduser(operand)
+    wildcard = re.search(r"[*?\[]", path)
+    if wildcard:
+        path = os.path.dirname(path[:wildcard.start()]) or "."
+    return os.path.normpath(os.path.join(cwd, path))
+
+
+def _find_scan(words):
+    """
+    Split a find command's raw words.
+
+    Returns:
+        tuple: (index of the first expression word, start path words)
+    """
+    index = 1
+    while index < len(words) and _plain(words[index]) in _FIND_LEADING:
+        index += 2 if _plain(words[index]) in ("-D", "-O") else 1
+    paths = []
+    while index < len(words):
+        word = _plain(words[index])
+        if word.startswith("-") or word in ("(", "!", ")", ","):
+            break
+        paths.append(words[index])
+        index += 1
+    return index, paths
+
+
+def _scan_roots(simple, words, cwd):
+    """
+    Get the starting directories of a recursive scan.
+
+    Args:
+        simple (SimpleCommand): Parsed command
+        words (list): Its raw words
+        cwd (str): Directory relative paths start from
+
+    Returns:
+        list: Absolute starting directories, or None if it is not a
+            recursive scan
+    """
+    if simple.name == "find":
+        _, paths = _find_scan(words)
+        return [_root_path(_plain(path), cwd) for path in paths] or [cwd]
+    if simple.name in ("grep", "egrep", "fgrep", "rgrep"):
+        recursive = simple.name == "rgrep" or simple.options & {
+            "-r", "-R", "--recursive", "--dereference-recursive"}
+        if not recursive:
+            return None
+        operands = list(simple.operands)
+        if not simple.options & {"-e", "-f", "--regexp", "--file"} and operands:
+            operands = operands[1:]  # the pattern
+        return [_root_path(path, cwd) for path in operands] or [cwd]
+    if simple.name == "du":
+        return [_root_path(path, cwd) for path in simple.operands] or [cwd]
+    return None
+
+
+def _used_inodes(path):
+    """Used inodes of the filesystem at `path`, or 0 if unknown."""
+    try:
+        stat = os.statvfs(path)
+    except OSError:
+        return 0
+    return max(0, stat.f_files - stat.f_ffree)
+
+
+def _locate_command(max_age=LOCATE_MAX_AGE):
+    """
+    Find a locate with an up-to-date database.
+
+    Returns:
+        str: "plocate" or "locate", or None
+    """
+    from system_detect import scan_path
+    for name, database in LOCATE_DATABASES:
+        try:
+            age = time.time() - os.stat(database).st_mtime
+        except OSError:
+            continue
+        if age <= max_age and scan_path([name]):
+            return name
+    return None
+
+
+def _as_locate(simple, words, roots):
+    """
+    Replace "find / -name PATTERN" with a locate lookup, if possible.
+
+    Returns:
+        str: Replacement words, or None
+    """
+    index, _ = _find_scan(words)
+    expression = words[index:]
+    if roots != ["/"] or len(expression) != 2 or _plain(expression[0]) not in ("-name", "-iname"):
+        return None
+    locate = _locate_command()
+    if locate is None:
+        return None
+    pattern = _plain(expression[1])
+    if "'" in pattern:
+        return None
+    if not re.search(r"[*?\[]", pattern):
+        # Without wildcards locate matches substrings; anchor the whole basename
+        pattern = "\\" + pattern
+    flags = "-b -i" if _plain(expression[0]) == "-iname" else "-b"
+    return f"{locate} {flags} '{pattern}'"
+
+
+def _prune_operands(paths, point, cwd):
+    """
+    Spell a mount point the way find will see it under each start path.
+
+    find matches -path against the start path as written, so /proc under
+    "find ." is "./proc".
+
+    Returns:
+        list: -path operands, or None if a start path is a relative
+            wildcard whose expansion cannot be known here
+    """
+    operands = []
+    for written in [_plain(path) for path in paths] or ["."]:
+        root = _root_path(written, cwd)
+        if point == root or not _under(point, root):
+            continue
+        if re.search(r"[*?\[]", written):
+            # "/*" expands to absolute start paths; "*" to bare names
+            if not os.path.isabs(os.path.expanduser(written)):
+                return None
+            operand = point
+        else:
+            operand = os.path.expanduser(written).rstrip("/") + point[len(root.rstrip("/")):]
+        if operand not in operands:
+            operands.append(operand)
+    return operands
+
+
+def _rewrite_scan(simple, words, roots, skipped, expensive, cwd):
+    """
+    Build a cheaper version of one scan.
+
+    Args:
+        simple (SimpleCommand): Parsed command
+        words (list): Its raw words
+        roots (list): Starting directories
+        skipped (list): Pseudo and network mount points under the roots
+        expensive (bool): Estimated over EXPENSIVE_INODES
+        cwd (str): Directory relative paths start from
+
+    Returns:
+        tuple: (replacement text or None, list of changes)
+    """
+    changes = []
+    if simple.name == "find":
+        located = _as_locate(simple, words, roots)
+        if located is not None:
+            return located, [f"looks the name up in the {located.split()[0]} database "
+                             "(files created since its last update are missed)"]
+        index, paths = _find_scan(words)
+        prune = []
+        for point in skipped:
+            operands = _prune_operands(paths, point, cwd)
+            if operands is None:
+                prune = []
+                break
+            for operand in operands:
+                prune += ["-path", shlex.quote(operand), "-prune", "-o"]
+        if prune:
+            expression = words[index:]
+            # Global options stay ahead of the prune clauses, where find expects them
+            options = []
+            position = 0
+            while position < len(expression) and _plain(expression[position]) in _FIND_GLOBALS:
+                width = 2 if _plain(expression[position]) in ("-maxdepth", "-mindepth") else 1
+                options += expression[position:position + width]
+                position += width
+            expression = expression[position:]
+            if not any(_plain(word) in _FIND_ACTIONS for word in expression):
+                # Pruned directories would otherwise be printed by the implicit -print
+                expression = (["\\(", *expression, "\\)"] if expression else []) + ["-print"]
+            words = words[:index] + options + prune + expression
+            changes.append("skips " + ", ".join(skipped))
+    elif simple.name == "du" and skipped and not simple.options & {"-x", "--one-file-system"}:
+        words = words[:1] + ["-x"] + words[1:]
+        changes.append("stays on one filesystem (-x)")
+    if expensive:
+        words = ["ionice", "-c3", "nice"] + words
+        changes.append("runs at idle I/O and low CPU priority")
+    return (" ".join(words) if changes else None), changes
+
+
+def analyze_command(command, cwd=None, mounts=None):
+    """
+    Estimate the cost of the recursive scans in a command and propose a
+    cheaper equivalent.
+
+    A scan is flagged when it starts at / (find: without -maxdepth), or
+    crosses into a pseudo filesystem (/proc, /sys) or a network mount
+    without -xdev. The cheaper equivalent prunes those mounts (du: -x),
+    runs large scans under "ionice -c3 nice", and answers
+    "find / -name X" from a locate database updated within LOCATE_MAX_AGE.
+
+    Args:
+        command (str): Validated shell command
+        cwd (str, optional): Directory the command runs in (default: os.getcwd())
+        mounts (list, optional): Mount tuples (default: read_mounts())
+
+    Returns:
+        CostReport: The estimate, or None if the command has no recursive scan
+    """
+    parsed = parse_command(command)
+    # Replacements are spliced into the command as given, so quoted
+    # arguments and untouched commands keep their exact whitespace
+    offsets = source_offsets(command)
+    can_rewrite = len(offsets) == len(parsed.text) + 1
+    if cwd is None:
+        cwd = os.getcwd()
+
+    scans = []
+    for simple in parsed.commands:
+        if simple.name not in ("find", "grep", "egrep", "fgrep", "rgrep", "du"):
+            continue
+        words = []
+        if can_rewrite:
+            words = _RAW_WORD.findall(command[offsets[simple.start]:offsets[simple.end]])
+        # Redirections may sit between find's start paths and its expression
+        words, redirections = _split_redirections(words)
+        rewritable = (simple.depth == 0 and bool(words)
+                      and _plain(words[0]).rsplit("/", 1)[-1] == simple.name)
+        if not rewritable:
+            words, redirections = list(simple.argv), []
+        roots = _scan_roots(simple, words, cwd)
+        if roots is not None:
+            scans.append((simple, words, redirections, roots, rewritable))
+    if not scans:
+        return None
+
+    if mounts is None:
+        mounts = read_mounts()
+    by_length = sorted(mounts, key=lambda mount: len(mount.path), reverse=True)
+
+    def mount_of(path):
+        for mount in by_length:
+            if _under(path, mount.path):
+                return mount
+        return Mount("/", "unknown")
+
+    scanned = {}
+    network = []
+    reasons = []
+    rewrites = []
+    for simple, words, redirections, roots, rewritable in scans:
+        name = simple.name
+        plain = [_plain(word) for word in words]
+        bounded = name == "find" and "-maxdepth" in plain
+        one_fs = bool(set(plain) & ({"-xdev", "-mount"} if name == "find"
+                                    else {"-x", "--one-file-system"}))
+        # "-path ./proc -prune" run from / prunes /proc
+        pruned = {os.path.normpath(os.path.join(cwd, os.path.expanduser(plain[i + 1])))
+                  for i in range(len(plain) - 2)
+                  if plain[i] == "-path" and plain[i + 2] == "-prune"}
+
+        covered = {}
+        for root in roots:
+            home = mount_of(root)
+            covered[home.path] = home
+            if not one_fs:
+                for mount in mounts:
+                    if _under(mount.path, root) and not any(_under(mount.path, p) for p in pruned):
+                        covered[mount.path] = mount
+
+        # Top-level pseudo and network mounts under the roots (/sys, not /sys/fs/cgroup)
+        skipped = []
+        for point in sorted(covered):
+            special = covered[point].fstype in PSEUDO_FILESYSTEMS | NETWORK_FILESYSTEMS
+            if special and point not in roots and not any(_under(point, s) for s in skipped):
+                skipped.append(point)
+        pseudo = [p for p in skipped if covered[p].fstype in PSEUDO_FILESYSTEMS]
+        remote = [p for p in skipped if covered[p].fstype in NETWORK_FILESYSTEMS]
+
+        local = 0
+        for point, mount in covered.items():
+            if mount.fstype in NETWORK_FILESYSTEMS:
+                if point not in network:
+                    network.append(point)
+            elif mount.fstype not in PSEUDO_FILESYSTEMS:
+                if point not in scanned:
+                    scanned[point] = _used_inodes(point)
+                local += scanned[point]
+
+        found = []
+        if "/" in roots and not bounded:
+            found.append(f"{name} scans from /" + (" with no -maxdepth" if name == "find" else ""))
+        if pseudo:
+            found.append(f"{name} crosses into {', '.join(pseudo)}")
+        if remote:
+            found.append(f"{name} enters network mounts {', '.join(remote)}")
+        if (pseudo or remote) and name in ("find", "du"):
+            found.append(f"{name} has no {'-xdev' if name == 'find' else '-x'}")
+        reasons.extend(found)
+
+        if found and rewritable and not _WRAPPED.search(command[:offsets[simple.start]]):
+            replacement, changes = _rewrite_scan(
+                simple, words, roots, skipped, local > EXPENSIVE_INODES, cwd)
+            if replacement is not None:
+                replacement = " ".join([replacement] + redirections)
+                rewrites.append((offsets[simple.start], offsets[simple.end], replacement, changes))
+
+    rewrite = None
+    changes = []
+    if rewrites:
+        rewrite = command
+        for start, end, replacement, scan_changes in sorted(rewrites, reverse=True):
+            rewrite = rewrite[:start] + replacement + rewrite[end:]
+            changes = scan_changes + changes
+
+    return CostReport(command, sum(scanned.values()), len(scanned), tuple(network),
+                      tuple(reasons), rewrite, tuple(changes))
+
+
+def _human(count):
+    """Format a count as 950, 12k or 3.4M."""
+    for limit, suffix in ((1e9, "G"), (1e6, "M"), (1e3, "k")):
+        if count >= limit:
+            value = count / limit
+            return f"{value:.1f}{suffix}" if value < 10 else f"{value:.0f}{suffix}"
+    return str(count)
+
+
+def format_estimate(report):
+    """
+    Describe a cost estimate in one line.
+
+    Args:
+        report (CostReport): Estimate to describe
+
+    Returns:
+        str: e.g. "up to 1.2M inodes on 3 filesystems, 1 network mount (/mnt/nfs)"
+    """
+    plural = "" if report.filesystems == 1 else "s"
+    text = f"up to {_human(report.inodes)} inodes on {report.filesystems} filesystem{plural}"
+    if report.network:
+        plural = "" if len(report.network) == 1 else "s"
+        text += f", {len(report.network)} network mount{plural} ({', '.join(report.network)})"
+    return text
+
+
+def review_command(command, installed=None, ask=None, mode=None, cwd=None):
+    """
+    Run the cost analysis before confirmation, offering or applying a
+    cheaper equivalent.
+
+    The cheaper command must pass validate_command like the original.
+
+    Args:
+        command (str): Validated shell command
+        installed (container, optional): Passed to validate_command
+        ask (callable, optional): Called with the CostReport; returns True to
+            use the rewrite. Without it the rewrite is only applied in "auto" mode.
+        mode (str, optional): "suggest", "auto" or "off"
+            (default: AI_BASH_REWRITE, else "suggest")
+        cwd (str, optional): Directory the command runs in
+
+    Returns:
+        tuple: (command, estimate) where estimate is the format_estimate()
+            line for the command returned, or None if it has no recursive scan
+    """
+    if mode is None:
+        mode = (os.getenv("AI_BASH_REWRITE") or DEFAULT_REWRITE_MODE).strip().lower()
+    if mode == "off":
+        return command, None
+    report = analyze_command(command, cwd)
+    if report is None:
+        return command, None
+    if report.rewrite is not None and validate_command(report.rewrite, installed)[0]:
+        if mode == "auto" or (ask is not None and ask(report)):
+            metrics.incr("cost_rewrites")
+            cheaper = analyze_command(report.rewrite, cwd)
+            return report.rewrite, format_estimate(cheaper or report)
+    return command, format_estimate(report)
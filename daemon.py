@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Resident AI Bash daemon.
+Keeps a warm command generator and the detected system context in
+memory and serves requests over a Unix domain socket.
+
+Protocol: one JSON object per line in each direction.
+    {"op": "generate", "request": "..."} -> {"command": "...", "safe": bool, "message": "..."}
+    {"op": "ping"}                       -> {"ok": true, "pid": ..., "context": {...}}
+    {"op": "shutdown"}                   -> {"ok": true}
+
+Usage:
+    python3 daemon.py
+    ai --daemon
+"""
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+from client import check_private_directory, get_socket_path
+from safety import validate_command
+from system_detect import get_executable_index, get_system_context
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Serve newline-delimited JSON requests on one connection."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = json.loads(line.decode("utf-8"))
+                reply = self.server.daemon.dispatch(message)
+            except Exception as e:
+                reply = {"error": str(e)}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class CommandDaemon:
+    """
+    Warm command generator shared by all clients.
+    """
+
+    def __init__(self, generator=None, system_context=None):
+        """
+        Initialize the daemon state.
+
+        Args:
+            generator (optional): Command generator. Created from the
+                environment if None.
+            system_context (dict, optional): Detected system context
+        """
+        if system_context is None:
+            system_context = get_system_context()
+        if generator is None:
+            from llm_backend import create_generator
+            generator = create_generator(system_context)
+
+        self.system_context = system_context
+        self.generator = generator
+        self.installed = get_executable_index(system_context.get("pkg_manager"))
+        self.server = None
+
+    def dispatch(self, message):
+        """
+        Handle one protocol message.
+
+        Args:
+            message (dict): Decoded request
+
+        Returns:
+            dict: Reply
+        """
+        op = message.get("op", "generate")
+
+        if op == "generate":
+            command = self.generator.generate_command(message["request"])
+            is_safe, verdict = validate_command(command, self.installed)
+            return {"command": command, "safe": is_safe, "message": verdict}
+
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid(), "context": self.system_context}
+
+        if op == "shutdown":
+            # shutdown() blocks until serve_forever returns, so not from this thread
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return {"ok": True}
+
+        return {"error": f"unknown op: {op}"}
+
+    def serve(self, socket_path=None):
+        """
+        Listen on the Unix socket until shut down.
+
+        The socket's directory is created 0700 if missing; the daemon
+        refuses to start if it exists and is not private to this user.
+
+        Args:
+            socket_path (str, optional): Socket path (default: get_socket_path())
+
+        Raises:
+            RuntimeError: If the directory is not private or a daemon is running
+        """
+        if socket_path is None:
+            socket_path = get_socket_path()
+
+        directory = os.path.dirname(os.path.abspath(socket_path))
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            raise RuntimeError(f"Cannot create {directory}: {e}")
+        try:
+            check_private_directory(directory)
+        except PermissionError as e:
+            raise RuntimeError(f"Refusing to serve on {socket_path}: {e}")
+
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+                raise RuntimeError(f"AI Bash daemon already running on {socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a daemon that died
+                os.unlink(socket_path)
+            finally:
+                probe.close()
+
+        old_umask = os.umask(0o077)
+        try:
+            self.server = _Server(socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self.server.daemon = self
+
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            try:
+                os.unlink(socket_path)
+            except FileNotFoundError:
+                pass
+
+
+def main():
+    """Start the daemon in the foreground."""
+    try:
+        daemon = CommandDaemon()
+    except ValueError as e:
+        print(f"✗ Error: {e}")
+        return 1
+
+    socket_path = get_socket_path()
+    print(f"AI Bash daemon listening on {socket_path}")
+    try:
+        daemon.serve(socket_path)
+    except RuntimeError as e:
+        print(f"✗ {e}")
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
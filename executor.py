@@ -3,17 +3,917 @@ Command execution module for AI Bash.
 Handles safe execution of validated shell commands.
 """
 
+import os
+import resource
+import secrets
+import selectors
+import shutil
+import signal
 import subprocess
 import shlex
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
+import metrics
 
-def execute_command(command, shell="bash"):
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_OUTPUT = 64 * 1024 * 1024  # stop a runaway command after 64 MiB
+DEFAULT_TAIL_SIZE = 64 * 1024          # bytes of each stream kept for the result
+READ_CHUNK = 64 * 1024
+DEFAULT_WORKERS = 4                    # commands run_parallel() runs at once
+CANCEL_POLL = 0.1                      # seconds between checks for cancellation
+RSS_SAMPLE_INTERVAL = 0.05             # seconds between peak RSS samples of a session's job
+
+# Exit status recorded for a cancelled command, as the shell reports Ctrl-C
+CANCELLED_STATUS = 128 + signal.SIGINT
+CANCELLED = "ERROR: Command cancelled"
+
+# Default scheduling for executed commands (see ResourceLimits.from_env)
+DEFAULT_NICE = 10
+DEFAULT_IONICE = "best-effort:7"
+
+# Seconds between SIGXCPU at the CPU limit and SIGKILL
+CPU_GRACE = 5
+
+IONICE_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+
+# Sets rlimits ("resource:soft:hard,...") and a niceness increment, then
+# execs the command; wraps commands where prlimit or nice is not installed
+_LIMITS_HELPER = (
+    "import os, resource, sys\n"
+    "for spec in filter(None, sys.argv[1].split(',')):\n"
+    "    which, soft, hard = map(int, spec.split(':'))\n"
+    "    resource.setrlimit(which, (soft, hard))\n"
+    "if int(sys.argv[2]):\n"
+    "    os.nice(int(sys.argv[2]))\n"
+    "os.execvp(sys.argv[3], sys.argv[3:])\n"
+)
+
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+def _parse_size(text):
+    """
+    Parse a byte count such as "512M" or "2g".
+
+    Args:
+        text (str): Number with an optional K, M, G or T suffix (powers of 1024)
+
+    Returns:
+        int: Bytes
+
+    Raises:
+        ValueError: Not a size
+    """
+    text = text.strip().lower().rstrip("b")
+    unit = text[-1:] if text[-1:] in _SIZE_UNITS else ""
+    return int(float(text[:len(text) - len(unit)]) * _SIZE_UNITS[unit])
+
+
+def _parse_ionice(text):
+    """
+    Parse an ionice setting: "idle", "best-effort:7", "2" or "2:7".
+
+    Returns:
+        tuple: (class, level or None), or None for "", "0" or "none"
+    """
+    text = text.strip().lower()
+    if text in ("", "0", "none"):
+        return None
+    name, _, level = text.partition(":")
+    io_class = int(name) if name.isdigit() else IONICE_CLASSES[name]
+    return io_class, int(level) if level else None
+
+
+class ResourceLimits(namedtuple("ResourceLimits", ["cpu", "memory", "open_files", "nice",
+                                                   "ionice", "cgroup", "cpu_quota"])):
+    """
+    Resource limits applied to every executed command.
+
+    Everything wraps the command line (wrap()): prlimit sets the rlimits,
+    nice the niceness, ionice the I/O class, systemd-run the cgroup scope.
+    Nothing runs between fork and exec, so commands can be started from
+    threads. Without prlimit or nice, a Python exec wrapper sets them
+    before the command starts. The rlimits hold for each process of the
+    command separately.
+
+    Attributes:
+        cpu (int): CPU seconds per process (RLIMIT_CPU), or None
+        memory (int): Address space bytes per process (RLIMIT_AS), and
+            MemoryMax of the cgroup scope, or None
+        open_files (int): Open file descriptors (RLIMIT_NOFILE), or None
+        nice (int): Niceness increment, or None
+        ionice (tuple): (class, level) as for ionice -c/-n, or None
+        cgroup (bool): Run in a transient systemd scope (cgroup v2)
+        cpu_quota (int): CPUQuota of the scope in percent of one CPU, or None
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Read limits from the environment.
+
+        AI_BASH_LIMIT_CPU (seconds), AI_BASH_LIMIT_MEMORY (e.g. "2G"),
+        AI_BASH_LIMIT_FILES, AI_BASH_NICE (default 10), AI_BASH_IONICE
+        (default "best-effort:7", "none" disables), AI_BASH_CGROUP (any
+        value) and AI_BASH_CPU_QUOTA (percent, with AI_BASH_CGROUP).
+
+        Returns:
+            ResourceLimits: Configured limits
+        """
+        def number(name, default=None, parse=int):
+            value = os.getenv(name)
+            return default if value is None or not value.strip() else parse(value)
+
+        nice = number("AI_BASH_NICE", DEFAULT_NICE)
+        return cls(
+            cpu=number("AI_BASH_LIMIT_CPU"),
+            memory=number("AI_BASH_LIMIT_MEMORY", parse=_parse_size),
+            open_files=number("AI_BASH_LIMIT_FILES"),
+            nice=nice or None,
+            ionice=_parse_ionice(os.getenv("AI_BASH_IONICE", DEFAULT_IONICE)),
+            cgroup=bool(os.getenv("AI_BASH_CGROUP")),
+            cpu_quota=number("AI_BASH_CPU_QUOTA"),
+        )
+
+    def rlimits(self):
+        """
+        List the rlimits to set, never above the current hard limits.
+
+        Returns:
+            list: (prlimit option, resource, soft, hard) tuples
+        """
+        wanted = []
+        if self.cpu is not None:
+            wanted.append(("cpu", resource.RLIMIT_CPU, self.cpu, self.cpu + CPU_GRACE))
+        if self.memory is not None:
+            wanted.append(("as", resource.RLIMIT_AS, self.memory, self.memory))
+        if self.open_files is not None:
+            wanted.append(("nofile", resource.RLIMIT_NOFILE, self.open_files, self.open_files))
+        return [(option, which) + _clamp_rlimit(which, soft, hard)
+                for option, which, soft, hard in wanted]
+
+    def wrap(self, argv):
+        """
+        Prefix a command line with the rlimit, priority and cgroup scope wrappers.
+
+        Wrappers that are not installed (or a cgroup v1 system) are skipped;
+        the Python interpreter stands in for prlimit and nice.
+
+        Args:
+            argv (list): Command line to run
+
+        Returns:
+            list: Command line to execute
+        """
+        rlimits = self.rlimits()
+        nice = self.nice or 0
+        if rlimits and shutil.which("prlimit"):
+            options = [f"--{option}={soft}:{hard}" for option, _, soft, hard in rlimits]
+            argv = ["prlimit"] + options + ["--"] + argv
+            rlimits = []
+        if nice and shutil.which("nice"):
+            argv = ["nice", "-n", str(nice)] + argv
+            nice = 0
+        if rlimits or nice:
+            specs = ",".join(f"{which}:{soft}:{hard}" for _, which, soft, hard in rlimits)
+            argv = [sys.executable, "-c", _LIMITS_HELPER, specs, str(nice)] + argv
+        if self.ionice is not None and shutil.which("ionice"):
+            io_class, level = self.ionice
+            prefix = ["ionice", "-t", "-c", str(io_class)]
+            if level is not None and io_class != IONICE_CLASSES["idle"]:
+                prefix += ["-n", str(level)]
+            argv = prefix + argv
+        if self.cgroup and cgroup_scope_available():
+            scope = ["systemd-run", "--scope", "--quiet", "--collect"]
+            if os.geteuid() != 0:
+                scope.append("--user")
+            if self.memory is not None:
+                scope += ["-p", f"MemoryMax={self.memory}"]
+            if self.cpu_quota is not None:
+                scope += ["-p", f"CPUQuota={self.cpu_quota}%"]
+            argv = scope + ["--"] + argv
+        return argv
+
+
+# Apply nothing: the command runs with the caller's limits and priority
+NO_LIMITS = ResourceLimits(None, None, None, None, None, False, None)
+
+
+def _clamp_rlimit(which, soft, hard):
+    """Lower an rlimit pair to the current hard limit."""
+    _, current = resource.getrlimit(which)
+    if current != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current), min(hard, current)
+    return soft, hard
+
+
+def cgroup_scope_available():
+    """
+    Check whether commands can run in a transient cgroup v2 scope.
+
+    Returns:
+        bool: True with systemd as init, the unified hierarchy and systemd-run
+    """
+    return (os.path.isdir("/run/systemd/system")
+            and os.path.exists("/sys/fs/cgroup/cgroup.controllers")
+            and shutil.which("systemd-run") is not None)
+
+
+class ResourceUsage(namedtuple("ResourceUsage", ["cpu_time", "max_rss"])):
+    """
+    Resources a command used.
+
+    Attributes:
+        cpu_time (float): User plus system CPU seconds of all its processes
+        max_rss (int): Peak resident set size of its largest process in
+            bytes, or None if unknown. In a ShellSession it is sampled while
+            the command runs, so processes that exit between samples are
+            missed.
+    """
+    __slots__ = ()
+
+
+def format_usage(usage):
+    """
+    Format resource usage for display.
+
+    Args:
+        usage (ResourceUsage): Usage to show
+
+    Returns:
+        str: e.g. "cpu 0.42s, max RSS 12.3 MiB"
+    """
+    text = f"cpu {usage.cpu_time:.2f}s"
+    if usage.max_rss is not None:
+        text += f", max RSS {usage.max_rss / (1024 * 1024):.1f} MiB"
+    return text
+
+
+ExecutionResult = namedtuple("ExecutionResult", ["success", "output", "error", "returncode", "usage"])
+
+
+class CommandResult(namedtuple("CommandResult", ["command", "label", "result", "duration"])):
+    """
+    Outcome of one command run by run_parallel().
+
+    Attributes:
+        command (str): Command run
+        label (str): Label its streamed lines were prefixed with
+        result (ExecutionResult): Its result
+        duration (float): Wall-clock seconds it ran
+    """
+    __slots__ = ()
+
+
+class TailBuffer:
+    """
+    Keep only the last `limit` bytes written to it.
+    """
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self.total = 0
+        self._data = bytearray()
+    
+    def write(self, chunk):
+        self.total += len(chunk)
+        self._data += chunk
+        excess = len(self._data) - self.limit
+        if excess > 0:
+            del self._data[:excess]
+    
+    @property
+    def truncated(self):
+        return self.total > len(self._data)
+    
+    def getvalue(self):
+        text = self._data.decode("utf-8", errors="replace")
+        if self.truncated:
+            dropped = self.total - len(self._data)
+            text = f"[... {dropped} earlier bytes not kept ...]\n" + text
+        return text
+
+
+def _relay(stream, chunk):
+    """Write raw bytes to a terminal stream as soon as they arrive."""
+    buffer = getattr(stream, "buffer", None)
+    if buffer is not None:
+        buffer.write(chunk)
+        buffer.flush()
+    else:
+        stream.write(chunk.decode("utf-8", errors="replace"))
+        stream.flush()
+
+
+class _LabeledStream:
+    """
+    Prefix every line written to it with a label.
+    
+    Only whole lines are written, under a lock shared by all commands, so
+    concurrent output interleaves by line and never within one.
+    """
+    
+    def __init__(self, label, stream, lock):
+        self.prefix = f"[{label}] "
+        self.stream = stream
+        self.lock = lock
+        self._partial = ""
+    
+    def write(self, text):
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        if len(self._partial) > READ_CHUNK:
+            lines.append(self._partial)
+            self._partial = ""
+        if lines:
+            self._emit(lines)
+    
+    def flush(self):
+        # Called after every write; a partial line waits for its newline
+        pass
+    
+    def finish(self):
+        """Write a final line that had no newline."""
+        if self._partial:
+            self._emit([self._partial])
+            self._partial = ""
+    
+    def _emit(self, lines):
+        with self.lock:
+            self.stream.write("".join(f"{self.prefix}{line}\n" for line in lines))
+            self.stream.flush()
+
+
+def stream_command(command, shell="bash", timeout=DEFAULT_TIMEOUT,
+                   max_output=None, tail_size=None, stdout=None, stderr=None, limits=None):
+    """
+    Execute a command, relaying its output to the terminal as it is produced.
+    
+    Only the last `tail_size` bytes of each stream are kept in memory for the
+    returned result. The command is killed once it has written more than
+    `max_output` bytes in total.
+    
+    Args:
+        command (str): The validated shell command to execute
+        shell (str): The shell to use (default: bash)
+        timeout (float): Wall-clock limit in seconds
+        max_output (int, optional): Output cap in bytes (AI_BASH_MAX_OUTPUT, default 64 MiB)
+        tail_size (int, optional): Bytes kept per stream (AI_BASH_TAIL_SIZE, default 64 KiB)
+        stdout: Stream to relay standard output to (default: sys.stdout)
+        stderr: Stream to relay standard error to (default: sys.stderr)
+        limits (ResourceLimits, optional): Limits (default: ResourceLimits.from_env())
+        
+    Returns:
+        tuple: (success, output, error) as for execute_command, with output and
+            error holding the retained tails
+    """
+    if tail_size is None:
+        tail_size = int(os.getenv("AI_BASH_TAIL_SIZE", DEFAULT_TAIL_SIZE))
+    if stdout is None:
+        stdout = sys.stdout
+    if stderr is None:
+        stderr = sys.stderr
+    result = _run_process(command, shell, timeout, max_output, tail_size, stdout, stderr, limits)
+    return result.success, result.output, result.error
+
+
+def _run_process(command, shell, timeout, max_output, tail_size, stdout, stderr, limits,
+                 cwd=None, cancel=None):
+    """
+    Run a command in a fresh shell under resource limits.
+    
+    The shell leads its own process group, which is killed as a whole on
+    timeout, when the output cap is hit or when `cancel` is set.
+    
+    Args:
+        command (str): The validated shell command to execute
+        shell (str): The shell to use
+        timeout (float): Wall-clock limit in seconds
+        max_output (int): Output cap in bytes, or None for AI_BASH_MAX_OUTPUT
+        tail_size (int): Bytes kept per stream
+        stdout: Stream to relay standard output to, or None
+        stderr: Stream to relay standard error to, or None
+        limits (ResourceLimits): Limits, or None for ResourceLimits.from_env()
+        cwd (str, optional): Directory to run in (default: the current one)
+        cancel (threading.Event, optional): Stop the command once set
+        
+    Returns:
+        ExecutionResult: With the usage of the shell and everything it ran
+    """
+    if max_output is None:
+        max_output = int(os.getenv("AI_BASH_MAX_OUTPUT", DEFAULT_MAX_OUTPUT))
+    if limits is None:
+        limits = ResourceLimits.from_env()
+    
+    try:
+        process = subprocess.Popen(
+            limits.wrap([shell, "-c", command]),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+            cwd=cwd,
+        )
+    except Exception as e:
+        return ExecutionResult(False, "", f"ERROR: Execution failed - {str(e)}", None, None)
+    
+    tails = {
+        process.stdout: (TailBuffer(tail_size), stdout),
+        process.stderr: (TailBuffer(tail_size), stderr),
+    }
+    saw_output = False
+    failure = None
+    deadline = time.monotonic() + timeout
+    
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ)
+        selector.register(process.stderr, selectors.EVENT_READ)
+        
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                failure = f"ERROR: Command timed out after {timeout:g} seconds"
+                break
+            
+            if cancel is not None:
+                if cancel.is_set():
+                    failure = CANCELLED
+                    break
+                remaining = min(remaining, CANCEL_POLL)
+            
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, READ_CHUNK)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                tail, terminal = tails[key.fileobj]
+                tail.write(chunk)
+                if terminal is not None:
+                    _relay(terminal, chunk)
+                if key.fileobj is process.stdout and chunk.strip():
+                    saw_output = True
+            
+            total = sum(tail.total for tail, _ in tails.values())
+            if total > max_output:
+                failure = f"ERROR: Output exceeded {max_output} bytes, command stopped"
+                break
+    
+    if failure is None:
+        # The pipes closed, but the shell may keep running without them
+        failure = _wait_exit(process, deadline, timeout, cancel)
+    if failure is not None:
+        # Background jobs and pipeline members too, not just the shell
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    usage = _reap(process)
+    process.stdout.close()
+    process.stderr.close()
+    if failure is None:
+        failure = _limit_failure(process.returncode, limits)
+    
+    output = tails[process.stdout][0].getvalue()
+    error = tails[process.stderr][0].getvalue()
+    
+    if failure is not None:
+        error = f"{error}\n{failure}" if error else failure
+        return ExecutionResult(False, output, error, process.returncode, usage)
+    
+    # Intelligent success determination:
+    # - If we got output, treat as success even with non-zero exit code
+    # - This handles tools like find, grep, rsync that exit non-zero on permission errors
+    # - Only fail if no output AND non-zero exit code
+    success = process.returncode == 0 or saw_output
+    return ExecutionResult(success, output, error, process.returncode, usage)
+
+
+def _limit_failure(returncode, limits):
+    """
+    Explain an exit caused by the CPU limit.
+    
+    Args:
+        returncode (int): Exit status (negative for a signal, 128 + signal
+            when reported by the shell)
+        limits (ResourceLimits): Limits the command ran under
+        
+    Returns:
+        str: ERROR message, or None if the CPU limit was not hit
+    """
+    if limits.cpu is not None and returncode in (-signal.SIGXCPU, 128 + signal.SIGXCPU):
+        return f"ERROR: Command exceeded its CPU limit of {limits.cpu} seconds"
+    return None
+
+
+def _wait_exit(process, deadline, timeout, cancel=None):
+    """
+    Wait for a process to exit, without reaping it, until the deadline.
+    
+    Args:
+        process (subprocess.Popen): Process to wait for
+        deadline (float): time.monotonic() value to give up at
+        timeout (float): The timeout the deadline came from, for the message
+        cancel (threading.Event, optional): Stop waiting once set
+        
+    Returns:
+        str: ERROR message, or None if the process exited in time
+    """
+    delay = 0.001
+    while True:
+        try:
+            if os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT):
+                return None
+        except ChildProcessError:
+            return None
+        if cancel is not None and cancel.is_set():
+            return CANCELLED
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return f"ERROR: Command timed out after {timeout:g} seconds"
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, CANCEL_POLL)
+
+
+def _reap(process):
+    """
+    Wait for a process and collect its resource usage.
+    
+    Only called once the process has exited or its group was killed.
+    
+    Args:
+        process (subprocess.Popen): Process to wait for
+        
+    Returns:
+        ResourceUsage: Usage of the process and the children it waited for,
+            or None if it was already reaped
+    """
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        process.wait()
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in KiB on Linux
+    return ResourceUsage(rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss * 1024)
+
+
+def _descendant_pids(pid):
+    """
+    List all descendants of a process by scanning /proc.
+    
+    Args:
+        pid (int): Parent process id
+        
+    Returns:
+        list: Descendant pids, children before grandchildren
+    """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces; fields resume after the last ')'
+        fields = stat[stat.rfind(b")") + 2:].split()
+        if len(fields) > 1:
+            children.setdefault(int(fields[1]), []).append(int(entry))
+    
+    found = []
+    queue = [pid]
+    while queue:
+        for child in children.get(queue.pop(0), []):
+            found.append(child)
+            queue.append(child)
+    return found
+
+
+def _cpu_time(pid):
+    """
+    Get the CPU seconds of a process and its reaped children from /proc.
+    
+    Args:
+        pid (int): Process id
+        
+    Returns:
+        float: utime + stime + cutime + cstime in seconds, or None if unreadable
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    fields = stat[stat.rfind(b")") + 2:].split()
+    return sum(int(field) for field in fields[11:15]) / os.sysconf("SC_CLK_TCK")
+
+
+def _peak_rss(pids, peak=None):
+    """
+    Get the largest peak resident set size (VmHWM) among processes from /proc.
+    
+    Args:
+        pids (iterable): Process ids
+        peak (int, optional): Largest value seen so far
+        
+    Returns:
+        int: Bytes, or `peak` if no process had a larger readable value
+    """
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status", "rb") as f:
+                for line in f:
+                    if line.startswith(b"VmHWM:"):
+                        # Reported in kB
+                        rss = int(line.split()[1]) * 1024
+                        if peak is None or rss > peak:
+                            peak = rss
+                        break
+        except (OSError, ValueError, IndexError):
+            continue
+    return peak
+
+
+SessionResult = namedtuple("SessionResult", ["success", "output", "error", "returncode", "cwd",
+                                             "usage"])
+
+
+class _FrameReader:
+    """
+    Relay one output stream of a ShellSession until its end-of-command marker.
+    """
+    
+    def __init__(self, marker, tail, terminal, need_trailer):
+        self.marker = marker
+        self.tail = tail
+        self.terminal = terminal
+        self.need_trailer = need_trailer
+        self.saw_output = False
+        self.done = False
+        self.trailer = b""
+        self._pending = b""
+        self._found = False
+    
+    def feed(self, chunk):
+        if self._found:
+            self.trailer += chunk
+        else:
+            data = self._pending + chunk
+            index = data.find(self.marker)
+            if index >= 0:
+                self._emit(data[:index])
+                self._pending = b""
+                self._found = True
+                self.trailer = data[index + len(self.marker):]
+            else:
+                # Hold back anything that could be the start of a split marker
+                keep = len(self.marker) - 1
+                self._emit(data[:-keep] if len(data) > keep else b"")
+                self._pending = data[-keep:] if len(data) > keep else data
+        if self._found and (not self.need_trailer or b"\n" in self.trailer):
+            self.done = True
+    
+    def flush(self):
+        """Emit held-back bytes when the stream ends without a marker."""
+        self._emit(self._pending)
+        self._pending = b""
+    
+    def _emit(self, data):
+        if not data:
+            return
+        self.tail.write(data)
+        if data.strip():
+            self.saw_output = True
+        if self.terminal is not None:
+            _relay(self.terminal, data)
+
+
+class ShellSession:
+    """
+    Long-lived shell that keeps state (cwd, exported variables, activated
+    virtualenvs) between commands.
+    
+    Commands are written to the shell's stdin. After each command the shell
+    prints a random marker followed by the exit code and working directory,
+    which frames the command's output on stdout and stderr.
+    
+    Resource limits are applied to the shell when it starts and are
+    inherited by every command it runs.
+    """
+    
+    def __init__(self, shell="bash", cwd=None, limits=None):
+        """
+        Initialize a session. The shell is started on first use.
+        
+        Args:
+            shell (str): The shell to use (default: bash)
+            cwd (str, optional): Initial working directory
+            limits (ResourceLimits, optional): Limits (default: ResourceLimits.from_env())
+        """
+        self.shell = shell
+        self.cwd = cwd or os.getcwd()
+        self.limits = limits if limits is not None else ResourceLimits.from_env()
+        self.returncode = None
+        self.usage = None
+        self.process = None
+        self._marker = None
+    
+    def start(self):
+        """Start (or restart) the shell process."""
+        self.close()
+        self._marker = f"__AIBASH_{secrets.token_hex(8)}__".encode()
+        self.process = subprocess.Popen(
+            self.limits.wrap([self.shell]),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            bufsize=0,
+            # Own session: terminal Ctrl-C reaches us, and we interrupt only the job
+            start_new_session=True,
+        )
+    
+    def close(self):
+        """Terminate the shell process."""
+        if self.process is None:
+            return
+        for pid in _descendant_pids(self.process.pid):
+            self._signal(pid, signal.SIGKILL)
+        self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+            stream.close()
+        self.process = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def run(self, command, timeout=DEFAULT_TIMEOUT, max_output=None,
+            tail_size=None, relay=True):
+        """
+        Run a command in the session.
+        
+        On timeout, output cap or Ctrl-C only the command's processes are
+        killed; the shell and its state survive. If the shell itself exits
+        or cannot be recovered, it is restarted in the last known cwd.
+        
+        Args:
+            command (str): The validated shell command to execute
+            timeout (float): Wall-clock limit in seconds
+            max_output (int, optional): Output cap in bytes (AI_BASH_MAX_OUTPUT)
+            tail_size (int, optional): Bytes kept per stream (AI_BASH_TAIL_SIZE)
+            relay (bool): Relay output to the terminal as it arrives
+            
+        Returns:
+            SessionResult: (success, output, error, returncode, cwd, usage);
+                the peak RSS in usage is sampled every RSS_SAMPLE_INTERVAL
+                and is None if no process of the command was seen
+        """
+        if max_output is None:
+            max_output = int(os.getenv("AI_BASH_MAX_OUTPUT", DEFAULT_MAX_OUTPUT))
+        if tail_size is None:
+            tail_size = int(os.getenv("AI_BASH_TAIL_SIZE", DEFAULT_TAIL_SIZE))
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        
+        marker = self._marker.decode()
+        script = (
+            f"eval {shlex.quote(command)} < /dev/null\n"
+            f"__aibash_rc=$?\n"
+            f"printf '%s %d %s\\n' '{marker}' \"$__aibash_rc\" \"$PWD\"\n"
+            f"printf '%s' '{marker}' >&2\n"
+        )
+        
+        out = _FrameReader(self._marker, TailBuffer(tail_size),
+                           sys.stdout if relay else None, need_trailer=True)
+        err = _FrameReader(self._marker, TailBuffer(tail_size),
+                           sys.stderr if relay else None, need_trailer=False)
+        readers = {self.process.stdout: out, self.process.stderr: err}
+        failure = None
+        
+        cpu_before = _cpu_time(self.process.pid)
+        try:
+            self.process.stdin.write(script.encode())
+        except OSError:
+            self.start()
+            return SessionResult(False, "", "ERROR: Shell session was restarted", None,
+                                 self.cwd, None)
+        
+        deadline = time.monotonic() + timeout
+        # The shell reaps the job itself, so its peak RSS is sampled from /proc
+        max_rss = None
+        next_sample = 0
+        with selectors.DefaultSelector() as selector:
+            for stream in readers:
+                selector.register(stream, selectors.EVENT_READ)
+            
+            while not (out.done and err.done) and selector.get_map():
+                now = time.monotonic()
+                if now >= next_sample:
+                    max_rss = _peak_rss(_descendant_pids(self.process.pid), max_rss)
+                    next_sample = now + RSS_SAMPLE_INTERVAL
+                remaining = deadline - now
+                if remaining <= 0:
+                    if failure is not None:
+                        # The shell itself is stuck (e.g. a builtin loop)
+                        break
+                    failure = f"ERROR: Command timed out after {timeout:g} seconds"
+                    self._kill_job()
+                    deadline = time.monotonic() + 2
+                    continue
+                
+                try:
+                    events = selector.select(min(remaining, RSS_SAMPLE_INTERVAL))
+                except KeyboardInterrupt:
+                    failure = "ERROR: Command interrupted"
+                    self._kill_job()
+                    deadline = time.monotonic() + 2
+                    continue
+                
+                for key, _ in events:
+                    chunk = os.read(key.fd, READ_CHUNK)
+                    reader = readers[key.fileobj]
+                    if not chunk:
+                        reader.flush()
+                        selector.unregister(key.fileobj)
+                        continue
+                    reader.feed(chunk)
+                
+                if failure is None and out.tail.total + err.tail.total > max_output:
+                    failure = f"ERROR: Output exceeded {max_output} bytes, command stopped"
+                    self._kill_job()
+                    deadline = time.monotonic() + 2
+        
+        output = out.tail.getvalue()
+        error = err.tail.getvalue()
+        
+        if not (out.done and err.done):
+            # The shell exited or never came back; start a fresh one in the same cwd
+            self.start()
+            self.returncode = self.usage = None
+            reason = failure or "ERROR: Shell session ended"
+            error = f"{error}\n{reason}" if error else reason
+            return SessionResult(False, output, error, None, self.cwd, None)
+        
+        trailer = out.trailer.split(b"\n", 1)[0].decode("utf-8", errors="replace")
+        fields = trailer.lstrip(" ").split(" ", 1)
+        self.returncode = int(fields[0])
+        if len(fields) > 1 and fields[1]:
+            self.cwd = fields[1]
+        # The shell has reaped the command's processes by the time it prints the marker
+        cpu_after = _cpu_time(self.process.pid)
+        self.usage = None
+        if cpu_before is not None and cpu_after is not None:
+            self.usage = ResourceUsage(cpu_after - cpu_before, max_rss)
+        if failure is None:
+            failure = _limit_failure(self.returncode, self.limits)
+        
+        if failure is not None:
+            error = f"{error}\n{failure}" if error else failure
+            return SessionResult(False, output, error, self.returncode, self.cwd, self.usage)
+        
+        # Same success rule as a fresh shell (see _run_process)
+        success = self.returncode == 0 or out.saw_output
+        return SessionResult(success, output, error, self.returncode, self.cwd, self.usage)
+    
+    def _kill_job(self):
+        """Kill the running command's processes but not the shell."""
+        for pid in _descendant_pids(self.process.pid):
+            self._signal(pid, signal.SIGKILL)
+    
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def execute_command(command, shell="bash", stream=False, timeout=DEFAULT_TIMEOUT, session=None,
+                    limits=None):
     """
     Execute a shell command after user confirmation.
     
     Args:
         command (str): The validated shell command to execute
         shell (str): The shell to use (default: bash)
+        stream (bool): Relay output to the terminal as it arrives and keep only
+            a bounded tail (see stream_command)
+        timeout (float): Wall-clock limit in seconds (default: 30)
+        session (ShellSession, optional): Run in this persistent shell instead
+            of a fresh one, keeping cd and exported variables
+        limits (ResourceLimits, optional): Limits for a fresh shell (default:
+            ResourceLimits.from_env()); a session has its own
         
     Returns:
         tuple: (success, output, error) where:
@@ -21,48 +921,147 @@ def execute_command(command, shell="bash"):
             - output (str): Standard output from command
             - error (str): Standard error from command
     """
-    try:
-        # Execute command using bash
-        # Don't use check=True - many tools succeed with non-zero exit codes
-        result = subprocess.run(
-            [shell, "-c", command],
-            capture_output=True,
-            text=True,
-            timeout=30  # 30 second timeout
-        )
-        
-        # Intelligent success determination:
-        # - If we got output, treat as success even with non-zero exit code
-        # - This handles tools like find, grep, rsync that exit non-zero on permission errors
-        # - Only fail if no output AND non-zero exit code
-        has_output = bool(result.stdout.strip())
-        exit_ok = result.returncode == 0
-        
-        success = exit_ok or has_output
-        output = result.stdout
-        error = result.stderr
+    result = run_command(command, shell, stream, timeout, session, limits)
+    return result.success, result.output, result.error
+
+
+def run_command(command, shell="bash", stream=False, timeout=DEFAULT_TIMEOUT, session=None,
+                limits=None):
+    """
+    Execute a shell command, like execute_command, and report what it used.
+    
+    Args:
+        command (str): The validated shell command to execute
+        shell (str): The shell to use (default: bash)
+        stream (bool): Relay output to the terminal as it arrives
+        timeout (float): Wall-clock limit in seconds (default: 30)
+        session (ShellSession, optional): Run in this persistent shell
+        limits (ResourceLimits, optional): Limits for a fresh shell
         
-        return success, output, error
+    Returns:
+        ExecutionResult: (success, output, error, returncode, usage); usage
+            is a ResourceUsage, or None if it could not be measured
+    """
+    with metrics.span("execute", session=session is not None) as span:
+        result = _execute(command, shell, stream, timeout, session, limits)
+        _account(span, result)
+    return result
+
+
+def _account(span, result):
+    """Record a command's CPU time and timeout in its execute span and the counters."""
+    if result.usage is not None:
+        span.set(cpu_time=round(result.usage.cpu_time, 3))
+        metrics.incr("execute_cpu_seconds", result.usage.cpu_time)
+    if not result.success and result.error.startswith("ERROR: Command timed out"):
+        metrics.incr("timeouts", stage="execute")
+
+
+def _execute(command, shell, stream, timeout, session, limits):
+    """Run a command for run_command()."""
+    if session is not None:
+        result = session.run(command, timeout=timeout, relay=stream)
+        return ExecutionResult(result.success, result.output, result.error,
+                               result.returncode, result.usage)
+    
+    if stream:
+        tail_size = int(os.getenv("AI_BASH_TAIL_SIZE", DEFAULT_TAIL_SIZE))
+        return _run_process(command, shell, timeout, None, tail_size,
+                            sys.stdout, sys.stderr, limits)
+    
+    # Buffered: keep everything up to the output cap
+    max_output = int(os.getenv("AI_BASH_MAX_OUTPUT", DEFAULT_MAX_OUTPUT))
+    return _run_process(command, shell, timeout, max_output, max_output, None, None, limits)
+
+
+def run_parallel(commands, shell="bash", stream=False, timeout=DEFAULT_TIMEOUT, workers=None,
+                 cwd=None, limits=None, labels=None, stdout=None, stderr=None):
+    """
+    Run independent commands concurrently, each in a fresh shell.
+    
+    At most `workers` commands run at once; the rest wait their turn, and
+    each command's timeout counts from its own start. Interrupting the
+    caller (Ctrl-C) stops the running commands and skips those waiting.
+    Commands do not share a ShellSession: pass its cwd to start there.
+    
+    Args:
+        commands (list): Validated shell commands (see safety.split_independent)
+        shell (str): The shell to use (default: bash)
+        stream (bool): Relay output as it arrives, every line prefixed with
+            the command's label, e.g. "[2] "
+        timeout (float or list): Wall-clock limit in seconds for every
+            command, or one per command
+        workers (int, optional): Commands run at once (AI_BASH_WORKERS, default 4)
+        cwd (str, optional): Directory to run in (default: the current one)
+        limits (ResourceLimits, optional): Limits for every command
+            (default: ResourceLimits.from_env())
+        labels (list, optional): One label per command (default: "1", "2", ...)
+        stdout: Stream to relay standard output to (default: sys.stdout)
+        stderr: Stream to relay standard error to (default: sys.stderr)
         
-    except subprocess.TimeoutExpired:
-        return False, "", "ERROR: Command timed out after 30 seconds"
+    Returns:
+        list: CommandResult tuples in the order of `commands`
+    """
+    commands = list(commands)
+    if not commands:
+        return []
+    if workers is None:
+        workers = int(os.getenv("AI_BASH_WORKERS", DEFAULT_WORKERS))
+    timeouts = list(timeout) if isinstance(timeout, (list, tuple)) else [timeout] * len(commands)
+    if labels is None:
+        labels = [str(index) for index in range(1, len(commands) + 1)]
+    if limits is None:
+        limits = ResourceLimits.from_env()
     
-    except Exception as e:
-        return False, "", f"ERROR: Execution failed - {str(e)}"
+    max_output = int(os.getenv("AI_BASH_MAX_OUTPUT", DEFAULT_MAX_OUTPUT))
+    tail_size = int(os.getenv("AI_BASH_TAIL_SIZE", DEFAULT_TAIL_SIZE)) if stream else max_output
+    lock = threading.Lock()
+    cancel = threading.Event()
+    
+    def run(index):
+        command, label = commands[index], labels[index]
+        if cancel.is_set():
+            result = ExecutionResult(False, "", CANCELLED, None, None)
+            return CommandResult(command, label, result, 0.0)
+        relays = (None, None)
+        if stream:
+            relays = (_LabeledStream(label, stdout or sys.stdout, lock),
+                      _LabeledStream(label, stderr or sys.stderr, lock))
+        started = time.monotonic()
+        with metrics.span("execute", parallel=True) as span:
+            result = _run_process(command, shell, timeouts[index], max_output, tail_size,
+                                  *relays, limits, cwd=cwd, cancel=cancel)
+            _account(span, result)
+        for relay in relays:
+            if relay is not None:
+                relay.finish()
+        return CommandResult(command, label, result, time.monotonic() - started)
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(commands))),
+                            thread_name_prefix="fan-out") as pool:
+        futures = [pool.submit(run, index) for index in range(len(commands))]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            cancel.set()
+            raise
 
 
-def get_user_confirmation(command):
+def get_user_confirmation(command, estimate=None):
     """
     Display command and get user confirmation before execution.
     
     Args:
         command (str): The command to display
+        estimate (str, optional): Estimated cost of its scans (see cost.py)
         
     Returns:
         bool: True if user confirms, False otherwise
     """
     print(f"\n→ Suggested command:")
     print(f"  {command}")
+    if estimate:
+        print(f"  Estimated cost: {estimate}")
     print()
     
     while True:
@@ -76,7 +1075,33 @@ def get_user_confirmation(command):
             print("Please enter 'y' or 'n'")
 
 
-def display_result(success, output, error):
+def offer_rewrite(report):
+    """
+    Show why a command is expensive and ask whether to use its cheaper form.
+    
+    Args:
+        report (CostReport): Cost analysis with a rewrite
+        
+    Returns:
+        bool: True to use the rewrite
+    """
+    print(f"\n⚠ Expensive scan: {'; '.join(report.reasons)}")
+    print(f"  Cheaper: {report.rewrite}")
+    for change in report.changes:
+        print(f"    - {change}")
+    
+    while True:
+        response = input("Use the cheaper command? [Y/n]: ").strip().lower()
+        
+        if response in ['y', 'yes', '']:
+            return True
+        elif response in ['n', 'no']:
+            return False
+        else:
+            print("Please enter 'y' or 'n'")
+
+
+def display_result(success, output, error, streamed=False, usage=None):
     """
     Display the execution result to the user.
     
@@ -84,16 +1109,79 @@ def display_result(success, output, error):
         success (bool): Whether command succeeded
         output (str): Standard output
         error (str): Standard error
+        streamed (bool): Output was already relayed to the terminal, so only
+            the status is shown
+        usage (ResourceUsage, optional): Resources used, shown last
     """
     if success:
-        if output:
+        if output and not streamed:
             print(output)
-        else:
+        elif not output:
             print("Command executed successfully (no output)")
     else:
         print(f"✗ Command failed")
+        if streamed:
+            # stderr was already relayed; only report why we stopped the command
+            last_line = error.rsplit("\n", 1)[-1]
+            error = last_line if last_line.startswith("ERROR:") else ""
         if error:
             print(f"Error: {error}")
+    if usage is not None:
+        print(f"({format_usage(usage)})")
+
+
+def parallel_exit_status(results):
+    """
+    Sum up the results of run_parallel() as one exit status.
+    
+    Args:
+        results (list): CommandResult tuples
+        
+    Returns:
+        int: The first failing command's status: CANCELLED_STATUS if it was
+            cancelled (running or still waiting), 127 if it could not be
+            started; 0 if every command exited 0
+    """
+    for item in results:
+        result = item.result
+        if result.error.endswith(CANCELLED):
+            return CANCELLED_STATUS
+        if result.returncode is None:
+            return 127
+        if result.returncode != 0:
+            return result.returncode
+    return 0
+
+
+def display_parallel_results(results, streamed=False):
+    """
+    Display the results of run_parallel(), one status line per command.
+    
+    Args:
+        results (list): CommandResult tuples
+        streamed (bool): Output was already relayed to the terminal
+    """
+    for item in results:
+        result = item.result
+        if result.output and not streamed:
+            print(f"[{item.label}] {item.command}")
+            print(result.output.rstrip("\n"))
+    print()
+    for item in results:
+        result = item.result
+        status = "✓" if result.success else "✗"
+        details = [f"exit {result.returncode}"] if result.returncode is not None else []
+        details.append(f"{item.duration:.1f}s")
+        if result.usage is not None:
+            details.append(format_usage(result.usage))
+        print(f"{status} [{item.label}] {item.command} ({', '.join(details)})")
+        if not result.success:
+            error = result.error
+            if streamed:
+                last_line = error.rsplit("\n", 1)[-1]
+                error = last_line if last_line.startswith("ERROR:") else ""
+            if error:
+                print(f"    Error: {error}")
 
 
 if __name__ == "__main__":
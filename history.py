@@ -0,0 +1,419 @@
+"""
+Command history for AI Bash.
+Records every request with its command, safety verdict, exit status and
+duration in SQLite, with an FTS5 index so past commands can be recalled
+in milliseconds instead of being generated again.
+"""
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+
+DEFAULT_FLUSH_INTERVAL = 0.5  # seconds a record may wait before it is written
+DEFAULT_BATCH_SIZE = 256      # records written per transaction at most
+READLINE_ENTRIES = 1000       # past requests loaded into readline
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_COLUMNS = "id, ts, request, command, safe, verdict, exit_status, duration"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    request TEXT NOT NULL,
+    command TEXT NOT NULL,
+    safe INTEGER NOT NULL,
+    verdict TEXT,
+    exit_status INTEGER,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS entries_request ON entries (request);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    request, command, content='entries', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, request, command)
+    VALUES (new.id, new.request, new.command);
+END;
+"""
+
+
+class HistoryEntry(namedtuple("HistoryEntry", _COLUMNS.split(", "))):
+    """
+    One recorded request.
+
+    Attributes:
+        id (int): Entry number, increasing
+        ts (float): Unix time the request was made
+        request (str): Natural language request
+        command (str): Generated (or recalled) command
+        safe (bool): Whether the command passed validation
+        verdict (str): Validation message
+        exit_status (int): Exit status, or None if not executed or unknown
+        duration (float): Execution time in seconds, or None if not executed
+    """
+    __slots__ = ()
+
+
+def get_history_path():
+    """
+    Get the history database path.
+
+    Honours AI_BASH_HISTORY, then XDG_DATA_HOME, then ~/.local/share.
+
+    Returns:
+        str: Database file path (not necessarily created yet)
+    """
+    path = os.getenv("AI_BASH_HISTORY")
+    if path:
+        return path
+    base = os.getenv("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "ai-bash", "history.db")
+
+
+def _fts_query(text):
+    """
+    Turn free text into an FTS5 query: every word, as a prefix, must occur.
+
+    Args:
+        text (str): Search text
+
+    Returns:
+        str: FTS5 query, or "" if the text has no words
+    """
+    return " ".join(f'"{word}"*' for word in _WORD.findall(text))
+
+
+class HistoryStore:
+    """
+    Persistent, searchable history of requests and commands.
+
+    record() only queues the entry; a background thread writes queued
+    entries in batches, one transaction each, so the prompt loop never
+    waits on disk. Reads use their own connection and, with the database
+    in WAL mode, are not blocked by a write in progress.
+    """
+
+    def __init__(self, path=None, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Open (or create) the history database.
+
+        Args:
+            path (str, optional): Database file (default: get_history_path());
+                ":memory:" is not supported since reads and writes use
+                separate connections
+            flush_interval (float): Seconds a queued record may wait
+            batch_size (int): Records written per transaction at most
+        """
+        self.path = path or get_history_path()
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader.executescript(_SCHEMA)
+        try:
+            self._reader.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: fall back to LIKE scans
+            self.fts = False
+
+        self._queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False,
+                                     isolation_level=None, timeout=5)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def record(self, request, command, safe, verdict=None, exit_status=None, duration=None):
+        """
+        Queue an entry for writing. Returns at once.
+
+        Args:
+            request (str): Natural language request
+            command (str): Command that was generated or recalled
+            safe (bool): Whether it passed validation
+            verdict (str, optional): Validation message
+            exit_status (int, optional): Exit status if executed
+            duration (float, optional): Execution time in seconds if executed
+        """
+        self._queue.put((time.time(), request, command, int(bool(safe)),
+                         verdict, exit_status, duration))
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop,
+                                                    name="history", daemon=True)
+                    self._writer.start()
+
+    def _write_loop(self):
+        connection = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    self._queue.task_done()
+                    return
+                batch = [item]
+                deadline = time.monotonic() + self.flush_interval
+                stop = False
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                try:
+                    with connection:
+                        connection.execute("BEGIN")
+                        connection.executemany(
+                            "INSERT INTO entries (ts, request, command, safe, verdict, "
+                            "exit_status, duration) VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                except sqlite3.Error:
+                    # A locked or read-only database should never break the REPL
+                    pass
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Block until every queued record has been written."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        """Write queued records and close the database."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        with self._read_lock:
+            self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            rows = self._reader.execute(sql, params).fetchall()
+        return [HistoryEntry(*row[:4], bool(row[4]), *row[5:]) for row in rows]
+
+    @staticmethod
+    def _unique(entries, limit):
+        """Keep the newest entry per command, up to `limit`."""
+        seen = set()
+        unique = []
+        for entry in entries:
+            if entry.command not in seen:
+                seen.add(entry.command)
+                unique.append(entry)
+                if len(unique) == limit:
+                    break
+        return unique
+
+    def get(self, entry_id):
+        """
+        Get an entry by number.
+
+        Args:
+            entry_id (int): Entry number
+
+        Returns:
+            HistoryEntry: The entry, or None
+        """
+        rows = self._query(f"SELECT {_COLUMNS} FROM entries WHERE id = ?", (entry_id,))
+        return rows[0] if rows else None
+
+    def recent(self, limit=10, unique=True):
+        """
+        Get the newest entries.
+
+        Args:
+            limit (int): Maximum entries
+            unique (bool): Skip older entries with the same command
+
+        Returns:
+            list: HistoryEntry tuples, newest first
+        """
+        fetch = limit * 4 if unique else limit
+        rows = self._query(f"SELECT {_COLUMNS} FROM entries ORDER BY id DESC LIMIT ?", (fetch,))
+        return self._unique(rows, limit) if unique else rows
+
+    def recent_requests(self, limit=READLINE_ENTRIES):
+        """
+        Get the newest distinct requests.
+
+        Args:
+            limit (int): Maximum requests
+
+        Returns:
+            list: Request strings, newest first
+        """
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT request FROM entries ORDER BY id DESC LIMIT ?", (limit * 4,)).fetchall()
+        requests = []
+        seen = set()
+        for (request,) in rows:
+            if request not in seen:
+                seen.add(request)
+                requests.append(request)
+                if len(requests) == limit:
+                    break
+        return requests
+
+    def search(self, text, limit=10):
+        """
+        Full-text search over requests and commands.
+
+        Every word of `text` must occur, as a word prefix, in the request
+        or the command: "big fi" finds "find big files".
+
+        Args:
+            text (str): Search text
+            limit (int): Maximum entries
+
+        Returns:
+            list: HistoryEntry tuples, newest first, one per command
+        """
+        if self.fts:
+            query = _fts_query(text)
+            if not query:
+                return self.recent(limit)
+            rows = self._query(
+                f"SELECT {_COLUMNS} FROM entries WHERE id IN ("
+                "SELECT rowid FROM entries_fts WHERE entries_fts MATCH ? "
+                "ORDER BY rowid DESC LIMIT ?) ORDER BY id DESC",
+                (query, limit * 4))
+        else:
+            words = _WORD.findall(text)
+            if not words:
+                return self.recent(limit)
+            condition = " AND ".join(["(request LIKE ? OR command LIKE ?)"] * len(words))
+            params = [f"%{word}%" for word in words for _ in range(2)]
+            rows = self._query(
+                f"SELECT {_COLUMNS} FROM entries WHERE {condition} ORDER BY id DESC LIMIT ?",
+                (*params, limit * 4))
+        return self._unique(rows, limit)
+
+    def prefix(self, text, limit=10):
+        """
+        Find entries whose request starts with `text`.
+
+        Args:
+            text (str): Request prefix
+            limit (int): Maximum entries
+
+        Returns:
+            list: HistoryEntry tuples, newest first, one per command
+        """
+        if not text:
+            return self.recent(limit)
+        # Range scan on the request index; U+10FFFF sorts after any continuation
+        rows = self._query(
+            f"SELECT {_COLUMNS} FROM entries WHERE request >= ? AND request < ? "
+            "ORDER BY id DESC LIMIT ?",
+            (text, text + "\U0010ffff", limit * 4))
+        return self._unique(rows, limit)
+
+    def recall(self, spec):
+        """
+        Resolve a history reference typed at the prompt (without the "!").
+
+        "!" is the last entry, a number is an entry number, anything else
+        is a search whose newest match wins.
+
+        Args:
+            spec (str): Reference
+
+        Returns:
+            HistoryEntry: The entry, or None
+        """
+        spec = spec.strip()
+        if spec in ("", "!"):
+            rows = self.recent(1, unique=False)
+        elif spec.isdigit():
+            return self.get(int(spec))
+        else:
+            rows = self.prefix(spec, 1) or self.search(spec, 1)
+        return rows[0] if rows else None
+
+
+def setup_readline(store, limit=READLINE_ENTRIES):
+    """
+    Load past requests into readline and bind prefix search to the arrows.
+
+    Up and Down then recall requests starting with what is typed, and
+    Ctrl-R searches them incrementally. Does nothing if readline is not
+    available.
+
+    Args:
+        store (HistoryStore): History to load from
+        limit (int): Requests loaded at most
+
+    Returns:
+        bool: True if readline was set up
+    """
+    try:
+        import readline
+    except ImportError:
+        return False
+
+    requests = store.recent_requests(limit)
+    readline.clear_history()
+    for request in reversed(requests):
+        readline.add_history(request)
+    for binding in ('"\\e[A": history-search-backward',
+                    '"\\e[B": history-search-forward',
+                    '"\\eOA": history-search-backward',
+                    '"\\eOB": history-search-forward'):
+        readline.parse_and_bind(binding)
+    return True
+
+
+def format_entry(entry):
+    """
+    Format an entry as one listing line.
+
+    Args:
+        entry (HistoryEntry): Entry to show
+
+    Returns:
+        str: "  <id>  <command>  # <request> [status]"
+    """
+    if not entry.safe:
+        status = " [blocked]"
+    elif entry.exit_status is None:
+        status = ""
+    elif entry.duration is None:
+        status = f" [exit {entry.exit_status}]"
+    else:
+        status = f" [exit {entry.exit_status}, {entry.duration:.1f}s]"
+    return f"  {entry.id:>6}  {entry.command}  # {entry.request}{status}"
@@ -0,0 +1,327 @@
+"""
+Local intent engine for AI Bash.
+Answers common requests (list files, disk usage, install a package, find
+big files, tail a log, check a port, ...) from parameterized templates
+without calling the LLM.
+"""
+
+import json
+import os
+import re
+
+
+# Slot patterns. They only admit characters that are safe to paste into a
+# shell command unquoted.
+SLOT_PATTERNS = {
+    "package": r"(?P<package>[a-z0-9][a-z0-9.+_-]*)",
+    "path": r"(?P<path>(?:home(?: directory| folder)?|current (?:directory|folder)|here|[~/.][\w./~-]*))",
+    "file": r"(?P<file>/[\w./-]+)",
+    "size": r"(?P<size>\d+\s*(?:[kmg]b?|bytes?)?)",
+    "port": r"(?P<port>\d{1,5})",
+    "lines": r"(?P<lines>\d{1,6})",
+}
+
+# Words the package slot admits that do not name a package ("install
+# updates", "install it"); such requests go to the LLM
+_NOT_PACKAGES = frozenset([
+    "all", "any", "anything", "dependencies", "deps", "everything", "it", "latest", "me",
+    "missing", "new", "packages", "prerequisites", "requirements", "software", "something",
+    "stuff", "that", "them", "these", "this", "those", "updates", "update", "upgrades",
+    "upgrade",
+])
+
+# Words a request may be wrapped in that do not change its meaning
+_FILLER = re.compile(r"^(?:please |can you |could you |ai |i want to |i need to )+")
+
+# Templates: name, keywords (any one must appear), patterns, commands, defaults.
+# "commands" is keyed by pkg_manager, distro, init_system or an installed tool;
+# the first key that applies to the system wins, "*" always applies.
+DEFAULT_TEMPLATES = [
+    {
+        "name": "list-files",
+        "keywords": ["list", "show"],
+        "patterns": [r"(?:list|show)(?: all)?(?: the)? files(?: in {path})?"],
+        "commands": {"*": "ls -la {path}"},
+        "defaults": {"path": "."},
+    },
+    {
+        "name": "disk-usage",
+        "keywords": ["disk"],
+        "patterns": [
+            r"(?:show |check |display )?(?:the )?disk (?:usage|space)(?: usage)?",
+            r"how much disk (?:space|usage)(?: is (?:left|used|free))?",
+        ],
+        "commands": {"*": "df -h"},
+    },
+    {
+        "name": "memory-usage",
+        "keywords": ["memory", "ram"],
+        "patterns": [r"(?:show |check |display )?(?:the )?(?:memory|ram)(?: usage)?"],
+        "commands": {"*": "free -h"},
+    },
+    {
+        "name": "install-package",
+        "keywords": ["install"],
+        "patterns": [r"install(?: the)?(?: package)? {package}(?: package)?"],
+        "commands": {
+            "apt": "apt install -y {package}",
+            "dnf": "dnf install -y {package}",
+            "yum": "yum install -y {package}",
+            "pacman": "pacman -S --noconfirm {package}",
+            "apk": "apk add {package}",
+            "zypper": "zypper install -y {package}",
+        },
+    },
+    {
+        "name": "find-large-files",
+        "keywords": ["find", "show", "list"],
+        "patterns": [
+            r"(?:find|show|list)(?: all)?(?: the)? (?:big |large |huge )?files "
+            r"(?:larger|bigger|greater) than {size}(?: in {path})?",
+            r"(?:find|show|list)(?: all)?(?: the)? files over {size}(?: in {path})?",
+        ],
+        "commands": {"*": "find {path} -type f -size +{size} 2>/dev/null || true"},
+        "defaults": {"path": "."},
+    },
+    {
+        "name": "tail-log",
+        "keywords": ["tail", "last"],
+        "patterns": [
+            r"tail {file}",
+            r"(?:show |print )?(?:the )?last {lines} lines (?:of|in) {file}",
+        ],
+        "commands": {"*": "tail -n {lines} {file}"},
+        "defaults": {"lines": "50"},
+    },
+    {
+        "name": "check-port",
+        "keywords": ["port"],
+        "patterns": [
+            r"(?:check|show) port {port}",
+            r"(?:what|who|which process) is (?:using|listening on) port {port}",
+            r"is (?:anything|something) (?:using|listening on) port {port}",
+        ],
+        "commands": {
+            "ss": "ss -tulpn | grep -w ':{port}' || true",
+            "netstat": "netstat -tulpn | grep -w ':{port}' || true",
+            "lsof": "lsof -i :{port} || true",
+        },
+    },
+    {
+        "name": "change-directory",
+        "keywords": ["move", "go", "cd", "change"],
+        "patterns": [
+            r"(?:move|go|cd|change directory) (?:in)?to(?: the)? {path}(?: directory| folder)?",
+            r"cd {path}",
+        ],
+        "commands": {"*": "cd {path}"},
+    },
+]
+
+
+def normalize(user_request):
+    """
+    Normalize a request for template matching.
+
+    Args:
+        user_request (str): Natural language request
+
+    Returns:
+        str: Lowercased request without filler words or trailing punctuation
+    """
+    text = " ".join(user_request.lower().split())
+    text = _FILLER.sub("", text)
+    return text.rstrip(" .!?")
+
+
+def _convert_slot(name, value):
+    """
+    Turn an extracted slot into its command form.
+
+    Args:
+        name (str): Slot name
+        value (str): Matched text
+
+    Returns:
+        str: Value to substitute into the command
+    """
+    if name == "package" and value in _NOT_PACKAGES:
+        raise ValueError(f"not a package name: {value}")
+    if name == "path":
+        if value.startswith("home"):
+            # The user's own home directory, not every user's
+            return "~"
+        if value.startswith("current") or value == "here":
+            return "."
+        return value.rstrip("/") or "/"
+    if name == "size":
+        # 500MB -> 500M, 2 gb -> 2G, 100k -> 100k (find's units)
+        match = re.match(r"(\d+)\s*([kmg]?)", value)
+        number, unit = match.group(1), match.group(2)
+        return number + {"k": "k", "m": "M", "g": "G"}.get(unit, "c")
+    if name == "port" and not 0 < int(value) < 65536:
+        raise ValueError(f"invalid port: {value}")
+    return value
+
+
+class IntentTemplate:
+    """
+    One parameterized intent with its per-system commands.
+    """
+
+    def __init__(self, name, patterns, commands, keywords=None, defaults=None):
+        """
+        Compile a template.
+
+        Args:
+            name (str): Template name
+            patterns (list): Regexes over the normalized request; {slot}
+                placeholders expand to the SLOT_PATTERNS entries
+            commands (dict): Command templates keyed by pkg_manager, distro,
+                init_system, installed tool or "*"
+            keywords (list, optional): Words of which at least one must occur
+                in the request; used to index the template
+            defaults (dict, optional): Values for slots a pattern leaves empty
+        """
+        self.name = name
+        self.commands = commands
+        self.keywords = keywords or []
+        self.defaults = defaults or {}
+        self.patterns = [
+            re.compile(pattern.format(**SLOT_PATTERNS) if "{" in pattern else pattern)
+            for pattern in patterns
+        ]
+
+    def command_for(self, context_keys):
+        """
+        Pick the command template that applies to a system.
+
+        Args:
+            context_keys (set): pkg_manager, distro, init_system and tools of the system
+
+        Returns:
+            str: Command template, or None if the intent has none for this system
+        """
+        for key, command in self.commands.items():
+            if key == "*" or key in context_keys:
+                return command
+        return None
+
+
+class IntentEngine:
+    """
+    Match requests against templates for one system context.
+
+    Templates are resolved to a single command for the system when they are
+    added, and indexed by keyword, so a lookup only tries the templates
+    whose keywords occur in the request.
+    """
+
+    def __init__(self, system_context, templates=None, template_file=None):
+        """
+        Build the engine.
+
+        Args:
+            system_context (dict): System detection context
+            templates (list, optional): Template dicts (default: DEFAULT_TEMPLATES)
+            template_file (str, optional): JSON file with extra templates, tried
+                before the built-in ones. Defaults to AI_BASH_INTENTS.
+        """
+        self.context_keys = {
+            system_context.get("pkg_manager"),
+            system_context.get("distro"),
+            system_context.get("init_system"),
+        }
+        self.context_keys.update(system_context.get("distro_like", []))
+        self.context_keys.update(system_context.get("tools", []))
+        self.context_keys.discard(None)
+
+        # keyword -> [(order, template, command)]
+        self._index = {}
+        self._unindexed = []
+        self._count = 0
+
+        if template_file is None:
+            template_file = os.getenv("AI_BASH_INTENTS")
+        if template_file:
+            for spec in load_templates(template_file):
+                self.add_template(**spec)
+        for spec in templates if templates is not None else DEFAULT_TEMPLATES:
+            self.add_template(**spec)
+
+    def add_template(self, name, patterns, commands, keywords=None, defaults=None):
+        """
+        Add a template. Templates added earlier take precedence.
+
+        Arguments are as for IntentTemplate.
+        """
+        template = IntentTemplate(name, patterns, commands, keywords, defaults)
+        command = template.command_for(self.context_keys)
+        if command is None:
+            # Not applicable on this system (e.g. no matching package manager)
+            return
+        entry = (self._count, template, command)
+        self._count += 1
+        if template.keywords:
+            for keyword in template.keywords:
+                self._index.setdefault(keyword, []).append(entry)
+        else:
+            self._unindexed.append(entry)
+
+    def match(self, user_request):
+        """
+        Translate a request locally.
+
+        Args:
+            user_request (str): Natural language request
+
+        Returns:
+            tuple: (template name, command), or None on a miss
+        """
+        text = normalize(user_request)
+        candidates = {}
+        for word in text.split():
+            for entry in self._index.get(word, ()):
+                candidates[entry[0]] = entry
+        for entry in self._unindexed:
+            candidates[entry[0]] = entry
+
+        for order in sorted(candidates):
+            _, template, command = candidates[order]
+            for pattern in template.patterns:
+                found = pattern.fullmatch(text)
+                if found is None:
+                    continue
+                slots = dict(template.defaults)
+                try:
+                    for slot, value in found.groupdict().items():
+                        if value is not None:
+                            slots[slot] = _convert_slot(slot, value)
+                        elif slot in slots:
+                            slots[slot] = _convert_slot(slot, slots[slot])
+                    return template.name, command.format(**slots)
+                except (KeyError, ValueError):
+                    continue
+        return None
+
+
+def load_templates(path):
+    """
+    Load user templates from a JSON file.
+
+    The file holds a list of objects with the IntentTemplate arguments:
+    name, patterns, commands and optionally keywords and defaults.
+
+    Args:
+        path (str): JSON file
+
+    Returns:
+        list: Template dicts ([] if the file does not exist)
+    """
+    try:
+        with open(path, "r") as f:
+            specs = json.load(f)
+    except FileNotFoundError:
+        return []
+    allowed = {"name", "patterns", "commands", "keywords", "defaults"}
+    return [{k: v for k, v in spec.items() if k in allowed} for spec in specs]
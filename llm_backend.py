@@ -0,0 +1,815 @@
+"""
+LLM backend protocol for AI Bash.
+CommandGenerator holds everything that does not depend on the LLM
+provider: local answers (intents, cache, similar requests), retries,
+hedging, streaming with early abort and the asyncio API. A backend
+subclass only implements the three completion calls.
+
+Backends:
+    gemini  llm_gemini.GeminiCommandGenerator (Google Gemini API, default)
+    openai  llm_openai.OpenAICompatibleGenerator (any OpenAI-compatible HTTP server)
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import importlib
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import metrics
+from intents import IntentEngine
+from similarity import SimilarityIndex
+from cache import GenerationCache, get_cache_dir, make_key, normalize_request
+from prompts import SYSTEM_PROMPT, get_system_prompt, get_user_prompt
+from safety import (find_dangerous_matches, find_missing_commands, normalize_command,
+                    sanitize_output, validate_command)
+from system_detect import get_executable_index
+
+# Cached generations go stale whenever the prompt text changes
+PROMPT_HASH = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+# AI_BASH_BACKEND name -> (module, class)
+BACKENDS = {
+    "gemini": ("llm_gemini", "GeminiCommandGenerator"),
+    "openai": ("llm_openai", "OpenAICompatibleGenerator"),
+}
+DEFAULT_BACKEND = "gemini"
+
+# Concurrent requests in generate_many()
+DEFAULT_CONCURRENCY = 8
+
+# Request timeout, retries and hedging (see CommandGenerator._generate_hedged)
+DEFAULT_LLM_TIMEOUT = 30.0
+DEFAULT_LLM_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+DEFAULT_HEDGE_DELAY = 2.0       # used until enough latencies are recorded
+DEFAULT_HEDGE_PERCENTILE = 95
+MIN_HEDGE_DELAY = 0.25
+MIN_LATENCY_SAMPLES = 10
+
+# The only refusal SYSTEM_PROMPT allows
+REFUSAL = "ERROR: Unsafe or ambiguous request"
+
+# Put before the request when the model named executables that are not installed
+MISSING_FEEDBACK = (
+    "Your previous answer was: {command}\n"
+    "It uses {names}, which is not installed on this system. "
+    "Answer again using only tools that are installed."
+)
+
+# Errors worth retrying: rate limits, overload and server-side timeouts
+TRANSIENT_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+    "ConnectionError", "TimeoutError",
+}
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def is_transient_error(error):
+    """
+    Check whether an API error is worth retrying.
+
+    Args:
+        error (Exception): Raised by the API client
+
+    Returns:
+        bool: True for rate limiting, overload and timeouts
+    """
+    if type(error).__name__ in TRANSIENT_ERRORS:
+        return True
+    return getattr(error, "code", None) in TRANSIENT_STATUS_CODES
+
+
+def _first_command_line(text):
+    """
+    Extract the first command line from partial model output.
+
+    Leading markdown fences and blank lines are skipped.
+
+    Args:
+        text (str): Output received so far
+
+    Returns:
+        tuple: (line, complete) where complete is True once the line is
+            terminated by a newline
+    """
+    lines = text.lstrip().split("\n")
+    while len(lines) > 1 and (not lines[0].strip() or lines[0].strip().startswith("```")):
+        lines.pop(0)
+    if lines[0].strip().startswith("```"):
+        # Opening fence still arriving
+        return "", False
+    line = lines[0].replace("`", "").strip()
+    return line, len(lines) > 1 and bool(line)
+
+
+class LatencyTracker:
+    """
+    Recent response latencies per model, used to pick the hedge deadline.
+    """
+
+    def __init__(self, window=100):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name, seconds):
+        with self._lock:
+            samples = self._samples.setdefault(model_name, deque(maxlen=self.window))
+            samples.append(seconds)
+
+    def percentile(self, model_name, percent):
+        """
+        Get a latency percentile for a model.
+
+        Returns:
+            float: Seconds, or None with fewer than MIN_LATENCY_SAMPLES samples
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(model_name, ()))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percent / 100.0))
+        return samples[index]
+
+    def stats(self):
+        """
+        Get per-model latency summaries.
+
+        Returns:
+            dict: model -> {"count", "p50", "p95"} in seconds
+        """
+        with self._lock:
+            snapshot = {name: sorted(samples) for name, samples in self._samples.items()}
+        return {
+            name: {
+                "count": len(samples),
+                "p50": samples[len(samples) // 2],
+                "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            }
+            for name, samples in snapshot.items() if samples
+        }
+
+
+class CommandGenerator:
+    """
+    Provider-independent command generation pipeline.
+
+    Subclasses set model_name (and optionally hedge_models) and implement
+    _complete(), _complete_stream() and, if the client has a native async
+    API, _complete_async().
+    """
+
+    # AI_BASH_BACKEND name of the subclass
+    backend = None
+
+    def __init__(self, system_context, cache=None):
+        """
+        Initialize the shared pipeline state.
+
+        Args:
+            system_context (dict): System detection context
+            cache (GenerationCache, optional): Generation cache. If None, the default
+                on-disk cache is used unless AI_BASH_NO_CACHE is set.
+        """
+        self.system_context = system_context
+
+        # Store system prompt to prepend to user messages
+        self.system_prompt = get_system_prompt(system_context)
+
+        # Set by the backend: primary model and models slow requests are hedged to
+        self.model_name = None
+        self.hedge_models = []
+
+        self.timeout = float(os.getenv("AI_BASH_LLM_TIMEOUT", DEFAULT_LLM_TIMEOUT))
+        self.retries = int(os.getenv("AI_BASH_LLM_RETRIES", DEFAULT_LLM_RETRIES))
+        self.hedge_percentile = float(
+            os.getenv("AI_BASH_HEDGE_PERCENTILE", DEFAULT_HEDGE_PERCENTILE)
+        )
+        self.latency = LatencyTracker()
+        self._pool = ThreadPoolExecutor(
+            max_workers=DEFAULT_CONCURRENCY, thread_name_prefix=self.backend or "llm"
+        )
+
+        if cache is None and not os.getenv("AI_BASH_NO_CACHE"):
+            cache = GenerationCache()
+        self.cache = cache
+
+        # Common intents are answered locally without an API call
+        self.intents = None if os.getenv("AI_BASH_NO_INTENTS") else IntentEngine(system_context)
+        self.intent_hits = 0
+
+        # Paraphrases of earlier requests reuse their command; one index per
+        # system context and prompt version, since commands depend on both
+        self.similar = None
+        if not os.getenv("AI_BASH_NO_SIMILAR"):
+            index_name = f"similar-{make_key(system_context, PROMPT_HASH)[:16]}.jsonl"
+            self.similar = SimilarityIndex(os.path.join(get_cache_dir(), index_name))
+
+        # Commands naming executables that are not on PATH are regenerated once
+        self.installed = get_executable_index(system_context.get("pkg_manager"))
+
+        # Where the last command came from: intent, cache, similar or llm
+        self.last_source = None
+        self.last_similar = None
+
+    @classmethod
+    def preload(cls):
+        """Import the backend's client library ahead of construction (warm-up)."""
+
+    def _complete(self, model_name, prompt, timeout):
+        """
+        Send one prompt and wait for the whole response.
+
+        Args:
+            model_name (str): Model to call
+            prompt (str): Full prompt
+            timeout (float): Seconds to wait
+
+        Returns:
+            str: Raw response text
+        """
+        raise NotImplementedError
+
+    def _complete_stream(self, model_name, prompt, timeout):
+        """
+        Send one prompt and yield the response text as it arrives.
+
+        The caller may stop iterating early; the iterator's close() must
+        then release the underlying request.
+
+        Args:
+            model_name (str): Model to call
+            prompt (str): Full prompt
+            timeout (float): Seconds to wait
+
+        Yields:
+            str: Response text chunks
+        """
+        raise NotImplementedError
+
+    async def _complete_async(self, model_name, prompt, timeout, executor=None):
+        """
+        Awaitable _complete(). Runs it on a thread pool unless a backend has
+        a native async client.
+
+        The timeout counts from when the call starts, not from when it was
+        queued for a pool thread.
+
+        Args:
+            model_name (str): Model to call
+            prompt (str): Full prompt
+            timeout (float): Seconds the call may run
+            executor (ThreadPoolExecutor, optional): Pool to run on
+                (default: the generator's own)
+
+        Returns:
+            str: Raw response text
+
+        Raises:
+            asyncio.TimeoutError: The call ran longer than `timeout`
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+
+        def run():
+            loop.call_soon_threadsafe(lambda: started.done() or started.set_result(None))
+            return self._complete(model_name, prompt, timeout)
+
+        call = loop.run_in_executor(executor or self._pool, run)
+        await asyncio.wait({started, call}, return_when=asyncio.FIRST_COMPLETED)
+        return await asyncio.wait_for(call, timeout)
+
+    def _cache_key(self, user_request):
+        """
+        Build the generation cache key for a request.
+
+        Args:
+            user_request (str): Natural language command request
+
+        Returns:
+            str: Key covering the request, system context, model and prompt version
+        """
+        return make_key(
+            normalize_request(user_request),
+            self.system_context,
+            self.model_name,
+            PROMPT_HASH,
+        )
+
+    def cache_stats(self):
+        """
+        Get generation cache hit/miss counters.
+
+        Returns:
+            dict: Cache statistics, or None if caching is disabled
+        """
+        if self.cache is None:
+            return None
+        return self.cache.stats()
+
+    def _lookup_local(self, user_request):
+        """
+        Answer a request without the API: local intents, then the exact
+        generation cache, then the similarity index.
+
+        Sets self.last_source to "intent", "cache" or "similar" on a hit.
+
+        Args:
+            user_request (str): Natural language command request
+
+        Returns:
+            tuple: (key, command) where key is the generation cache key (None if
+                caching is disabled) and command is None on a miss
+        """
+        if self.intents is not None:
+            matched = self.intents.match(user_request)
+            if matched is not None and validate_command(matched[1], self.installed)[0]:
+                self.intent_hits += 1
+                self.last_source = "intent"
+                metrics.incr("cache_hits", source="intent")
+                return None, matched[1]
+
+        key = None
+        if self.cache is not None:
+            key = self._cache_key(user_request)
+            cached = self.cache.get(key)
+            if cached is not None:
+                # Rules or installed tools may have changed since the entry was stored
+                if validate_command(cached, self.installed)[0]:
+                    self.last_source = "cache"
+                    metrics.incr("cache_hits", source="cache")
+                    return key, cached
+                self.cache.discard(key)
+
+        if self.similar is not None:
+            found = self.similar.lookup(user_request)
+            if found is not None and validate_command(found[2], self.installed)[0]:
+                self.last_source = "similar"
+                self.last_similar = found
+                metrics.incr("cache_hits", source="similar")
+                if os.getenv("AI_BASH_SIMILAR_REFRESH"):
+                    # Offer the reused command now, fetch a fresh one for next time
+                    threading.Thread(
+                        target=self._generate_remote, args=(user_request, key), daemon=True
+                    ).start()
+                return key, found[2]
+
+        self.last_source = "llm"
+        metrics.incr("cache_misses")
+        return key, None
+
+    def _build_prompt(self, user_request, feedback=None):
+        """Format user prompt with system prompt (and feedback, if any) prepended."""
+        user_prompt = get_user_prompt(user_request)
+        if feedback:
+            return f"{self.system_prompt}\n\n{feedback}\n\n{user_prompt}"
+        return f"{self.system_prompt}\n\n{user_prompt}"
+
+    def _missing_feedback(self, command):
+        """
+        Build feedback for a command that names executables not on PATH.
+
+        Args:
+            command (str): Sanitized command
+
+        Returns:
+            str: Feedback for _build_prompt(), or None if nothing is missing
+                (or the check is disabled)
+        """
+        if self.installed is None or command.startswith("ERROR"):
+            return None
+        missing = find_missing_commands(command, self.installed)
+        if not missing:
+            return None
+        metrics.incr("regenerations")
+        return MISSING_FEEDBACK.format(command=command, names=", ".join(missing))
+
+    def _retry_missing(self, user_request, key, command):
+        """
+        Regenerate once, with feedback, if a command names missing executables.
+
+        Args:
+            user_request (str): Natural language command request
+            key (str): Cache key, or None if caching is disabled
+            command (str): Sanitized command
+
+        Returns:
+            str: The new command, or `command` if nothing was missing or the
+                retry failed (validation then reports what to install)
+        """
+        feedback = self._missing_feedback(command)
+        if feedback is None:
+            return command
+        try:
+            text = self._generate_hedged(self._build_prompt(user_request, feedback))
+        except Exception as e:
+            metrics.incr("llm_errors", type=type(e).__name__)
+            return command
+        return self._finish(user_request, key, text)
+
+    def _finish(self, user_request, key, text):
+        """
+        Turn raw model output into a command and remember it if safe.
+
+        Args:
+            user_request (str): Natural language command request
+            key (str): Cache key, or None if caching is disabled
+            text (str): Raw response text
+
+        Returns:
+            str: Sanitized command
+        """
+        # Sanitize output (remove markdown, extra whitespace)
+        command = sanitize_output(text.strip())
+
+        # Only safe commands that can run here are worth replaying
+        if validate_command(command, self.installed)[0]:
+            if key is not None:
+                self.cache.put(key, command)
+            if self.similar is not None:
+                self.similar.add(user_request, command)
+
+        return command
+
+    def generate_command(self, user_request):
+        """
+        Generate a shell command from natural language request.
+
+        Args:
+            user_request (str): Natural language command request
+
+        Returns:
+            str: Generated shell command (or ERROR message)
+        """
+        with metrics.span("generate", backend=self.backend) as span:
+            key, cached = self._lookup_local(user_request)
+            if cached is None:
+                cached = self._generate_remote(user_request, key)
+            span.set(source=self.last_source)
+            return cached
+
+    def _generate_remote(self, user_request, key):
+        """
+        Generate a command with the backend.
+
+        Args:
+            user_request (str): Natural language command request
+            key (str): Generation cache key, or None
+
+        Returns:
+            str: Generated shell command (or ERROR message)
+        """
+        try:
+            text = self._generate_hedged(self._build_prompt(user_request))
+            return self._retry_missing(user_request, key, self._finish(user_request, key, text))
+
+        except Exception as e:
+            if isinstance(e, TimeoutError):
+                metrics.incr("timeouts", stage="llm")
+            return f"ERROR: Failed to generate command - {str(e)}"
+
+    def _hedge_delay(self):
+        """Seconds to wait for the primary model before hedging."""
+        observed = self.latency.percentile(self.model_name, self.hedge_percentile)
+        if observed is None:
+            return float(os.getenv("AI_BASH_HEDGE_DELAY", DEFAULT_HEDGE_DELAY))
+        return max(MIN_HEDGE_DELAY, observed)
+
+    def _call_model(self, model_name, prompt, deadline):
+        """
+        Call one model, retrying transient errors with jittered exponential backoff.
+
+        Args:
+            model_name (str): Model to call
+            prompt (str): Full prompt
+            deadline (float): time.monotonic() value after which to give up
+
+        Returns:
+            str: Raw response text
+        """
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"timed out after {self.timeout:g} seconds")
+            start = time.monotonic()
+            metrics.incr("llm_requests", model=model_name)
+            try:
+                with metrics.span("llm", model=model_name, attempt=attempt):
+                    text = self._complete(model_name, prompt, remaining)
+                self.latency.record(model_name, time.monotonic() - start)
+                return text
+            except Exception as e:
+                metrics.incr("llm_errors", type=type(e).__name__)
+                if not is_transient_error(e) or attempt >= self.retries:
+                    raise
+                # Full jitter keeps concurrent clients from retrying in lockstep
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+                attempt += 1
+                if time.monotonic() + delay >= deadline:
+                    raise
+                metrics.incr("llm_retries")
+                time.sleep(delay)
+
+    def _generate_hedged(self, prompt):
+        """
+        Get a response, hedging to the next preferred model when the primary is slow.
+
+        If the primary has not answered within the hedge delay (the
+        configured percentile of its recent latencies), or fails, the same
+        prompt is sent to the next model in hedge_models. The first answer
+        that passes validate_command (including the installed-executable
+        check) wins; if none does, the first answer received is returned so
+        the caller reports it.
+
+        Args:
+            prompt (str): Full prompt
+
+        Returns:
+            str: Raw response text
+        """
+        deadline = time.monotonic() + self.timeout
+        # Copying the context keeps the calls' spans under the caller's
+        call = contextvars.copy_context().run
+        pending = {self._pool.submit(call, self._call_model, self.model_name, prompt, deadline)}
+        hedges = list(self.hedge_models)
+        hedge_at = time.monotonic() + self._hedge_delay()
+        first_text = None
+        first_error = None
+
+        # A failed primary leaves nothing pending; the next hedge still goes out
+        while pending or (hedges and first_text is None):
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if hedges and now >= hedge_at:
+                metrics.incr("hedges")
+                call = contextvars.copy_context().run
+                pending.add(self._pool.submit(call, self._call_model, hedges.pop(0), prompt, deadline))
+                hedge_at = now + self._hedge_delay()
+                continue
+
+            until = hedge_at if hedges else deadline
+            done, pending = wait(pending, timeout=until - now, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    text = future.result()
+                except Exception as e:
+                    first_error = first_error or e
+                    # Do not wait out the hedge delay after a failure
+                    hedge_at = time.monotonic()
+                    continue
+                if validate_command(sanitize_output(text.strip()), self.installed)[0]:
+                    return text
+                if first_text is None:
+                    first_text = text
+
+        if first_text is not None:
+            return first_text
+        if first_error is not None and not pending:
+            raise first_error
+        raise TimeoutError(f"timed out after {self.timeout:g} seconds")
+
+    def latency_stats(self):
+        """
+        Get per-model latency percentiles.
+
+        Returns:
+            dict: model -> {"count", "p50", "p95"} in seconds
+        """
+        return self.latency.stats()
+
+    def generate_command_stream(self, user_request, on_update=None):
+        """
+        Generate a command from streamed chunks, stopping as early as possible.
+
+        Streaming stops once the command is complete (first newline after
+        it), the model is refusing (ERROR: prefix) or the partial command
+        already matches a dangerous pattern.
+
+        Args:
+            user_request (str): Natural language command request
+            on_update (callable, optional): Called with the partial command
+                each time it grows
+
+        Returns:
+            str: Generated shell command (or ERROR message)
+        """
+        with metrics.span("generate", backend=self.backend, stream=True) as span:
+            command = self._generate_stream(user_request, on_update)
+            span.set(source=self.last_source)
+            return command
+
+    def _generate_stream(self, user_request, on_update):
+        """Body of generate_command_stream()."""
+        key, cached = self._lookup_local(user_request)
+        if cached is not None:
+            if on_update is not None:
+                on_update(cached)
+            return cached
+
+        deadline = time.monotonic() + self.timeout
+        buffer = ""
+        shown = ""
+        chunks = self._complete_stream(self.model_name, self._build_prompt(user_request),
+                                       self.timeout)
+        metrics.incr("llm_requests", model=self.model_name)
+        try:
+            for text in chunks:
+                buffer += text
+                line, complete = _first_command_line(buffer)
+
+                if line.startswith("ERROR"):
+                    return REFUSAL
+
+                # Hold back a possible "ERROR" prefix rather than flash it
+                if line != shown and on_update is not None and not "ERROR".startswith(line):
+                    on_update(line)
+                    shown = line
+
+                if complete:
+                    break
+
+                # A match that ends before the end of the partial line cannot
+                # be undone by more text (offsets are in the normalized line)
+                end = len(normalize_command(line))
+                if any(m.end < end for m in find_dangerous_matches(line)):
+                    break
+
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"timed out after {self.timeout:g} seconds")
+        except Exception as e:
+            metrics.incr("llm_errors", type=type(e).__name__)
+            if not buffer:
+                # Nothing streamed yet: the hedged path handles retries
+                return self._generate_remote(user_request, key)
+            if isinstance(e, TimeoutError):
+                metrics.incr("timeouts", stage="llm")
+            return f"ERROR: Failed to generate command - {str(e)}"
+        finally:
+            # Abandon the rest of the response
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+        line, _ = _first_command_line(buffer)
+        return self._retry_missing(user_request, key, self._finish(user_request, key, line))
+
+    async def generate_command_async(self, user_request, timeout=None, executor=None):
+        """
+        Generate a shell command without blocking the event loop.
+
+        Args:
+            user_request (str): Natural language command request
+            timeout (float, optional): Seconds to wait for the model
+                (default: AI_BASH_LLM_TIMEOUT)
+            executor (ThreadPoolExecutor, optional): Pool for backends
+                without native async (default: the generator's own)
+
+        Returns:
+            str: Generated shell command (or ERROR message)
+        """
+        if timeout is None:
+            timeout = self.timeout
+        with metrics.span("generate", backend=self.backend) as span:
+            key, cached = self._lookup_local(user_request)
+            span.set(source=self.last_source)
+            if cached is not None:
+                return cached
+
+            prompt = self._build_prompt(user_request)
+            command = None
+            try:
+                for retry in (False, True):
+                    metrics.incr("llm_requests", model=self.model_name)
+                    with metrics.span("llm", model=self.model_name):
+                        text = await self._complete_async(
+                            self.model_name, prompt, timeout, executor=executor
+                        )
+                    command = self._finish(user_request, key, text)
+                    # Regenerate once if it names executables that are not installed
+                    feedback = None if retry else self._missing_feedback(command)
+                    if feedback is None:
+                        break
+                    prompt = self._build_prompt(user_request, feedback)
+                return command
+
+            except asyncio.TimeoutError:
+                metrics.incr("timeouts", stage="llm")
+                if command is not None:
+                    return command
+                return f"ERROR: Failed to generate command - timed out after {timeout:g} seconds"
+            except Exception as e:
+                metrics.incr("llm_errors", type=type(e).__name__)
+                if command is not None:
+                    return command
+                return f"ERROR: Failed to generate command - {str(e)}"
+
+    async def generate_many(self, user_requests, concurrency=None, timeout=None):
+        """
+        Generate commands for many requests concurrently.
+
+        Backends without native async get a thread pool of `concurrency`
+        workers for this batch, so neither the generator's shared pool nor
+        hedged calls limit it.
+
+        Args:
+            user_requests (iterable): Natural language command requests
+            concurrency (int, optional): Requests in flight at once
+                (AI_BASH_CONCURRENCY, default 8)
+            timeout (float, optional): Per-request timeout in seconds
+
+        Returns:
+            list: Commands (or ERROR messages) in input order
+        """
+        if concurrency is None:
+            concurrency = int(os.getenv("AI_BASH_CONCURRENCY", DEFAULT_CONCURRENCY))
+        concurrency = max(1, concurrency)
+        semaphore = asyncio.Semaphore(concurrency)
+        pool = ThreadPoolExecutor(max_workers=concurrency,
+                                  thread_name_prefix=f"{self.backend or 'llm'}-batch")
+
+        async def generate_one(user_request):
+            async with semaphore:
+                return await self.generate_command_async(user_request, timeout=timeout,
+                                                         executor=pool)
+
+        try:
+            return await asyncio.gather(*(generate_one(r) for r in user_requests))
+        finally:
+            # Calls that timed out may still be running; do not block the loop on them
+            pool.shutdown(wait=False)
+
+    def generate_batch(self, user_requests, concurrency=None, timeout=None):
+        """
+        Blocking wrapper around generate_many() for non-async callers.
+
+        Args:
+            user_requests (iterable): Natural language command requests
+            concurrency (int, optional): Requests in flight at once
+            timeout (float, optional): Per-request timeout in seconds
+
+        Returns:
+            list: Commands (or ERROR messages) in input order
+        """
+        return asyncio.run(
+            self.generate_many(user_requests, concurrency=concurrency, timeout=timeout)
+        )
+
+
+def get_backend_name():
+    """
+    Get the configured backend name.
+
+    Returns:
+        str: AI_BASH_BACKEND, default "gemini"
+    """
+    return (os.getenv("AI_BASH_BACKEND") or DEFAULT_BACKEND).strip().lower()
+
+
+def load_backend(name=None):
+    """
+    Import a backend's generator class.
+
+    Args:
+        name (str, optional): Backend name (default: get_backend_name())
+
+    Returns:
+        type: CommandGenerator subclass
+
+    Raises:
+        ValueError: Unknown backend name
+    """
+    name = name or get_backend_name()
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown backend '{name}'. Set AI_BASH_BACKEND to one of: "
+            + ", ".join(sorted(BACKENDS))
+        )
+    module_name, class_name = BACKENDS[name]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_generator(system_context, backend=None, **kwargs):
+    """
+    Create the configured command generator.
+
+    Args:
+        system_context (dict): System detection context
+        backend (str, optional): Backend name (default: AI_BASH_BACKEND)
+        **kwargs: Passed to the backend's constructor
+
+    Returns:
+        CommandGenerator: Ready generator
+
+    Raises:
+        ValueError: Unknown backend or missing configuration (e.g. API key)
+    """
+    return load_backend(backend)(system_context, **kwargs)
@@ -3,27 +3,171 @@ Gemini API integration for AI Bash.
 Handles communication with Google's Gemini LLM.
 """
 
+import asyncio
+import hashlib
 import os
-import google.generativeai as genai
-from prompts import get_system_prompt, get_user_prompt
-from safety import sanitize_output
+import threading
+import time
+import metrics
+from cache import get_cache_dir, read_json, write_json_atomic
+from llm_backend import CommandGenerator
 
+# google.generativeai pulls in grpc and friends; it is imported on first use
+genai = None
 
-class GeminiCommandGenerator:
+# Preference order (newer models first)
+PREFERRED_MODELS = [
+    "models/gemini-2.5-flash",
+    "models/gemini-2.5-pro",
+    "models/gemini-flash-latest",
+    "models/gemini-pro-latest",
+    "models/gemini-1.5-flash",
+    "models/gemini-1.5-pro", 
+    "models/gemini-pro"
+]
+
+FALLBACK_MODEL = "gemini-pro"
+
+# How long a discovered model list is trusted before a background refresh
+DEFAULT_MODEL_CACHE_TTL = 24 * 3600
+
+
+def load_genai():
+    """
+    Import google.generativeai on first use.
+    
+    Returns:
+        module: The google.generativeai module
+    """
+    global genai
+    if genai is None:
+        import google.generativeai
+        genai = google.generativeai
+    return genai
+
+
+def api_key_fingerprint(api_key):
+    """
+    Get a non-reversible identifier for an API key.
+    
+    Args:
+        api_key (str): Gemini API key
+        
+    Returns:
+        str: Short hex fingerprint
+    """
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def get_model_cache_path():
+    """
+    Get the model discovery cache file path.
+    
+    Returns:
+        str: Path to models.json in the cache directory
+    """
+    return os.path.join(get_cache_dir(), "models.json")
+
+
+def choose_model(available):
+    """
+    Pick the best model from a list of available model names.
+    
+    Args:
+        available (list): Model names supporting generateContent
+        
+    Returns:
+        str: Model name to use
+    """
+    # Return first match (keep the full model name)
+    for model in PREFERRED_MODELS:
+        if model in available:
+            return model
+    
+    # Fallback to first available
+    if available:
+        return available[0]
+    
+    return FALLBACK_MODEL
+
+
+def load_cached_models(api_key):
+    """
+    Read the cached discovery result for an API key.
+    
+    Args:
+        api_key (str): Gemini API key
+        
+    Returns:
+        dict: Entry with "model", "models" and "fetched_at", or None if not cached
+    """
+    entries = read_json(get_model_cache_path(), default={})
+    if not isinstance(entries, dict):
+        return None
+    entry = entries.get(api_key_fingerprint(api_key))
+    if not isinstance(entry, dict) or "model" not in entry:
+        return None
+    return entry
+
+
+def refresh_model_cache(api_key):
+    """
+    Enumerate available models and store the result in the cache.
+    
+    genai must already be configured with the same API key.
+    
+    Args:
+        api_key (str): Gemini API key
+        
+    Returns:
+        dict: The new cache entry
+    """
+    available = []
+    with metrics.span("model_discovery"):
+        for m in load_genai().list_models():
+            if "generateContent" in m.supported_generation_methods:
+                available.append(m.name)
+    
+    entry = {
+        "model": choose_model(available),
+        "models": available,
+        "fetched_at": time.time(),
+    }
+    
+    # Never cache an empty listing; retry discovery next startup instead
+    if available:
+        path = get_model_cache_path()
+        entries = read_json(path, default={})
+        if not isinstance(entries, dict):
+            entries = {}
+        entries[api_key_fingerprint(api_key)] = entry
+        try:
+            write_json_atomic(path, entries)
+        except OSError:
+            pass
+    
+    return entry
+
+
+class GeminiCommandGenerator(CommandGenerator):
     """
     Wrapper for Gemini API to generate Linux shell commands.
     """
     
-    def __init__(self, system_context, api_key=None):
+    backend = "gemini"
+    
+    def __init__(self, system_context, api_key=None, cache=None, model_name=None):
         """
         Initialize Gemini command generator.
         
         Args:
             system_context (dict): System detection context
             api_key (str, optional): Gemini API key. If None, reads from env var.
+            cache (GenerationCache, optional): Generation cache. If None, the default
+                on-disk cache is used unless AI_BASH_NO_CACHE is set.
+            model_name (str, optional): Pin the model and skip discovery. If None,
+                reads AI_BASH_MODEL from the environment.
         """
-        self.system_context = system_context
-        
         # Get API key from parameter or environment
         if api_key is None:
             api_key = os.getenv("GEMINI_API_KEY")
@@ -34,84 +178,109 @@ class GeminiCommandGenerator:
                 "or pass api_key parameter."
             )
         
-        # Configure Gemini
-        genai.configure(api_key=api_key)
+        super().__init__(system_context, cache=cache)
         
-        # Store system prompt to prepend to user messages
-        self.system_prompt = get_system_prompt(system_context)
+        # Configure Gemini
+        load_genai().configure(api_key=api_key)
+        self.api_key = api_key
+        self.pinned_model = model_name or os.getenv("AI_BASH_MODEL")
+        self.refresh_thread = None
+        self.available_models = []
         
         # Try to find an available model
-        available_model = self._get_available_model()
+        self.model_name = self._get_available_model()
         
         # Create model without system instruction (for compatibility)
-        self.model = genai.GenerativeModel(model_name=available_model)
+        self.model = genai.GenerativeModel(model_name=self.model_name)
+        self._models = {self.model_name: self.model}
+        
+        # Next preferred models a slow request is hedged to
+        hedge_count = int(os.getenv("AI_BASH_HEDGE_MODELS", 1))
+        self.hedge_models = [
+            m for m in PREFERRED_MODELS
+            if m in self.available_models and m != self.model_name
+        ][:max(0, hedge_count)]
+    
+    @classmethod
+    def preload(cls):
+        """Import google.generativeai ahead of construction."""
+        load_genai()
+
     
     def _get_available_model(self):
         """
         Find the best available Gemini model for the API key.
         
+        A pinned model is used as-is. Otherwise the cached discovery result
+        is used and refreshed in the background once it is older than
+        AI_BASH_MODEL_CACHE_TTL; models are only listed synchronously when
+        nothing is cached yet.
+        
         Returns:
             str: Model name to use
         """
+        entry = load_cached_models(self.api_key)
+        if entry is not None:
+            self.available_models = entry.get("models", [])
+        
+        if self.pinned_model:
+            return self.pinned_model
+        
+        if entry is not None:
+            ttl = float(os.getenv("AI_BASH_MODEL_CACHE_TTL", DEFAULT_MODEL_CACHE_TTL))
+            if time.time() - entry.get("fetched_at", 0) >= ttl:
+                self.refresh_thread = threading.Thread(
+                    target=self._refresh_models_quietly, daemon=True
+                )
+                self.refresh_thread.start()
+            return entry["model"]
+        
         try:
-            # List all available models
-            available = []
-            for m in genai.list_models():
-                if "generateContent" in m.supported_generation_methods:
-                    available.append(m.name)
-            
-            # Preference order (newer models first)
-            preferred = [
-                "models/gemini-2.5-flash",
-                "models/gemini-2.5-pro",
-                "models/gemini-flash-latest",
-                "models/gemini-pro-latest",
-                "models/gemini-1.5-flash",
-                "models/gemini-1.5-pro", 
-                "models/gemini-pro"
-            ]
-            
-            # Return first match (keep the full model name)
-            for model in preferred:
-                if model in available:
-                    return model
-            
-            # Fallback to first available
-            if available:
-                return available[0]
-                
+            entry = refresh_model_cache(self.api_key)
+            self.available_models = entry["models"]
+            return entry["model"]
         except Exception:
             pass
         
         # Ultimate fallback
-        return "gemini-pro"
+        return FALLBACK_MODEL
     
-    def generate_command(self, user_request):
-        """
-        Generate a shell command from natural language request.
-        
-        Args:
-            user_request (str): Natural language command request
-            
-        Returns:
-            str: Generated shell command (or ERROR message)
-        """
+    def _refresh_models_quietly(self):
+        """Refresh the model cache, ignoring failures (background thread)."""
         try:
-            # Format user prompt with system prompt prepended
-            user_prompt = get_user_prompt(user_request)
-            full_prompt = f"{self.system_prompt}\n\n{user_prompt}"
-            
-            # Generate command
-            response = self.model.generate_content(full_prompt)
-            command = response.text.strip()
-            
-            # Sanitize output (remove markdown, extra whitespace)
-            command = sanitize_output(command)
-            
-            return command
-            
-        except Exception as e:
-            return f"ERROR: Failed to generate command - {str(e)}"
+            refresh_model_cache(self.api_key)
+        except Exception:
+            pass
+    
+    def _get_model(self, model_name):
+        """Get the GenerativeModel for a model name, creating it on first use."""
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models[model_name] = genai.GenerativeModel(model_name=model_name)
+        return model
+    
+    def _complete(self, model_name, prompt, timeout):
+        response = self._get_model(model_name).generate_content(
+            prompt, request_options={"timeout": timeout}
+        )
+        return response.text
+    
+    def _complete_stream(self, model_name, prompt, timeout):
+        response = self._get_model(model_name).generate_content(
+            prompt, stream=True, request_options={"timeout": timeout}
+        )
+        for chunk in response:
+            yield chunk.text
+    
+    async def _complete_async(self, model_name, prompt, timeout, executor=None):
+        # Native async: nothing is queued, so the timeout starts with the call
+        response = await asyncio.wait_for(
+            self._get_model(model_name).generate_content_async(
+                prompt, request_options={"timeout": timeout}
+            ),
+            timeout,
+        )
+        return response.text
 
 
 if __name__ == "__main__":
@@ -0,0 +1,243 @@
+"""
+OpenAI-compatible HTTP backend for AI Bash.
+Talks to any server exposing POST /v1/chat/completions (llama.cpp server,
+vLLM, Ollama, LM Studio, or the bundled mock_llm_server.py) over pooled
+keep-alive connections, using only the standard library.
+"""
+
+import http.client
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+from llm_backend import DEFAULT_CONCURRENCY, CommandGenerator
+
+
+DEFAULT_BASE_URL = "http://127.0.0.1:8080/v1"
+DEFAULT_MODEL = "local"
+DEFAULT_MAX_TOKENS = 256
+
+# A pooled connection the server has since closed fails with one of these
+# on the next request; it is retried once on a fresh connection
+_STALE_CONNECTION = (
+    http.client.RemoteDisconnected, http.client.CannotSendRequest,
+    ConnectionResetError, BrokenPipeError,
+)
+
+
+class BackendError(Exception):
+    """
+    Non-200 reply from the server. ``code`` carries the HTTP status so
+    is_transient_error() retries 429 and 5xx replies.
+    """
+
+    def __init__(self, code, message):
+        super().__init__(f"HTTP {code}: {message}")
+        self.code = code
+
+
+class ConnectionPool:
+    """
+    Keep-alive connections to one server, reused most-recent first.
+
+    Connections are created on demand; at most ``size`` idle ones are kept.
+    """
+
+    def __init__(self, base_url, size=DEFAULT_CONCURRENCY):
+        """
+        Args:
+            base_url (str): http:// or https:// URL; its path prefixes every request
+            size (int): Idle connections to keep
+        """
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported backend URL: {base_url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.size = size
+        self.created = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self, timeout):
+        if self.scheme == "https":
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def request(self, method, path, body=None, headers=None, timeout=None):
+        """
+        Send a request on a pooled connection.
+
+        The response is returned unread; pass the connection to release()
+        once it has been read to the end, or close it otherwise.
+
+        Args:
+            method (str): HTTP method
+            path (str): Path below the base URL, e.g. "/chat/completions"
+            body (bytes, optional): Request body
+            headers (dict, optional): Request headers
+            timeout (float, optional): Socket timeout in seconds
+
+        Returns:
+            tuple: (connection, http.client.HTTPResponse)
+        """
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect(timeout)
+            else:
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+            try:
+                conn.request(method, self.base_path + path, body=body, headers=headers or {})
+                return conn, conn.getresponse()
+            except _STALE_CONNECTION:
+                conn.close()
+                if not reused:
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+
+    def release(self, conn, response):
+        """
+        Return a connection whose response has been fully read.
+
+        Args:
+            conn (http.client.HTTPConnection): Connection from request()
+            response (http.client.HTTPResponse): Its response
+        """
+        if response.will_close:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class OpenAICompatibleGenerator(CommandGenerator):
+    """
+    Command generator backed by an OpenAI-compatible chat completions server.
+    """
+
+    backend = "openai"
+
+    def __init__(self, system_context, base_url=None, api_key=None, model_name=None,
+                 cache=None):
+        """
+        Initialize the HTTP backend.
+
+        Args:
+            system_context (dict): System detection context
+            base_url (str, optional): API base URL. If None, reads
+                AI_BASH_OPENAI_URL (default http://127.0.0.1:8080/v1).
+            api_key (str, optional): Bearer token. If None, reads
+                AI_BASH_OPENAI_KEY, then OPENAI_API_KEY; local servers need none.
+            model_name (str, optional): Model to request. If None, reads
+                AI_BASH_MODEL (default "local").
+            cache (GenerationCache, optional): Generation cache. If None, the default
+                on-disk cache is used unless AI_BASH_NO_CACHE is set.
+        """
+        self.base_url = base_url or os.getenv("AI_BASH_OPENAI_URL") or DEFAULT_BASE_URL
+        self.connections = ConnectionPool(self.base_url)
+
+        super().__init__(system_context, cache=cache)
+
+        if api_key is None:
+            api_key = os.getenv("AI_BASH_OPENAI_KEY") or os.getenv("OPENAI_API_KEY")
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+
+        self.model_name = model_name or os.getenv("AI_BASH_MODEL") or DEFAULT_MODEL
+
+        # Comma-separated models a slow request is hedged to
+        self.hedge_models = [
+            m.strip() for m in os.getenv("AI_BASH_OPENAI_HEDGE_MODELS", "").split(",")
+            if m.strip() and m.strip() != self.model_name
+        ]
+
+    def _post(self, model_name, prompt, timeout, stream):
+        """
+        POST a chat completion request.
+
+        Returns:
+            tuple: (connection, response) with a 200 response left unread
+
+        Raises:
+            BackendError: Non-200 reply
+        """
+        body = json.dumps({
+            "model": model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0,
+            "max_tokens": DEFAULT_MAX_TOKENS,
+            "stream": stream,
+        }).encode("utf-8")
+        conn, response = self.connections.request(
+            "POST", "/chat/completions", body=body, headers=self.headers, timeout=timeout
+        )
+        if response.status == 200:
+            return conn, response
+
+        data = response.read()
+        self.connections.release(conn, response)
+        try:
+            message = json.loads(data)["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = data.decode("utf-8", "replace")[:200] or response.reason
+        raise BackendError(response.status, message)
+
+    def _complete(self, model_name, prompt, timeout):
+        conn, response = self._post(model_name, prompt, timeout, stream=False)
+        try:
+            data = json.loads(response.read())
+        except BaseException:
+            conn.close()
+            raise
+        self.connections.release(conn, response)
+        return data["choices"][0]["message"]["content"] or ""
+
+    def _complete_stream(self, model_name, prompt, timeout):
+        conn, response = self._post(model_name, prompt, timeout, stream=True)
+        finished = False
+        try:
+            # Server-sent events: "data: {json}" lines, ended by "data: [DONE]"
+            for raw in response:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    # Drain the chunked terminator so the connection can be reused
+                    response.read()
+                    finished = True
+                    break
+                delta = json.loads(payload)["choices"][0].get("delta", {})
+                if delta.get("content"):
+                    yield delta["content"]
+        finally:
+            if finished:
+                self.connections.release(conn, response)
+            else:
+                # Stopped early: the rest of the stream is still in flight
+                conn.close()
@@ -0,0 +1,327 @@
+"""
+Instrumentation for AI Bash.
+Spans time each pipeline stage (detection, model discovery, generation,
+LLM calls, validation, execution) and counters record cache hits,
+blocked commands, timeouts and LLM errors.
+
+Spans are appended to a JSON Lines trace (AI_BASH_TRACE) and totals are
+written to a Prometheus text file for the node-exporter textfile
+collector (AI_BASH_METRICS). With neither set, span() and incr() return
+immediately.
+"""
+
+import atexit
+import contextvars
+import fcntl
+import itertools
+import json
+import os
+import threading
+import time
+
+
+# Spans are buffered and written once this many are pending, or this many
+# seconds after the last write
+FLUSH_SPANS = 256
+FLUSH_INTERVAL = 5.0
+
+PROMETHEUS_PREFIX = "ai_bash_"
+
+HELP = {
+    "stage_seconds": "Time spent per pipeline stage",
+    "cache_hits": "Requests answered without the LLM, by source",
+    "cache_misses": "Requests that needed the LLM",
+    "blocked_commands": "Commands rejected by safety validation",
+    "verdict_cache_hits": "Safety verdicts served from the verdict cache",
+    "verdict_cache_misses": "Safety verdicts computed by the rule matcher",
+    "missing_commands": "Commands rejected for naming an executable that is not installed",
+    "regenerations": "Commands regenerated because they named a missing executable",
+    "timeouts": "Operations that hit their timeout, by stage",
+    "cost_rewrites": "Expensive scans replaced by their cheaper form",
+    "execute_cpu_seconds": "CPU time used by executed commands",
+    "llm_requests": "LLM calls, including retries and hedges",
+    "llm_errors": "Failed LLM calls, by error type",
+    "llm_retries": "LLM calls retried after a transient error",
+    "hedges": "Requests hedged to another model",
+}
+
+_enabled = False
+_trace_path = None
+_metrics_path = None
+_lock = threading.Lock()
+_spans = []             # finished span records awaiting flush
+_counters = {}          # (name, labels) -> value
+_stages = {}            # span name -> [seconds, count]
+_flushed = {}           # Prometheus sample -> value at the last flush
+_last_flush = 0.0
+_atexit_registered = False
+_ids = itertools.count(1)
+_current = contextvars.ContextVar("ai_bash_span", default=None)
+
+
+class _NoopSpan:
+    """Returned by span() while instrumentation is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """
+    One timed stage. Nested spans record their parent's id, also across
+    asyncio tasks and threads started with contextvars.copy_context().
+    """
+
+    __slots__ = ("name", "attrs", "id", "parent", "wall", "start", "_token")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Attach attributes known only once the stage has run."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _current.get()
+        self.id = next(_ids)
+        self.parent = parent.id if parent is not None else None
+        self._token = _current.set(self)
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _current.reset(self._token)
+        record = {
+            "ts": round(self.wall, 6),
+            "span": self.name,
+            "ms": round(duration * 1000, 3),
+            "id": self.id,
+            "parent": self.parent,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+        }
+        if self.attrs:
+            record["attrs"] = self.attrs
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        _finish(self.name, duration, record)
+        return False
+
+
+def span(name, **attrs):
+    """
+    Time a stage.
+
+    Usage:
+        with metrics.span("generate", backend="gemini") as s:
+            ...
+            s.set(source="cache")
+
+    Args:
+        name (str): Stage name
+        **attrs: Attributes recorded with the span (trace only)
+
+    Returns:
+        Context manager; a shared no-op when instrumentation is off
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def incr(name, value=1, **labels):
+    """
+    Increment a counter.
+
+    Args:
+        name (str): Counter name, e.g. "cache_hits"
+        value (int): Amount to add
+        **labels: Prometheus labels, e.g. source="intent"
+    """
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def _finish(name, duration, record):
+    with _lock:
+        stage = _stages.setdefault(name, [0.0, 0])
+        stage[0] += duration
+        stage[1] += 1
+        if _trace_path is not None:
+            _spans.append(record)
+        due = (len(_spans) >= FLUSH_SPANS
+               or time.monotonic() - _last_flush >= FLUSH_INTERVAL)
+    if due:
+        flush()
+
+
+def _sample_name(name, labels, suffix):
+    text = PROMETHEUS_PREFIX + name + suffix
+    if labels:
+        quoted = (
+            k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for k, v in labels
+        )
+        text += "{" + ",".join(quoted) + "}"
+    return text
+
+
+def _samples():
+    """Current totals as Prometheus sample name -> value (caller holds _lock)."""
+    samples = {}
+    for (name, labels), value in _counters.items():
+        samples[_sample_name(name, labels, "_total")] = value
+    for name, (seconds, count) in _stages.items():
+        labels = (("stage", name),)
+        samples[_sample_name("stage_seconds", labels, "_sum")] = seconds
+        samples[_sample_name("stage_seconds", labels, "_count")] = count
+    return samples
+
+
+def snapshot():
+    """
+    Get the totals recorded by this process.
+
+    Returns:
+        dict: Prometheus sample name -> value, e.g.
+            'ai_bash_cache_hits_total{source="intent"}' -> 3
+    """
+    with _lock:
+        return _samples()
+
+
+def _read_textfile(path):
+    values = {}
+    try:
+        with open(path, "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return values
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        sample, _, value = line.rpartition(" ")
+        try:
+            values[sample] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+def _family(sample):
+    name = sample.split("{", 1)[0][len(PROMETHEUS_PREFIX):]
+    for suffix in ("_total", "_sum", "_count"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)], suffix
+    return name, ""
+
+
+def _write_textfile(path, deltas):
+    """
+    Add this process's increments since the last flush to the text file,
+    so short-lived invocations accumulate into one set of totals.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        values = _read_textfile(path)
+        for sample, delta in deltas.items():
+            values[sample] = values.get(sample, 0) + delta
+
+        families = {}
+        for sample in sorted(values):
+            family, suffix = _family(sample)
+            families.setdefault(family, []).append((suffix, sample))
+
+        lines = []
+        for family, samples in sorted(families.items()):
+            counter = any(suffix == "_total" for suffix, _ in samples)
+            metric = PROMETHEUS_PREFIX + family + ("_total" if counter else "")
+            if family in HELP:
+                lines.append(f"# HELP {metric} {HELP[family]}")
+            lines.append(f"# TYPE {metric} {'counter' if counter else 'summary'}")
+            for _, sample in samples:
+                value = values[sample]
+                text = repr(value) if value != int(value) else str(int(value))
+                lines.append(f"{sample} {text}")
+
+        # The collector may read at any time: write a new file and rename it
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+def flush():
+    """Write pending spans and the current totals."""
+    global _spans, _last_flush
+    with _lock:
+        spans, _spans = _spans, []
+        _last_flush = time.monotonic()
+        deltas = {}
+        if _metrics_path is not None:
+            for sample, value in _samples().items():
+                delta = value - _flushed.get(sample, 0)
+                if delta:
+                    deltas[sample] = delta
+                    _flushed[sample] = value
+        trace_path, metrics_path = _trace_path, _metrics_path
+
+    try:
+        if spans and trace_path is not None:
+            os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+            with open(trace_path, "a") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in spans))
+        if deltas and metrics_path is not None:
+            _write_textfile(metrics_path, deltas)
+    except OSError:
+        # Instrumentation must never break the tool
+        pass
+
+
+def configure(trace_path=None, metrics_path=None):
+    """
+    Turn instrumentation on or off, discarding totals recorded so far.
+
+    Args:
+        trace_path (str, optional): JSON Lines file spans are appended to
+        metrics_path (str, optional): Prometheus text file for totals
+    """
+    global _enabled, _trace_path, _metrics_path, _atexit_registered, _last_flush
+    flush()
+    with _lock:
+        _trace_path = trace_path or None
+        _metrics_path = metrics_path or None
+        _enabled = _trace_path is not None or _metrics_path is not None
+        _spans.clear()
+        _counters.clear()
+        _stages.clear()
+        _flushed.clear()
+        _last_flush = time.monotonic()
+    if _enabled and not _atexit_registered:
+        atexit.register(flush)
+        _atexit_registered = True
+
+
+def enabled():
+    """Whether instrumentation is on."""
+    return _enabled
+
+
+configure(os.getenv("AI_BASH_TRACE"), os.getenv("AI_BASH_METRICS"))
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Stand-in OpenAI-compatible LLM server for AI Bash.
+Answers /v1/chat/completions with canned commands after a configurable
+latency, failing a configurable share of requests, so the whole CLI path
+can be load tested offline with the openai backend.
+
+Usage:
+    python3 mock_llm_server.py --port 8080 --latency lognormal:0.3,0.5 --error-rate 0.02
+    AI_BASH_BACKEND=openai AI_BASH_OPENAI_URL=http://127.0.0.1:8080/v1 ai
+
+Latency specs (seconds):
+    fixed:S  uniform:LO,HI  exponential:MEAN  lognormal:MEDIAN,SIGMA
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Request substring -> command; the first key found in the request wins
+DEFAULT_RESPONSES = {
+    "disk": "df -h",
+    "memory": "free -h",
+    "cpu": "nproc",
+    "uptime": "uptime",
+    "kernel": "uname -r",
+    "process": "ps aux --sort=-%cpu | head -n 10",
+    "large files": "find . -type f -size +100M 2>/dev/null || true",
+    "port": "ss -tulpn",
+    "delete everything": "ERROR: Unsafe or ambiguous request",
+}
+DEFAULT_COMMAND = "ls -la"
+
+# The request is the last paragraph of the prompt (see prompts.USER_PROMPT_TEMPLATE)
+_REQUEST_SEPARATOR = "\n\n"
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution spec.
+
+    Args:
+        spec (str): "fixed:S", "uniform:LO,HI", "exponential:MEAN" or
+            "lognormal:MEDIAN,SIGMA"; a bare number means fixed
+
+    Returns:
+        callable: Takes a random.Random and returns a delay in seconds
+
+    Raises:
+        ValueError: Malformed spec
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "fixed", kind
+    try:
+        values = [float(v) for v in args.split(",")]
+    except ValueError:
+        raise ValueError(f"Bad latency spec: {spec}")
+
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exponential" and len(values) == 1 and values[0] > 0:
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    if kind == "lognormal" and len(values) == 2 and values[0] > 0:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Bad latency spec: {spec}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; Nagle would hold the body
+    # back until the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.server.mock.stats())
+        else:
+            self._send_json(404, {"error": {"message": f"no route {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"no route {self.path}"}})
+            return
+
+        mock = self.server.mock
+        delay, fail = mock.plan()
+        time.sleep(delay)
+        if fail:
+            mock.count("errors")
+            self._send_json(mock.error_status, {
+                "error": {"message": "mock server error", "type": "server_error"}
+            })
+            return
+
+        messages = request.get("messages") or [{}]
+        content = mock.respond(messages[-1].get("content", ""))
+        model = request.get("model", "mock")
+        if request.get("stream"):
+            mock.count("streamed")
+            self._stream(model, content, mock.chunk_size)
+        else:
+            self._send_json(200, {
+                "id": "mock", "object": "chat.completion", "model": model,
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }],
+            })
+
+    def _stream(self, model, content, chunk_size):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(data):
+            event = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+
+        for i in range(0, len(content), chunk_size):
+            send(json.dumps({
+                "id": "mock", "object": "chat.completion.chunk", "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[i:i + chunk_size]}}],
+            }))
+            self.wfile.flush()
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class MockLLMServer:
+    """
+    Configurable stand-in for an OpenAI-compatible server.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0", error_rate=0.0,
+                 error_status=503, responses=None, default_command=DEFAULT_COMMAND,
+                 fence=False, chunk_size=4, seed=None):
+        """
+        Configure the server.
+
+        Args:
+            host (str): Address to bind
+            port (int): Port to bind (0 picks a free one; see url)
+            latency (str): Latency spec, see parse_latency()
+            error_rate (float): Share of requests answered with error_status
+            error_status (int): HTTP status of injected errors (503 is retried)
+            responses (dict, optional): Request substring -> command
+                (default: DEFAULT_RESPONSES)
+            default_command (str): Reply when no substring matches
+            fence (bool): Wrap replies in a ```bash fence, as real models often do
+            chunk_size (int): Characters per streamed chunk
+            seed (int, optional): Seed for reproducible latencies and errors
+        """
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.responses = [
+            (key.lower(), command)
+            for key, command in (DEFAULT_RESPONSES if responses is None else responses).items()
+        ]
+        self.default_command = default_command
+        self.fence = fence
+        self.chunk_size = max(1, chunk_size)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "errors": 0, "streamed": 0}
+
+        self.server = _Server((host, port), _Handler)
+        self.server.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to use as AI_BASH_OPENAI_URL."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def plan(self):
+        """Draw the delay and whether to fail for one request."""
+        with self._lock:
+            self._counts["requests"] += 1
+            delay = max(0.0, self.latency(self._random))
+            fail = self._random.random() < self.error_rate
+        return delay, fail
+
+    def count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self):
+        """
+        Get request counters.
+
+        Returns:
+            dict: requests, errors and streamed counts
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def respond(self, prompt):
+        """
+        Pick the canned command for a prompt.
+
+        Args:
+            prompt (str): Prompt sent by the client
+
+        Returns:
+            str: Reply content
+        """
+        request = prompt.rsplit(_REQUEST_SEPARATOR, 1)[-1].lower()
+        command = self.default_command
+        for key, candidate in self.responses:
+            if key in request:
+                command = candidate
+                break
+        if self.fence and not command.startswith("ERROR"):
+            return f"```bash\n{command}\n```"
+        return command
+
+    def start(self):
+        """Serve on a background thread."""
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="mock-llm", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    """Run the mock server in the foreground."""
+    parser = argparse.ArgumentParser(description="Stand-in OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", default="fixed:0",
+                        help="latency distribution, e.g. uniform:0.05,0.2 (default fixed:0)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of requests that fail (default 0)")
+    parser.add_argument("--error-status", type=int, default=503,
+                        help="HTTP status of failed requests (default 503)")
+    parser.add_argument("--responses", metavar="FILE",
+                        help="JSON object mapping request substrings to commands")
+    parser.add_argument("--default-command", default=DEFAULT_COMMAND)
+    parser.add_argument("--fence", action="store_true",
+                        help="wrap replies in markdown code fences")
+    parser.add_argument("--chunk-size", type=int, default=4,
+                        help="characters per streamed chunk (default 4)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    responses = None
+    if args.responses:
+        with open(args.responses, "r") as f:
+            responses = json.load(f)
+
+    try:
+        server = MockLLMServer(
+            args.host, args.port, latency=args.latency, error_rate=args.error_rate,
+            error_status=args.error_status, responses=responses,
+            default_command=args.default_command, fence=args.fence,
+            chunk_size=args.chunk_size, seed=args.seed,
+        )
+    except (ValueError, OSError) as e:
+        print(f"✗ {e}", file=sys.stderr)
+        return 1
+
+    print(f"Mock LLM server listening on {server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
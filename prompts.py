@@ -17,6 +17,7 @@ that are valid for the given system environment.
 OS Distribution : {distro}
 Kernel Version  : {kernel}
 Package Manager : {pkg_manager}
+Init System     : {init_system}
 Shell           : bash
 ====================================================
 
@@ -27,6 +28,9 @@ MANDATORY RULES (STRICT):
 4. NEVER use commands not supported by the distro.
    - Ubuntu/Debian → apt
    - CentOS/RHEL   → yum or dnf
+   - Arch          → pacman
+   - Alpine        → apk
+   - openSUSE      → zypper
 5. NEVER invent binaries or flags.
 
 SAFETY RULES (CRITICAL):
@@ -73,11 +77,14 @@ def get_system_prompt(system_context):
     
     Args:
         system_context (dict): System detection context with kernel, distro, pkg_manager
+            and init_system (missing keys are shown as "unknown")
         
     Returns:
         str: Formatted system prompt
     """
-    return SYSTEM_PROMPT.format(**system_context)
+    values = {"init_system": "unknown"}
+    values.update(system_context)
+    return SYSTEM_PROMPT.format(**values)
 
 
 def get_user_prompt(user_request):
@@ -3,7 +3,15 @@ Safety validation module for AI Bash.
 Implements blocklist and validation for dangerous commands.
 """
 
+import hashlib
+import os
+import posixpath
 import re
+import threading
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+import metrics
 
 
 # Dangerous command patterns that should never be executed
@@ -31,6 +39,1183 @@ PROTECTED_PATHS = [
 ]
 
 
+# Whitespace runs longer than one character, or a single tab/newline
+_WHITESPACE_RUN = re.compile(r'\s{2,}|[^\S ]')
+
+
+class RuleMatch(namedtuple("RuleMatch", ["rule", "start", "end", "text"])):
+    """
+    A single safety rule hit.
+
+    Attributes:
+        rule (str): Rule id - the pattern from DANGEROUS_PATTERNS, or
+            "<command>:<target>" for a parsed-command check, e.g. "rm:/etc"
+        start (int): Start offset in the normalized command (see normalize_command)
+        end (int): End offset in the normalized command
+        text (str): The matched text
+    """
+    __slots__ = ()
+
+
+def normalize_command(command):
+    """
+    Normalize a command for rule matching.
+
+    The command is stripped and lowercased, and every whitespace run
+    becomes a single character: a newline if the run contains one,
+    otherwise a space. Rules only use \\s+, \\s* and . around whitespace,
+    so verdicts are unchanged, but no rule can backtrack over a long run.
+
+    Args:
+        command (str): The shell command
+
+    Returns:
+        str: Normalized command
+    """
+    return _collapse_whitespace(command.strip().lower())
+
+
+def _collapse_whitespace(command):
+    """Replace each whitespace run with a newline if it has one, else a space."""
+    return _WHITESPACE_RUN.sub(
+        lambda run: '\n' if '\n' in run.group() else ' ', command
+    )
+
+
+def source_offsets(command):
+    """
+    Map offsets in parse_command(command).text back to `command`.
+
+    The parser strips the command and collapses whitespace runs; text
+    outside the runs keeps its length, so each parsed offset has one
+    source offset (a collapsed run maps to where it starts).
+
+    Args:
+        command (str): The shell command as given
+
+    Returns:
+        list: Source offset for every parsed offset, plus one for the end
+    """
+    lead = len(command) - len(command.lstrip())
+    text = command.strip()
+    offsets = []
+    position = 0
+    for run in _WHITESPACE_RUN.finditer(text):
+        offsets.extend(range(lead + position, lead + run.start() + 1))
+        position = run.end()
+    offsets.extend(range(lead + position, lead + len(text) + 1))
+    return offsets
+
+
+def _split_wildcards(pattern):
+    """
+    Split a pattern at its top-level .* wildcards.
+
+    Args:
+        pattern (str): Regular expression source
+
+    Returns:
+        list: Segment sources; a single element if there is no top-level .*
+    """
+    segments = []
+    current = []
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            current.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and pattern.startswith('.*', i):
+            segments.append(''.join(current))
+            current = []
+            i += 3 if pattern.startswith('.*?', i) else 2
+            continue
+        current.append(char)
+        i += 1
+    segments.append(''.join(current))
+    return [segment for segment in segments if segment]
+
+
+class _Rule:
+    """
+    One compiled rule.
+
+    A pattern with top-level .* wildcards ("A.*B") is matched as a chain
+    of segments instead of one backtracking regex: find A, then the
+    leftmost B at or after A's end, which must start on the same line
+    since . does not match a newline. The leftmost B from each position
+    is remembered, so trying every A costs O(1) more each and a rule
+    whose segments have bounded length runs in time linear in the
+    command, where re would take quadratic time on "chmod chmod ..." or
+    "rm rm rm ...".
+    """
+
+    __slots__ = ("rule_id", "segments")
+
+    def __init__(self, rule_id, pattern, flags=0):
+        self.rule_id = rule_id
+        sources = _split_wildcards(pattern) or ['']
+        self.segments = [re.compile(source, flags) for source in sources]
+
+    def search(self, text):
+        """
+        Find the first match of the rule.
+
+        Args:
+            text (str): Normalized command
+
+        Returns:
+            tuple: (start, end, segment matches), or None
+        """
+        first = self.segments[0]
+        if len(self.segments) == 1:
+            match = first.search(text)
+            return None if match is None else (match.start(), match.end(), [match])
+
+        rest = self.segments[1:]
+        # Per segment: (searched from, leftmost match from there or None)
+        found = [(len(text) + 1, None)] * len(rest)
+        line = (len(text) + 1, -1)  # (from, first newline at or after from)
+        pos = 0
+        while True:
+            head = first.search(text, pos)
+            if head is None:
+                return None
+            end = head.end()
+            matches = [head]
+            for i, segment in enumerate(rest):
+                if not line[0] <= end <= line[1]:
+                    newline = text.find('\n', end)
+                    line = (end, len(text) if newline < 0 else newline)
+                since, match = found[i]
+                # The leftmost match from `since` is also the leftmost from
+                # any position between `since` and its start
+                if not (since <= end and (match is None or match.start() >= end)):
+                    match = segment.search(text, end)
+                    found[i] = (end, match)
+                if match is None or match.start() > line[1]:
+                    break
+                end = match.end()
+                matches.append(match)
+            else:
+                return head.start(), end, matches
+            pos = head.start() + 1
+
+
+def _leading_literal(pattern):
+    """
+    Extract the literal text every match of a pattern must start with.
+
+    Used as the prefilter trigger for a rule. Returns an empty string when
+    the pattern does not begin with a literal; such rules always run.
+
+    Args:
+        pattern (str): Regular expression source
+
+    Returns:
+        str: Lowercased literal prefix
+    """
+    literal = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            literal.append(pattern[i + 1])
+            i += 2
+        elif char.isalnum() or char in ' :=/-_':
+            literal.append(char)
+            i += 1
+        else:
+            break
+        # A quantifier makes the preceding character optional or repeated
+        if i < len(pattern) and pattern[i] in '?*{':
+            literal.pop()
+            break
+    return ''.join(literal).lower()
+
+
+# Arithmetic "((...))" with up to two levels of parentheses inside
+_ARITHMETIC = r"\(\((?:[^()]|\((?:[^()]|\([^()]*\))*\))*\)\)"
+
+# Shell tokens of a whitespace-collapsed command. Spaces are the only
+# characters no alternative matches; a word token is a whole shell word,
+# quotes, escapes and arithmetic expansions included. An arithmetic
+# command "(( ... ))" is one token. Each alternative is linear.
+_TOKEN = re.compile(r"""
+    (?P<redirect>\d*(?:<<<|<<-?|>>|>&|<&|&>>?|>\||[<>]))
+  | (?P<arithmetic>""" + _ARITHMETIC + r""")
+  | (?P<op>&&|\|\||;;|\|&|[;&|\n()])
+  | (?P<comment>\#[^\n]*)
+  | (?P<word>(?:[^\s;&|()<>'"\\`$]+|'[^']*'?|"(?:[^"\\]|\\.)*"?|\\.?
+              |\$""" + _ARITHMETIC + r"""|\$(?!\())+)
+  | (?P<subst>\$\(|`)
+""", re.VERBOSE | re.DOTALL)
+
+# Quoted and escaped pieces of a word
+_WORD_PIECE = re.compile(r"""'([^']*)'?|"((?:[^"\\]|\\.)*)"?|\\(.?)|([^'"\\]+)""", re.DOTALL)
+
+_DQUOTE_ESCAPE = re.compile(r'\\([$`"\\\n])')
+
+_ASSIGNMENT = re.compile(r'[A-Za-z_][A-Za-z0-9_]*=')
+
+# Words that may precede the executable of a simple command
+_RESERVED_WORDS = frozenset([
+    '!', '{', '}', 'if', 'then', 'else', 'elif', 'fi', 'do', 'done', 'while', 'until',
+])
+
+# Commands that run another command: name -> (short options taking a
+# value, long options taking a separate value, positional arguments
+# before the command)
+_WRAPPERS = {
+    'sudo': ('CDghpRrTtUu', {'chdir', 'close-from', 'group', 'host', 'other-user',
+                             'prompt', 'role', 'type', 'user', 'command-timeout'}, 0),
+    'doas': ('Cu', set(), 0),
+    'env': ('CSu', {'chdir', 'split-string', 'unset'}, 0),
+    'nice': ('n', {'adjustment'}, 0),
+    'ionice': ('cn', {'class', 'classdata'}, 0),
+    'nohup': ('', set(), 0),
+    'time': ('fo', {'format', 'output'}, 0),
+    'command': ('', set(), 0),
+    'builtin': ('', set(), 0),
+    'exec': ('a', set(), 0),
+    'xargs': ('adEILnPs', {'arg-file', 'delimiter', 'max-args', 'max-chars', 'max-procs'}, 0),
+    'stdbuf': ('eio', {'error', 'input', 'output'}, 0),
+    'timeout': ('ks', {'kill-after', 'signal'}, 1),
+    'setsid': ('', set(), 0),
+    'busybox': ('', set(), 0),
+    'chrt': ('', set(), 1),
+    'taskset': ('', set(), 1),
+}
+
+# Shells whose -c argument is a script; su takes -c as well
+_SHELLS = frozenset(['sh', 'bash', 'dash', 'zsh', 'ksh', 'mksh', 'ash', 'su'])
+
+# Interpreters whose scripts are not parsed
+_INTERPRETERS = frozenset([
+    'awk', 'gawk', 'mawk', 'nawk', 'lua', 'node', 'nodejs', 'perl', 'php', 'python',
+    'python2', 'python3', 'ruby', 'tclsh',
+])
+
+# Programs that run a command given as arguments, on stdin or elsewhere,
+# in a form the parser does not follow
+_COMMAND_RUNNERS = frozenset([
+    'at', 'batch', 'chroot', 'crontab', 'expect', 'fakeroot', 'firejail', 'flock', 'gdb',
+    'ltrace', 'nsenter', 'parallel', 'pkexec', 'proot', 'runuser', 'schroot', 'screen',
+    'script', 'setpriv', 'sg', 'ssh', 'strace', 'systemd-run', 'tmux', 'unshare',
+    'valgrind', 'watch',
+])
+
+# Commands whose patterns always scan the whole text: stopping the machine
+# takes a single word, which may reach a shell in too many ways to follow
+_POWER_COMMANDS = frozenset(['halt', 'init', 'poweroff', 'reboot', 'shutdown'])
+
+# find actions that run a command up to ";" or "+"
+_FIND_EXEC = frozenset(['-exec', '-execdir', '-ok', '-okdir'])
+
+# Command names the shell resolves itself, without a file on PATH
+_SHELL_BUILTINS = frozenset([
+    '.', ':', '[', '[[', 'alias', 'bg', 'bind', 'break', 'builtin', 'caller', 'case',
+    'cd', 'command', 'compgen', 'complete', 'continue', 'coproc', 'declare', 'dirs',
+    'disown', 'echo', 'enable', 'eval', 'exec', 'exit', 'export', 'false', 'fc', 'fg',
+    'for', 'function', 'getopts', 'hash', 'help', 'history', 'jobs', 'kill', 'let',
+    'local', 'logout', 'mapfile', 'popd', 'printf', 'pushd', 'pwd', 'read', 'readarray',
+    'readonly', 'return', 'select', 'set', 'shift', 'shopt', 'source', 'suspend', 'test',
+    'time', 'times', 'trap', 'true', 'type', 'typeset', 'ulimit', 'umask', 'unalias',
+    'unset', 'wait',
+]) | _RESERVED_WORDS
+
+# Command names only known at run time: expansions, globs, function definitions
+_DYNAMIC_NAME = re.compile(r'[$`*?\[\](){}]')
+
+# "name() {" or "function name": calls to it need no executable
+_FUNCTION_DEFINITION = re.compile(r'(?:^|[\s;&|(){}])(?:function\s+([^\s;&|()<>]+)|([^\s;&|()<>]+)\s*\(\s*\))')
+
+# Commands that only read system state: a list of them can run in any
+# order, or all at once (see split_independent)
+_READ_ONLY_COMMANDS = frozenset([
+    'arch', 'basename', 'blkid', 'cat', 'cksum', 'cmp', 'column', 'cut', 'date', 'df',
+    'diff', 'dig', 'dirname', 'dmesg', 'du', 'echo', 'egrep', 'env', 'fgrep', 'file',
+    'find', 'findmnt', 'free', 'getent', 'grep', 'groups', 'head', 'host', 'hostname',
+    'id', 'ip', 'iostat', 'journalctl', 'jq', 'last', 'locate', 'ls', 'lsb_release',
+    'lsblk', 'lscpu', 'lsmem', 'lsmod', 'lsof', 'lspci', 'lsusb', 'md5sum', 'mpstat',
+    'netstat', 'nproc', 'nslookup', 'od', 'pgrep', 'ping', 'plocate', 'printenv',
+    'printf', 'ps', 'pstree', 'pwd', 'readlink', 'realpath', 'rg', 'sed', 'sensors',
+    'sha1sum', 'sha256sum', 'sha512sum', 'sort', 'ss', 'stat', 'strings', 'systemctl',
+    'tail', 'test', 'tr', 'tree', 'true', 'uname', 'uniq', 'uptime', 'vmstat', 'w', 'wc',
+    'which', 'who', 'whoami', 'zcat', 'zgrep',
+])
+
+# systemctl verbs that only report
+_SYSTEMCTL_QUERIES = frozenset([
+    'cat', 'is-active', 'is-enabled', 'is-failed', 'list-dependencies', 'list-sockets',
+    'list-timers', 'list-unit-files', 'list-units', 'show', 'status',
+])
+
+# Redirection targets that are not files
+_NULL_TARGETS = frozenset(['/dev/null', '/dev/stdout', '/dev/stderr'])
+
+# Scripts nested deeper than this (bash -c "bash -c ...") are scanned as text
+_MAX_NESTING = 4
+
+# Commands longer than this are parsed every time rather than memoized
+_MEMO_MAX_LENGTH = 4096
+
+
+class SimpleCommand(namedtuple("SimpleCommand", ["name", "argv", "options", "operands",
+                                                 "start", "end", "text", "depth"])):
+    """
+    One simple command of a command line, with wrappers removed.
+
+    "FOO=1 sudo -u root /bin/rm -rf '/tmp/a b'" becomes name "rm" and argv
+    ("/bin/rm", "-rf", "/tmp/a b"): assignments and wrappers (sudo, env,
+    xargs, nice, ...) are skipped, quotes are removed and redirections are
+    dropped.
+
+    Attributes:
+        name (str): Lowercased basename of the executable
+        argv (tuple): Executable and arguments, in their original case
+        options (frozenset): Options, with clusters split: "-rf" gives
+            "-r" and "-f", "--color=auto" gives "--color"
+        operands (tuple): Arguments that are not options
+        start (int): Start offset in the normalized command
+        end (int): End offset in the normalized command
+        text (str): Normalized text of the command (for a command nested
+            in a "sh -c" script or "find -exec", its own text, while
+            start and end span the outer command)
+        depth (int): 0 for a command of the command line, 1 or more if nested
+    """
+    __slots__ = ()
+
+
+def _split_arguments(args):
+    """
+    Separate options from operands.
+
+    Args:
+        args (list): Arguments after the executable
+
+    Returns:
+        tuple: (frozenset of options, tuple of operands)
+    """
+    options = set()
+    operands = []
+    for i, arg in enumerate(args):
+        if arg[:1] != '-' or arg == '-':
+            operands.append(arg)
+        elif arg == '--':
+            operands.extend(args[i + 1:])
+            break
+        elif arg[1] == '-':
+            options.add(arg.split('=', 1)[0])
+        else:
+            options.update(['-' + letter for letter in arg[1:]])
+    return frozenset(options), tuple(operands)
+
+
+class ParsedCommand(namedtuple("ParsedCommand", ["text", "commands", "opaque"])):
+    """
+    A command line split into simple commands.
+
+    Attributes:
+        text (str): The normalized command (see normalize_command)
+        commands (tuple): SimpleCommand tuples, in order, nested ones after
+            the command that runs them
+        opaque (bool): True if part of the command could not be analyzed
+            (a substitution inside double quotes, or nesting beyond
+            _MAX_NESTING); such commands are also scanned as plain text
+    """
+    __slots__ = ()
+
+
+def _unquote(word):
+    """
+    Remove quotes and escapes from a shell word.
+
+    Args:
+        word (str): Word as written
+
+    Returns:
+        tuple: (word, opaque flag: a substitution inside double quotes)
+    """
+    pieces = []
+    opaque = False
+    for single, double, escaped, plain in _WORD_PIECE.findall(word):
+        if double:
+            opaque = opaque or '$(' in double or '`' in double
+            pieces.append(_DQUOTE_ESCAPE.sub(r'\1', double))
+        elif escaped:
+            pieces.append('' if escaped == '\n' else escaped)
+        else:
+            pieces.append(single or plain)
+    return ''.join(pieces), opaque
+
+
+def _tokenize(text):
+    """
+    Split a whitespace-collapsed command into the words of each simple command.
+
+    Commands are separated by ;, &, |, &&, ||, newlines, parentheses and
+    command substitutions, so "echo $(reboot)" yields "echo" and "reboot".
+    Comments, redirection targets and here-document bodies are dropped;
+    "$((...))" stays part of its word. Arithmetic nested too deep to
+    tell from a substitution makes the result opaque.
+
+    Args:
+        text (str): Whitespace-collapsed command
+
+    Returns:
+        tuple: (list of word lists, each word a (text, start, end) tuple;
+            opaque flag)
+    """
+    commands = []
+    words = []
+    redirect = None
+    heredocs = []
+    opaque = False
+    pos = 0
+    while True:
+        token = _TOKEN.search(text, pos)
+        if token is None:
+            break
+        pos = token.end()
+        kind = token.lastgroup
+        if kind in ('word', 'arithmetic'):
+            word = token.group()
+            if "'" in word or '"' in word or '\\' in word:
+                word, quoted_opaque = _unquote(word)
+                opaque = opaque or quoted_opaque
+            if redirect is not None:
+                if redirect.endswith(('<<', '<<-')):
+                    heredocs.append(word)
+                redirect = None
+                continue
+            words.append((word, token.start(), token.end()))
+        elif kind == 'redirect':
+            redirect = token.group()
+        elif kind != 'comment':
+            if kind == 'subst' and text.startswith('(', pos):
+                opaque = True
+            if words:
+                commands.append(words)
+                words = []
+            redirect = None
+            if token.group() == '\n' and heredocs:
+                pos = _skip_heredocs(text, pos, heredocs)
+                heredocs = []
+    if words:
+        commands.append(words)
+    return commands, opaque
+
+
+def _skip_heredocs(text, pos, delimiters):
+    """
+    Skip here-document bodies.
+
+    Args:
+        text (str): Whitespace-collapsed command
+        pos (int): Start of the line after the redirections
+        delimiters (list): Unquoted delimiter of each here-document, in order
+
+    Returns:
+        int: Offset after the last delimiter line (len(text) if it is missing)
+    """
+    for delimiter in delimiters:
+        while pos < len(text):
+            end = text.find('\n', pos)
+            if end < 0:
+                end = len(text)
+            line = text[pos:end].strip()
+            pos = end + 1
+            if line == delimiter:
+                break
+    return min(pos, len(text))
+
+
+def _unwrap(argv):
+    """
+    Find the executable of a simple command.
+
+    Args:
+        argv (list): Words of the simple command
+
+    Returns:
+        int: Index of the executable in argv (len(argv) if there is none)
+    """
+    i = 0
+    while i < len(argv):
+        word = argv[i]
+        if _ASSIGNMENT.match(word) or word in _RESERVED_WORDS:
+            i += 1
+            continue
+        name = word.rsplit('/', 1)[-1].lower()
+        wrapper = _WRAPPERS.get(name)
+        if wrapper is None:
+            return i
+        short, long, positionals = wrapper
+        i += 1
+        while i < len(argv):
+            arg = argv[i]
+            if arg == '--':
+                i += 1
+                break
+            if arg.startswith('--'):
+                takes_value = '=' not in arg and arg[2:] in long
+                i += 2 if takes_value else 1
+            elif arg.startswith('-') and len(arg) > 1:
+                i += 1
+                for j, letter in enumerate(arg[1:], 2):
+                    if letter in short:
+                        # The value is the rest of the cluster or the next word
+                        if j == len(arg):
+                            i += 1
+                        break
+            elif name == 'env' and '=' in arg:
+                i += 1
+            else:
+                break
+        i += positionals
+    return i
+
+
+# Long shell options that take the next argument
+_SHELL_VALUE_OPTIONS = frozenset(['--rcfile', '--init-file'])
+
+
+def _nested_scripts(name, argv):
+    """
+    Find the commands a simple command runs itself.
+
+    Args:
+        name (str): Lowercased executable name
+        argv (tuple): Executable and arguments
+
+    Returns:
+        list: Script strings ("sh -c SCRIPT", "eval ...") and argv lists
+            ("find -exec ... ;")
+    """
+    nested = []
+    if name in _SHELLS:
+        # The script is the first operand after the options, -c anywhere among them
+        script_next = False
+        index = 1
+        while index < len(argv):
+            arg = argv[index]
+            if arg in ('--', '-'):
+                index += 1
+                break
+            if arg.startswith('--'):
+                index += 2 if arg in _SHELL_VALUE_OPTIONS else 1
+            elif len(arg) > 1 and arg[0] in '-+':
+                script_next = script_next or (arg[0] == '-' and 'c' in arg)
+                # -o NAME and -O NAME take a value
+                index += 2 if 'o' in arg or 'O' in arg else 1
+            else:
+                break
+        if script_next and index < len(argv):
+            nested.append(argv[index])
+    elif name == 'eval':
+        nested.append(' '.join(argv[1:]))
+    elif name == 'find':
+        current = None
+        for arg in argv[1:]:
+            if current is not None:
+                if arg in (';', '+'):
+                    nested.append(current)
+                    current = None
+                else:
+                    current.append(arg)
+            elif arg in _FIND_EXEC:
+                current = []
+        if current:
+            nested.append(current)
+    return nested
+
+
+def _parse(command, depth=0):
+    """
+    Parse a command line into simple commands (not memoized).
+
+    Args:
+        command (str): The shell command
+        depth (int): Nesting depth of the command
+
+    Returns:
+        ParsedCommand: The parse; offsets are in its own text
+    """
+    collapsed = _collapse_whitespace(command.strip())
+    text = collapsed.lower()
+    # Offsets must hold in the lowercased text; a few characters change length
+    if len(text) != len(collapsed):
+        collapsed = text
+
+    word_lists, opaque = _tokenize(collapsed)
+    commands = []
+    for words in word_lists:
+        argv = [word for word, _, _ in words]
+        index = _unwrap(argv)
+        if index >= len(argv):
+            continue
+        start, end = words[index][1], words[-1][2]
+        opaque = _add_command(commands, argv[index:], start, end, text[start:end], depth) or opaque
+    return ParsedCommand(text, tuple(commands), opaque)
+
+
+def _add_command(commands, argv, start, end, text, depth):
+    """
+    Append a simple command and the commands nested in it.
+
+    Args:
+        commands (list): SimpleCommand list to extend
+        argv (list): Executable and arguments
+        start (int): Start offset of the outermost command
+        end (int): End offset of the outermost command
+        text (str): Normalized text of this command
+        depth (int): Nesting depth
+
+    Returns:
+        bool: True if something nested too deep to analyze
+    """
+    name = argv[0].rsplit('/', 1)[-1].lower()
+    options, operands = _split_arguments(argv[1:])
+    commands.append(SimpleCommand(name, tuple(argv), options, operands, start, end, text, depth))
+
+    opaque = False
+    for script in _nested_scripts(name, argv):
+        if depth >= _MAX_NESTING:
+            return True
+        if isinstance(script, str):
+            parsed = _parse(script, depth + 1)
+            opaque = opaque or parsed.opaque
+            for inner in parsed.commands:
+                commands.append(inner._replace(start=start, end=end))
+        else:
+            index = _unwrap(script)
+            if index < len(script):
+                inner = script[index:]
+                opaque = _add_command(commands, inner, start, end,
+                                      normalize_command(' '.join(inner)), depth + 1) or opaque
+    return opaque
+
+
+@lru_cache(maxsize=1024)
+def _parse_memoized(command):
+    return _parse(command)
+
+
+def parse_command(command):
+    """
+    Split a command line into simple commands, memoized.
+
+    Handles quoting, escapes, ;, &&, ||, pipes, command substitution,
+    comments and redirections; strips sudo/env/xargs-style wrappers and
+    variable assignments; and descends into "sh -c", "eval" and
+    "find -exec". This is not a full shell parser: anything it cannot
+    follow is flagged opaque so callers can fall back to a text scan.
+
+    Args:
+        command (str): The shell command
+
+    Returns:
+        ParsedCommand: text, commands and opaque flag
+    """
+    if len(command) > _MEMO_MAX_LENGTH:
+        return _parse(command)
+    return _parse_memoized(command)
+
+
+# Same interface as functools.lru_cache
+parse_command.cache_info = _parse_memoized.cache_info
+parse_command.cache_clear = _parse_memoized.cache_clear
+
+
+def _target_path(operand):
+    """
+    Resolve a path operand for comparison with protected paths.
+
+    "/etc/", "/./etc" and "/etc/*" all give "/etc"; "/etc/.." gives "/".
+
+    Args:
+        operand (str): Command argument
+
+    Returns:
+        str: Normalized lowercase absolute path, or None if not absolute
+    """
+    operand = operand.lower()
+    if operand.endswith('/*'):
+        operand = operand[:-2] or '/'
+    if not operand.startswith('/'):
+        return None
+    return '/' + posixpath.normpath(operand).lstrip('/')
+
+
+def _check_rm(command, protected):
+    """rm of a protected path, or recursive rm of /."""
+    recursive = command.options & {'-r', '-R', '--recursive'}
+    for operand in command.operands:
+        path = _target_path(operand)
+        if path == '/' and recursive:
+            yield 'rm:/'
+        elif path in protected:
+            yield f'rm:{path}'
+
+
+def _check_mkfs(command, protected):
+    """Filesystem creation on anything under a protected path (e.g. /dev)."""
+    for operand in command.operands:
+        path = _target_path(operand)
+        if path is None:
+            continue
+        for root in protected:
+            if path == root or path.startswith(root + '/'):
+                yield f'mkfs:{root}'
+
+
+def _check_recursive_root(command, protected):
+    """Recursive chmod or chown of /."""
+    if command.options & {'-R', '--recursive'}:
+        if any(_target_path(operand) == '/' for operand in command.operands):
+            yield f'{command.name}:/'
+
+
+# Device files dd may write to safely
+_HARMLESS_DEVICES = frozenset(['/dev/null', '/dev/stdout', '/dev/stderr', '/dev/zero'])
+
+
+def _check_dd(command, protected):
+    """dd writing to a device."""
+    for operand in command.operands:
+        if operand.lower().startswith('of=/dev/'):
+            device = _target_path(operand[3:])
+            if device not in _HARMLESS_DEVICES and not device.startswith('/dev/fd/'):
+                yield f'dd:{device}'
+
+
+# systemctl verbs that stop or restart the machine
+_SYSTEMCTL_POWER = frozenset(['halt', 'kexec', 'poweroff', 'reboot'])
+
+
+def _check_systemctl(command, protected):
+    """systemctl poweroff, reboot, halt or kexec."""
+    verbs = [operand.lower() for operand in command.operands[:1]]
+    if verbs and verbs[0] in _SYSTEMCTL_POWER:
+        yield f'systemctl:{verbs[0]}'
+
+
+# Checks on parsed commands, by executable name. Each takes the
+# SimpleCommand and the protected paths and yields rule ids.
+COMMAND_CHECKS = {
+    'rm': [_check_rm],
+    'mkfs': [_check_mkfs],
+    'chmod': [_check_recursive_root],
+    'chown': [_check_recursive_root],
+    'dd': [_check_dd],
+    'systemctl': [_check_systemctl],
+}
+
+# A leading command name in a trigger literal
+_COMMAND_NAME = re.compile(r'[\w+-]+(?:\.[\w+-]+)*\.?(?= |$)')
+
+
+def _dispatch_key(trigger, pattern):
+    """
+    Return the executable a pattern applies to, or None if it is global.
+
+    A pattern is dispatched when its trigger starts with a command name
+    other than a power-state command (_POWER_COMMANDS) and it cannot
+    match across a command separator.
+
+    Args:
+        trigger (str): The pattern's leading literal
+        pattern (str): Regular expression source
+
+    Returns:
+        str: Executable name ("mkfs" for "mkfs\\."), or None
+    """
+    name = _COMMAND_NAME.match(trigger)
+    if name is None or re.search(r';|&|\\\||\\n', pattern):
+        return None
+    name = name.group().rstrip('.')
+    return None if name in _POWER_COMMANDS else name
+
+
+def _runs_hidden_code(text, commands):
+    """
+    Check whether a parsed command runs code its parse does not show.
+
+    That is a command substitution, a command name built from a variable,
+    a shell reading its script from stdin or a file ("| sh", "<<<", a
+    here-document), an interpreter or a command runner such as ssh or
+    watch. Such commands are matched against every pattern as plain text.
+
+    Args:
+        text (str): Normalized command
+        commands (tuple): Its SimpleCommand tuples
+
+    Returns:
+        bool: True if the whole text must be scanned
+    """
+    if '$(' in text or '`' in text:
+        return True
+    for simple in commands:
+        name = simple.name
+        if '$' in simple.argv[0] or name in _COMMAND_RUNNERS:
+            return True
+        if name.rstrip('0123456789.') in _INTERPRETERS:
+            return True
+        if name in _SHELLS and not _nested_scripts(name, simple.argv):
+            return True
+    return False
+
+
+class SafetyMatcher:
+    """
+    Compiled safety rule set.
+
+    The command is parsed into simple commands once (see parse_command),
+    and rules are dispatched by executable name: a pattern that starts
+    with a command name ("rm\\s+...") runs only on simple commands that
+    run that executable, after wrappers such as sudo are stripped, and
+    COMMAND_CHECKS inspect the parsed options and operands, so
+    "sudo rm -r -f /" and "/bin/rm --recursive /etc" are caught too.
+
+    Dispatched patterns match the command's unquoted words, so
+    "r\\m -rf /" is caught as well.
+
+    Other patterns (power-state commands, the fork bomb, anything that
+    may span several commands) scan the whole normalized command and the
+    unquoted words of each simple command; only those whose leading
+    literal occurs in it are run in full. If the parse is opaque or the
+    command runs code the parse does not show (see _runs_hidden_code),
+    every pattern scans the whole command. A command that names no
+    dispatched executable and has no quoting or expansion is not parsed
+    at all.
+
+    Matching is linear in the command length as long as the pieces of each
+    pattern between top-level .* wildcards match bounded-length text (after
+    normalize_command, \\s+ matches one character).
+    """
+
+    def __init__(self, patterns, protected_paths, checks=None):
+        """
+        Compile the rule set.
+
+        Args:
+            patterns (list): Regex sources that mark a command as dangerous
+            protected_paths (list): Paths that must never be deleted or formatted
+            checks (dict, optional): Executable name -> check functions
+                (default: COMMAND_CHECKS)
+        """
+        self._protected = frozenset(
+            '/' + path.strip('/').lower() for path in protected_paths
+        )
+        checks = COMMAND_CHECKS if checks is None else checks
+
+        by_command = {}
+        # trigger literal -> list of _Rule, for global rules and for all rules
+        self._global = {}
+        self._all = {}
+        self._untriggered = []
+
+        for pattern in patterns:
+            rule = _Rule(pattern, pattern, flags=re.IGNORECASE)
+            trigger = _leading_literal(pattern)
+            if not trigger:
+                self._untriggered.append(rule)
+                continue
+            self._all.setdefault(trigger, []).append(rule)
+            key = _dispatch_key(trigger, pattern)
+            if key is None:
+                self._global.setdefault(trigger, []).append(rule)
+            else:
+                by_command.setdefault(key, []).append(rule)
+
+        # executable name -> (patterns, checks)
+        self._dispatch = {
+            name: (tuple(by_command.get(name, ())), tuple(checks.get(name, ())))
+            for name in set(by_command) | set(checks)
+        }
+
+        # Without quoting or expansion, a dispatched executable name must
+        # appear literally, so a command containing none of them skips the parse
+        self._names = tuple(self._dispatch) + ("'", '"', '\\', '$', '`')
+
+    def _scan(self, text, rules):
+        """Yield (rule, search result) for the triggered rules matching text."""
+        candidates = list(self._untriggered)
+        for trigger, triggered in rules.items():
+            if trigger in text:
+                candidates.extend(triggered)
+        for rule in candidates:
+            found = rule.search(text)
+            if found is not None:
+                yield rule, found
+
+    def matches(self, command):
+        """
+        Find every rule the command matches.
+
+        Args:
+            command (str): The shell command to check
+
+        Returns:
+            list: RuleMatch tuples, one per matched rule
+        """
+        lowered = command.lower()
+        if any(name in lowered for name in self._names):
+            text, commands, opaque = parse_command(command)
+            opaque = opaque or _runs_hidden_code(text, commands)
+        else:
+            text, commands, opaque = normalize_command(command), (), False
+
+        # rule id -> RuleMatch, first match of each rule
+        results = {}
+        # Unquoted words of each simple command, where they differ from its text
+        words = []
+        for simple in commands:
+            args = normalize_command(' '.join(simple.argv))
+            if args != simple.text:
+                words.append((simple, args))
+            name = simple.name
+            keys = (name, name.split('.', 1)[0]) if '.' in name else (name,)
+            for key in keys:
+                entry = self._dispatch.get(key)
+                if entry is None:
+                    continue
+                rules, checks = entry
+                for rule in rules:
+                    found = rule.search(args)
+                    if found is None or rule.rule_id in results:
+                        continue
+                    start, end = simple.start, simple.end
+                    if not simple.depth and args == simple.text:
+                        start, end = start + found[0], start + found[1]
+                    results[rule.rule_id] = RuleMatch(rule.rule_id, start, end, text[start:end])
+                for check in checks:
+                    for rule_id in check(simple, self._protected):
+                        if rule_id not in results:
+                            results[rule_id] = RuleMatch(rule_id, simple.start, simple.end,
+                                                         text[simple.start:simple.end])
+
+        scanned = self._all if opaque else self._global
+        for rule, (start, end, _) in self._scan(text, scanned):
+            if rule.rule_id not in results:
+                results[rule.rule_id] = RuleMatch(rule.rule_id, start, end, text[start:end])
+        for simple, args in words:
+            for rule, _ in self._scan(args, scanned):
+                if rule.rule_id not in results:
+                    results[rule.rule_id] = RuleMatch(rule.rule_id, simple.start, simple.end,
+                                                      text[simple.start:simple.end])
+        return list(results.values())
+
+    def is_dangerous(self, command):
+        """
+        Check whether any rule matches the command.
+
+        Args:
+            command (str): The shell command to check
+
+        Returns:
+            bool: True if at least one rule matches
+        """
+        return bool(self.matches(command))
+
+    def protected_paths(self, matches):
+        """
+        List the protected paths a command's rule hits name.
+
+        Args:
+            matches (list): RuleMatch tuples from matches()
+
+        Returns:
+            list: Every protected path named, in order, without repeats
+        """
+        paths = []
+        for match in matches:
+            name, _, path = match.rule.partition(':')
+            if name in COMMAND_CHECKS and path in self._protected and path not in paths:
+                paths.append(path)
+        return paths
+
+
+DEFAULT_VERDICT_CACHE_SIZE = 4096
+
+
+def _rule_set():
+    return tuple(DANGEROUS_PATTERNS), tuple(PROTECTED_PATHS)
+
+
+def _rule_set_version(rule_set):
+    """Short hash identifying a (patterns, protected paths) rule set."""
+    digest = hashlib.sha256()
+    for items in rule_set:
+        for item in items:
+            digest.update(item.encode("utf-8") + b"\0")
+        digest.update(b"\1")
+    return digest.hexdigest()[:16]
+
+
+# (rule set, its version, compiled matcher), replaced as a whole
+_state = None
+
+
+def reload_rules():
+    """
+    Recompile the matcher from the current DANGEROUS_PATTERNS and PROTECTED_PATHS.
+
+    Happens automatically on the next check after either list changes;
+    calling it directly just does the work up front.
+    """
+    global _state
+    rules = _rule_set()
+    _state = (rules, _rule_set_version(rules), SafetyMatcher(*rules))
+
+
+reload_rules()
+
+
+def _current_state():
+    """Return (rule set, version, matcher), recompiling if the rule lists changed."""
+    if _rule_set() != _state[0]:
+        reload_rules()
+    return _state
+
+
+def rules_version():
+    """
+    Get the version hash of the current rule set.
+
+    Returns:
+        str: Hash of DANGEROUS_PATTERNS and PROTECTED_PATHS
+    """
+    return _current_state()[1]
+
+
+class VerdictCache:
+    """
+    Size-bounded LRU cache of validate_command verdicts.
+
+    Keys are (rule set version, exact command string), so a verdict is
+    never served for a rule set other than the one that produced it.
+    """
+
+    def __init__(self, max_entries=None):
+        """
+        Create an empty cache.
+
+        Args:
+            max_entries (int, optional): Entry limit (AI_BASH_VERDICT_CACHE_SIZE,
+                default 4096); 0 disables caching
+        """
+        if max_entries is None:
+            max_entries = int(os.getenv("AI_BASH_VERDICT_CACHE_SIZE", DEFAULT_VERDICT_CACHE_SIZE))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (is_safe, message); order is least to most recently used
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Look up a verdict.
+
+        Args:
+            key (tuple): (rules version, command)
+
+        Returns:
+            tuple: (is_safe, message), or None on a miss
+        """
+        with self._lock:
+            verdict = self._entries.get(key)
+            if verdict is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, key, verdict):
+        """
+        Store a verdict, evicting the least recently used beyond the limit.
+
+        Args:
+            key (tuple): (rules version, command)
+            verdict (tuple): (is_safe, message)
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: hits, misses, hit_rate, size and max_entries
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+
+_verdicts = VerdictCache()
+
+
+def verdict_cache_stats():
+    """
+    Get validate_command verdict cache counters, e.g. to tune its size.
+
+    Returns:
+        dict: hits, misses, hit_rate, size and max_entries
+    """
+    return _verdicts.stats()
+
+
+def clear_verdict_cache():
+    """Empty the validate_command verdict cache and reset its counters."""
+    _verdicts.clear()
+
+
+def find_dangerous_matches(command):
+    """
+    Return every safety rule the command matches.
+
+    Args:
+        command (str): The shell command to check
+
+    Returns:
+        list: RuleMatch tuples (rule, start, end, text)
+    """
+    return _current_state()[2].matches(command)
+
+
 def is_dangerous_command(command):
     """
     Check if a command matches dangerous patterns.
@@ -41,31 +1226,164 @@ def is_dangerous_command(command):
     Returns:
         bool: True if command is dangerous, False otherwise
     """
-    command = command.strip().lower()
-    
-    # Check against dangerous patterns
-    for pattern in DANGEROUS_PATTERNS:
-        if re.search(pattern, command, re.IGNORECASE):
-            return True
-    
-    # Check for operations on protected paths
-    for path in PROTECTED_PATHS:
-        # Check for deletion of protected paths
-        if re.search(rf'rm\s+.*{re.escape(path)}(?:\s|$)', command):
-            return True
-        # Check for formatting protected paths
-        if re.search(rf'mkfs.*{re.escape(path)}', command):
-            return True
-    
-    return False
+    return _current_state()[2].is_dangerous(command)
+
+
+def find_missing_commands(command, installed):
+    """
+    Find the executables a command runs that are not installed.
+
+    Every simple command is checked, including those in pipelines,
+    substitutions, "sh -c" scripts and "find -exec". Shell builtins,
+    functions the command defines, names built from expansions and
+    relative paths are not checked; an absolute path must be an
+    executable file and any other name must be in `installed`. Nothing is
+    reported for a command too nested to parse or containing a case
+    statement.
+
+    Args:
+        command (str): The shell command
+        installed (container): Executable names on PATH
+            (e.g. system_detect.ExecutableIndex)
+
+    Returns:
+        list: Missing names in order of appearance, without duplicates
+    """
+    parsed = parse_command(command)
+    # case patterns ("a) ...") are not told apart from commands
+    if parsed.opaque or any(simple.name == 'case' for simple in parsed.commands):
+        return []
+    functions = {a or b for a, b in _FUNCTION_DEFINITION.findall(command)}
+    missing = []
+    for simple in parsed.commands:
+        name = simple.argv[0]
+        if (name in _SHELL_BUILTINS or name in functions or not name
+                or _DYNAMIC_NAME.search(name)):
+            continue
+        if name.startswith('~'):
+            name = os.path.expanduser(name)
+        if '/' in name:
+            if not os.path.isabs(name) or (os.path.isfile(name) and os.access(name, os.X_OK)):
+                continue
+        elif name in installed:
+            continue
+        if name not in missing:
+            missing.append(name)
+    return missing
+
+
+def _read_only(simple):
+    """True if a simple command only reads (see _READ_ONLY_COMMANDS)."""
+    name, options, operands = simple.name, simple.options, simple.operands
+    if name not in _READ_ONLY_COMMANDS:
+        return False
+    if name == 'find':
+        return not set(simple.argv) & (_FIND_EXEC | {'-delete', '-fls', '-fprint',
+                                                     '-fprint0', '-fprintf'})
+    if name == 'sed':
+        return not options & {'-i', '--in-place'}
+    if name == 'sort':
+        return not options & {'-o', '--output'}
+    if name == 'date':
+        return not options & {'-s', '--set'}
+    if name == 'hostname':
+        return not operands and not options & {'-F', '--file', '-b', '--boot'}
+    if name == 'dmesg':
+        return not options & {'-c', '-C', '-D', '-E', '-n', '--clear', '--read-clear',
+                              '--console-off', '--console-on', '--console-level'}
+    if name == 'journalctl':
+        return not any(option.startswith(('--vacuum', '--rotate', '--flush', '--sync',
+                                          '--setup-keys', '--relinquish'))
+                       for option in options)
+    if name == 'systemctl':
+        return not operands or operands[0].lower() in _SYSTEMCTL_QUERIES
+    if name == 'ip':
+        return not {'add', 'change', 'del', 'delete', 'flush', 'replace', 'set'} & set(operands)
+    return True
 
 
-def validate_command(command):
+def split_independent(command):
     """
-    Validate a command for safety.
+    Split a list of commands that can run concurrently.
+
+    "df -h; free -h; systemctl --failed" gives its three commands. A
+    command line is only split at top-level ";" and newlines, and only if
+    every piece is built from read-only tools (pipelines, && and ||
+    included) and writes no file: anything that changes state, such as
+    cd, export, a redirection to a file, rm or a package manager, could
+    be what a later piece depends on. Control structures, subshells,
+    here-documents and background jobs are never split.
+
+    Args:
+        command (str): The shell command
+
+    Returns:
+        list: Pieces in order, original text; [command] if it cannot be split
+    """
+    text = _collapse_whitespace(command.strip())
+    pieces = []
+    start = 0
+    nesting = 0
+    backquoted = False
+    at_start = True
+    redirect = None
+    for token in _TOKEN.finditer(text):
+        kind, value = token.lastgroup, token.group()
+        if kind == 'word':
+            if redirect is not None:
+                target = _unquote(value)[0] if "'" in value or '"' in value else value
+                duplicate = redirect.endswith('&') and (target.isdigit() or target == '-')
+                if '>' in redirect and not duplicate and target not in _NULL_TARGETS:
+                    return [command]
+                redirect = None
+            elif at_start and value in _RESERVED_WORDS | {'case', 'for', 'select', 'function'}:
+                return [command]
+            at_start = False
+        elif kind == 'redirect':
+            if value.endswith(('<<', '<<-')):
+                return [command]
+            redirect = value
+        elif kind == 'subst':
+            if value == '`':
+                backquoted = not backquoted
+            else:
+                nesting += 1
+            at_start = True
+        elif kind == 'op':
+            if value == '&' or value == ';;' or (value == '(' and nesting == 0 and not backquoted):
+                return [command]
+            if value == '(':
+                nesting += 1
+            elif value == ')':
+                nesting -= 1
+            elif value in (';', '\n') and nesting == 0 and not backquoted:
+                pieces.append(text[start:token.start()])
+                start = token.end()
+            at_start = True
+    pieces.append(text[start:])
+
+    pieces = [piece.strip() for piece in pieces]
+    pieces = [piece for piece in pieces if piece and not piece.startswith('#')]
+    if len(pieces) < 2:
+        return [command]
+    for piece in pieces:
+        parsed = parse_command(piece)
+        if (parsed.opaque or not parsed.commands
+                or not all(_read_only(simple) for simple in parsed.commands)):
+            return [command]
+    return pieces
+
+
+def validate_command(command, installed=None):
+    """
+    Validate a command for safety and, optionally, that its tools exist.
     
     Args:
         command (str): The shell command to validate
+        installed (container, optional): Executable names on PATH
+            (e.g. system_detect.ExecutableIndex). If given, a command
+            naming an executable that is not installed is rejected, with
+            an install hint when `installed` has install_hint().
         
     Returns:
         tuple: (is_safe, message) where is_safe is bool and message is explanation
@@ -77,11 +1395,64 @@ def validate_command(command):
     if command.strip().startswith("ERROR:"):
         return False, command.strip()
     
-    # Check against dangerous patterns
-    if is_dangerous_command(command):
-        return False, "ERROR: Unsafe or ambiguous request"
+    # Check against dangerous patterns; verdicts are cached per rule set
+    with metrics.span("validate"):
+        _, version, matcher = _current_state()
+        key = (version, command)
+        verdict = _verdicts.get(key)
+        if verdict is None:
+            metrics.incr("verdict_cache_misses")
+            matches = matcher.matches(command)
+            if matches:
+                message = "ERROR: Unsafe or ambiguous request"
+                protected = matcher.protected_paths(matches)
+                if protected:
+                    label = "protected path" if len(protected) == 1 else "protected paths"
+                    message += f" ({label}: {', '.join(protected)})"
+                verdict = (False, message)
+            else:
+                verdict = (True, "Command validated successfully")
+            _verdicts.put(key, verdict)
+        else:
+            metrics.incr("verdict_cache_hits")
+
+        # Not part of the cached verdict: installing a package changes it
+        if verdict[0] and installed is not None:
+            missing = find_missing_commands(command, installed)
+            if missing:
+                metrics.incr("missing_commands")
+                return False, _missing_message(missing, installed)
+    return verdict
+
+
+def _missing_message(missing, installed):
+    """
+    Explain which executables are missing and how to install them.
+
+    Args:
+        missing (list): Missing executable names
+        installed (container): Index given to validate_command
+
+    Returns:
+        str: ERROR message
+    """
+    hint = getattr(installed, "install_hint", None)
+    details = [f"{name} ({hint(posixpath.basename(name))})" if hint else name
+               for name in missing]
+    return "ERROR: Command not found: " + ", ".join(details)
+
+
+def validate_many(commands):
+    """
+    Validate a batch of commands, e.g. for audit replays.
     
-    return True, "Command validated successfully"
+    Args:
+        commands (iterable): Shell commands to validate
+        
+    Returns:
+        list: (is_safe, message) tuples in input order
+    """
+    return [validate_command(command) for command in commands]
 
 
 def sanitize_output(output):
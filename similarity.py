@@ -0,0 +1,292 @@
+"""
+Similarity index over past generations for AI Bash.
+Finds earlier requests that are worded differently but mean the same
+thing ("show big files in home" vs "find large files in ~") so their
+command can be reused without an LLM call.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_MAX_ENTRIES = 50000
+
+_TOKEN = re.compile(r"[a-z0-9_./~+:-]+")
+
+STOPWORDS = {
+    "a", "an", "the", "in", "of", "to", "for", "on", "at", "with", "and", "or",
+    "my", "me", "i", "all", "please", "can", "could", "you", "is", "are", "be",
+    "that", "this", "these", "those", "from", "it", "its", "some", "any", "now",
+}
+
+# Words that mean the same thing in a shell request
+SYNONYMS = {
+    "big": "large", "huge": "large", "larger": "large", "bigger": "large",
+    "biggest": "large", "largest": "large",
+    "display": "show", "list": "show", "print": "show", "view": "show",
+    "find": "show", "search": "show", "locate": "show", "look": "show",
+    "~": "home", "~/": "home", "/home": "home", "homedir": "home",
+    "folder": "directory", "dir": "directory", "directories": "directory",
+    "delete": "remove", "rm": "remove", "erase": "remove", "uninstall": "remove",
+    "terminate": "kill",
+    "space": "usage", "storage": "disk",
+    "ram": "memory", "mem": "memory",
+}
+
+# Verbs naming what is done to the target; "stop nginx" is not "restart nginx"
+ACTIONS = {
+    "start", "stop", "restart", "reload", "enable", "disable", "kill", "remove",
+    "install", "update", "upgrade", "create", "add", "mount", "unmount", "umount",
+    "copy", "move", "rename", "compress", "extract", "download", "upload", "open",
+    "close", "block", "allow", "set", "reset", "clear", "clean", "archive", "backup",
+    "restore", "lock", "unlock", "mask", "unmask",
+}
+
+# Words that reverse a request ("don't" tokenizes as "don" and "t")
+NEGATIONS = {
+    "not", "no", "never", "without", "except", "excluding", "exclude", "cannot",
+    "don", "dont", "doesn", "didn", "isn", "aren", "won", "non",
+}
+
+
+def tokenize(text):
+    """
+    Split a request into normalized terms.
+
+    Args:
+        text (str): Natural language request
+
+    Returns:
+        list: Unique terms with stopwords dropped and synonyms folded
+    """
+    terms = []
+    for word in _TOKEN.findall(text.lower()):
+        word = word.rstrip(".:")
+        if not word or word in STOPWORDS:
+            continue
+        word = SYNONYMS.get(word, word)
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = SYNONYMS.get(word[:-1], word[:-1])
+        if word not in terms:
+            terms.append(word)
+    return terms
+
+
+def content_terms(terms):
+    """
+    Pick the terms a reusable command must agree on.
+
+    Actions ("stop", "restart"), paths ("/var/log", "home"), numbers
+    ("100m", "7") and negations change what the command does, however
+    similar the rest of the wording is. A term is weighted by how rare it
+    is, so a history full of start/stop entries would otherwise let the
+    verb count for almost nothing.
+
+    Args:
+        terms (list): Terms from tokenize()
+
+    Returns:
+        frozenset: The content terms
+    """
+    return frozenset(
+        term for term in terms
+        if term in NEGATIONS or term in ACTIONS or term == "home" or "/" in term
+        or any(char.isdigit() for char in term)
+    )
+
+
+class SimilarityIndex:
+    """
+    TF-IDF cosine similarity over stored (request, command) pairs.
+
+    Terms are kept in an inverted index. A lookup only scores entries that
+    share one of the query's rare terms, so its cost depends on how many
+    entries share those terms, not on the size of the index. Scores use
+    the IDF of the index as it is at lookup time, so they do not depend on
+    the order entries were added in, and an entry only matches if it has
+    the query's content terms (see content_terms) and no others.
+    """
+
+    def __init__(self, path=None, max_entries=None):
+        """
+        Load the index.
+
+        Args:
+            path (str, optional): JSON Lines file to persist entries in; None
+                keeps the index in memory only
+            max_entries (int, optional): Entry limit, oldest dropped first
+                (AI_BASH_SIMILAR_MAX, default 50000)
+        """
+        if max_entries is None:
+            max_entries = int(os.getenv("AI_BASH_SIMILAR_MAX", DEFAULT_MAX_ENTRIES))
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        self._next_id = 0
+        self._entries = {}      # id -> (request, command, terms)
+        self._by_request = {}   # normalized request -> id
+        self._postings = {}     # term -> set of ids
+
+        if path is not None:
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _idf(self, term):
+        df = len(self._postings.get(term, ()))
+        return math.log((len(self._entries) + 1) / (df + 1)) + 1.0
+
+    def _norm(self, terms):
+        return math.sqrt(sum(self._idf(t) ** 2 for t in terms))
+
+    def _insert(self, request, command):
+        normalized = " ".join(request.lower().split())
+        previous = self._by_request.pop(normalized, None)
+        if previous is not None:
+            self._remove(previous)
+
+        terms = tokenize(request)
+        if not terms:
+            return False
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (request, command, terms)
+        self._by_request[normalized] = entry_id
+        for term in terms:
+            self._postings.setdefault(term, set()).add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            # dicts keep insertion order, so the first id is the oldest
+            oldest = next(iter(self._entries))
+            self._by_request.pop(" ".join(self._entries[oldest][0].lower().split()), None)
+            self._remove(oldest)
+        return True
+
+    def _remove(self, entry_id):
+        _, _, terms = self._entries.pop(entry_id)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.discard(entry_id)
+                if not postings:
+                    del self._postings[term]
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                request, command = json.loads(line)
+            except (ValueError, TypeError):
+                continue
+            self._insert(request, command)
+
+        # Keep the append-only file from growing without bound
+        if len(lines) > 2 * self.max_entries:
+            self._rewrite()
+
+    def _rewrite(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                for request, command, _ in self._entries.values():
+                    f.write(json.dumps([request, command]) + "\n")
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def add(self, request, command):
+        """
+        Store a request and the command generated for it.
+
+        Args:
+            request (str): Natural language request
+            command (str): Validated command
+        """
+        with self._lock:
+            if not self._insert(request, command) or self.path is None:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps([request, command]) + "\n")
+            except OSError:
+                pass
+
+    def lookup(self, request, threshold=None):
+        """
+        Find the most similar stored request.
+
+        Args:
+            request (str): Natural language request
+            threshold (float, optional): Minimum cosine similarity in [0, 1]
+                (AI_BASH_SIMILARITY, default 0.85)
+
+        Returns:
+            tuple: (score, stored request, command), or None if nothing is close enough
+        """
+        if threshold is None:
+            threshold = float(os.getenv("AI_BASH_SIMILARITY", DEFAULT_THRESHOLD))
+        terms = tokenize(request)
+        required = content_terms(terms)
+
+        with self._lock:
+            if not terms or not self._entries:
+                return None
+
+            weights = {term: self._idf(term) ** 2 for term in terms}
+            total = sum(weights.values())
+            query_norm = math.sqrt(total)
+
+            # score <= sqrt(shared weight) / query_norm, so a match must share
+            # at least `needed` weight with the query.
+            needed = (threshold * query_norm) ** 2
+
+            # Any match contains at least one term of a set whose weight
+            # exceeds total - needed; build it from the shortest posting lists.
+            known = sorted((t for t in terms if t in self._postings),
+                           key=lambda t: len(self._postings[t]))
+            prefix = []
+            covered = 0.0
+            for term in known:
+                prefix.append(term)
+                covered += weights[term]
+                if covered > total - needed:
+                    break
+            candidates = set().union(*(self._postings[t] for t in prefix))
+
+            # A match also shares at least needed / heaviest-term-weight terms;
+            # counting postings is cheap and drops most candidates unscored.
+            min_shared = math.ceil(needed / max(weights.values()) - 1e-9)
+            if min_shared > 1 and len(candidates) > 64:
+                counts = Counter()
+                for term in known:
+                    counts.update(self._postings[term])
+                candidates = [c for c in candidates if counts[c] >= min_shared]
+
+            best = None
+            for entry_id in candidates:
+                stored_request, command, entry_terms = self._entries[entry_id]
+                # "/var" is not "home", and "do not delete" is not "delete"
+                if content_terms(entry_terms) != required:
+                    continue
+                shared = sum(weights[t] for t in entry_terms if t in weights)
+                # Norms are computed now: cached ones go stale as the IDF changes
+                score = min(1.0, shared / (query_norm * self._norm(entry_terms)))
+                if best is None or score > best[0]:
+                    best = (score, stored_request, command)
+
+        if best is None or best[0] < threshold:
+            return None
+        return best
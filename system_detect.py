@@ -1,48 +1,495 @@
 """
 System detection module for AI Bash.
-Detects Linux distribution, kernel version, and package manager.
+Detects Linux distribution, kernel version, package manager, init system
+and available tools.
 """
 
+import os
 import platform
-import subprocess
+import re
+import threading
+import time
 
+import metrics
+from cache import get_cache_dir, read_json, write_json_atomic
 
-def get_system_context():
+
+OS_RELEASE_FILES = ["/etc/os-release", "/usr/lib/os-release"]
+
+# Distribution id (or ID_LIKE entry) -> candidate package managers, preferred first
+DISTRO_PKG_MANAGERS = {
+    "ubuntu": ["apt"],
+    "debian": ["apt"],
+    "rhel": ["dnf", "yum"],
+    "centos": ["dnf", "yum"],
+    "fedora": ["dnf", "yum"],
+    "rocky": ["dnf", "yum"],
+    "almalinux": ["dnf", "yum"],
+    "amzn": ["dnf", "yum"],
+    "arch": ["pacman"],
+    "alpine": ["apk"],
+    "suse": ["zypper"],
+    "opensuse": ["zypper"],
+    "gentoo": ["emerge"],
+    "void": ["xbps-install"],
+    "nixos": ["nix-env"],
+}
+
+PKG_MANAGERS = ["apt", "dnf", "yum", "pacman", "apk", "zypper", "emerge", "xbps-install", "nix-env"]
+
+# Tools worth telling the model about when present
+CORE_TOOLS = [
+    "systemctl", "journalctl", "service", "rc-service",
+    "ss", "netstat", "ip", "ifconfig", "lsof",
+    "find", "locate", "plocate", "rg", "fd", "du", "df", "ncdu",
+    "ionice", "nice", "timeout",
+    "curl", "wget", "docker", "podman", "snap", "flatpak",
+]
+
+# Package manager -> command installing {package}
+INSTALL_COMMANDS = {
+    "apt": "apt install -y {package}",
+    "dnf": "dnf install -y {package}",
+    "yum": "yum install -y {package}",
+    "pacman": "pacman -S --noconfirm {package}",
+    "apk": "apk add {package}",
+    "zypper": "zypper install -y {package}",
+    "emerge": "emerge {package}",
+    "xbps-install": "xbps-install -y {package}",
+    "nix-env": "nix-env -iA nixpkgs.{package}",
+}
+
+_IPROUTE = {"dnf": "iproute", "yum": "iproute", "*": "iproute2"}
+_PROCPS = {"dnf": "procps-ng", "yum": "procps-ng", "pacman": "procps-ng", "*": "procps"}
+_DNS_UTILS = {"apt": "dnsutils", "pacman": "bind", "apk": "bind-tools", "*": "bind-utils"}
+
+# Executable -> package providing it, where the names differ; a dict when
+# distributions disagree ("*" for the rest)
+PACKAGE_PROVIDERS = {
+    "rg": "ripgrep",
+    "fd": {"apt": "fd-find", "*": "fd"},
+    "fdfind": "fd-find",
+    "ifconfig": "net-tools",
+    "netstat": "net-tools",
+    "route": "net-tools",
+    "ip": _IPROUTE,
+    "ss": _IPROUTE,
+    "dig": _DNS_UTILS,
+    "nslookup": _DNS_UTILS,
+    "host": _DNS_UTILS,
+    "ps": _PROCPS,
+    "free": _PROCPS,
+    "top": _PROCPS,
+    "pgrep": _PROCPS,
+    "pkill": _PROCPS,
+    "watch": _PROCPS,
+    "killall": "psmisc",
+    "fuser": "psmisc",
+    "pstree": "psmisc",
+    "locate": {"apt": "plocate", "*": "mlocate"},
+    "updatedb": {"apt": "plocate", "*": "mlocate"},
+    "iostat": "sysstat",
+    "mpstat": "sysstat",
+    "sar": "sysstat",
+    "lspci": "pciutils",
+    "lsusb": "usbutils",
+    "nc": {"apt": "netcat-openbsd", "dnf": "nmap-ncat", "yum": "nmap-ncat",
+           "pacman": "openbsd-netcat", "*": "netcat"},
+    "pip3": {"pacman": "python-pip", "apk": "py3-pip", "*": "python3-pip"},
+    "python3": {"pacman": "python", "*": "python3"},
+    "7z": {"apt": "p7zip-full", "*": "p7zip"},
+    "convert": "imagemagick",
+    "docker": {"apt": "docker.io", "*": "docker"},
+}
+
+# Seconds between checks of the PATH directory mtimes in ExecutableIndex
+DEFAULT_INDEX_CHECK_INTERVAL = 1.0
+
+
+def parse_os_release(path):
     """
-    Detect system environment including kernel, distribution, and package manager.
-    
+    Parse an os-release file without invoking a shell.
+
+    Args:
+        path (str): Path to the os-release file
+
+    Returns:
+        dict: KEY -> value with shell quoting removed, or {} if unreadable
+    """
+    fields = {}
+    try:
+        with open(path, "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return fields
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif len(value) >= 2 and value[0] == value[-1] == "'":
+            value = value[1:-1]
+        fields[key.strip()] = value
+    return fields
+
+
+def _executables(directory, wanted=None, skip=()):
+    """
+    List the executable files in one directory.
+
+    Args:
+        directory (str): Directory to list
+        wanted (set, optional): Only consider these names
+        skip (set): Names not to check again
+
+    Yields:
+        str: Executable names
+    """
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        return
+    with entries:
+        for entry in entries:
+            if (wanted is not None and entry.name not in wanted) or entry.name in skip:
+                continue
+            try:
+                if entry.is_file() and os.access(entry.path, os.X_OK):
+                    yield entry.name
+            except OSError:
+                continue
+
+
+def scan_path(names, path=None):
+    """
+    Find which of the given executables are on PATH, listing each directory once.
+
+    Args:
+        names (iterable): Executable names of interest
+        path (str, optional): PATH string (default: $PATH)
+
+    Returns:
+        set: Names found
+    """
+    wanted = set(names)
+    found = set()
+    for directory in (path if path is not None else os.getenv("PATH", "")).split(os.pathsep):
+        if directory:
+            found.update(_executables(directory, wanted, found))
+        if found == wanted:
+            break
+    return found
+
+
+def list_executables(path=None):
+    """
+    List every executable on PATH.
+
+    Args:
+        path (str, optional): PATH string (default: $PATH)
+
+    Returns:
+        set: Executable names
+    """
+    found = set()
+    for directory in (path if path is not None else os.getenv("PATH", "")).split(os.pathsep):
+        if directory:
+            found.update(_executables(directory, skip=found))
+    return found
+
+
+def _mtimes(paths):
+    """
+    Get the mtime of each path.
+
+    Args:
+        paths (iterable): File or directory paths
+
     Returns:
-        dict: System context with kernel, distro, and pkg_manager keys
+        list: [path, st_mtime_ns or None] pairs
+    """
+    stamps = []
+    for name in paths:
+        try:
+            stamps.append([name, os.stat(name).st_mtime_ns])
+        except OSError:
+            stamps.append([name, None])
+    return stamps
+
+
+def detect_init_system():
     """
-    kernel = platform.release()
-    distro = "unknown"
+    Detect the init system.
 
+    Returns:
+        str: "systemd", "openrc", "runit", "sysvinit" or the name of PID 1
+    """
+    if os.path.isdir("/run/systemd/system"):
+        return "systemd"
+    if os.path.exists("/run/openrc") or os.path.exists("/sbin/openrc"):
+        return "openrc"
+    if os.path.isdir("/run/runit") or os.path.isdir("/etc/runit"):
+        return "runit"
     try:
-        distro = subprocess.check_output(
-            ["bash", "-c", "source /etc/os-release && echo $ID"],
-            text=True
-        ).strip()
-    except Exception:
-        pass
-
-    # Determine package manager based on distribution
-    pkg_manager = "unknown"
-    if distro in ["ubuntu", "debian"]:
-        pkg_manager = "apt"
-    elif distro in ["centos", "rhel", "rocky", "almalinux"]:
-        pkg_manager = "yum/dnf"
+        with open("/proc/1/comm", "r") as f:
+            comm = f.read().strip()
+    except OSError:
+        return "unknown"
+    return "sysvinit" if comm == "init" else (comm or "unknown")
+
+
+def choose_pkg_manager(distro, distro_like, available):
+    """
+    Pick the package manager for a distribution.
+
+    Args:
+        distro (str): os-release ID
+        distro_like (list): os-release ID_LIKE entries
+        available (set): Package managers found on PATH
+
+    Returns:
+        str: Package manager name, or "unknown"
+    """
+    for family in [distro] + distro_like:
+        candidates = DISTRO_PKG_MANAGERS.get(family)
+        if candidates is None and family.startswith("opensuse"):
+            candidates = DISTRO_PKG_MANAGERS["opensuse"]
+        if candidates:
+            for candidate in candidates:
+                if candidate in available:
+                    return candidate
+            return candidates[0]
+
+    # Unknown distro: trust whatever is installed
+    for candidate in PKG_MANAGERS:
+        if candidate in available:
+            return candidate
+    return "unknown"
+
+
+def _cache_key():
+    """
+    Build the detection cache key from the inputs detection depends on.
+
+    Returns:
+        list: Kernel, PATH and the mtimes of os-release and each PATH directory
+    """
+    path = os.getenv("PATH", "")
+    return [platform.release(), path, _mtimes(OS_RELEASE_FILES + path.split(os.pathsep))]
+
+
+def detect_system_context():
+    """
+    Detect the system context without consulting the cache.
+
+    Returns:
+        dict: System context (see get_system_context)
+    """
+    release = {}
+    for path in OS_RELEASE_FILES:
+        release = parse_os_release(path)
+        if release:
+            break
+
+    distro = release.get("ID", "unknown").lower() or "unknown"
+    distro_like = release.get("ID_LIKE", "").lower().split()
+
+    found = scan_path(PKG_MANAGERS + CORE_TOOLS)
+    pkg_managers = [name for name in PKG_MANAGERS if name in found]
 
     return {
-        "kernel": kernel,
+        "kernel": platform.release(),
         "distro": distro,
-        "pkg_manager": pkg_manager
+        "distro_like": distro_like,
+        "distro_version": release.get("VERSION_ID", ""),
+        "pkg_manager": choose_pkg_manager(distro, distro_like, set(pkg_managers)),
+        "pkg_managers": pkg_managers,
+        "init_system": detect_init_system(),
+        "tools": sorted(name for name in CORE_TOOLS if name in found),
     }
 
 
+def get_system_context(use_cache=True):
+    """
+    Detect system environment including kernel, distribution, and package manager.
+
+    The result is cached on disk and reused until os-release, PATH or a
+    PATH directory changes.
+
+    Args:
+        use_cache (bool): Read and write the detection cache
+
+    Returns:
+        dict: System context with kernel, distro, distro_like, distro_version,
+            pkg_manager, pkg_managers, init_system and tools keys
+    """
+    with metrics.span("detect") as span:
+        if not use_cache:
+            return detect_system_context()
+
+        cache_path = os.path.join(get_cache_dir(), "system.json")
+        key = _cache_key()
+        cached = read_json(cache_path)
+        if isinstance(cached, dict) and cached.get("key") == key:
+            span.set(cached=True)
+            metrics.incr("cache_hits", source="system")
+            return cached["context"]
+
+        context = detect_system_context()
+        try:
+            write_json_atomic(cache_path, {"key": key, "context": context})
+        except OSError:
+            pass
+        return context
+
+
+def suggest_package(name, pkg_manager):
+    """
+    Suggest the package that provides an executable.
+
+    Args:
+        name (str): Executable name
+        pkg_manager (str): Package manager (see choose_pkg_manager)
+
+    Returns:
+        tuple: (package, install command), the command None for an unknown
+            package manager. The package is a guess when the name is not
+            in PACKAGE_PROVIDERS: most executables ship in a package of
+            the same name.
+    """
+    package = PACKAGE_PROVIDERS.get(name, name)
+    if isinstance(package, dict):
+        package = package.get(pkg_manager, package["*"])
+    template = INSTALL_COMMANDS.get(pkg_manager)
+    return package, template.format(package=package) if template else None
+
+
+class ExecutableIndex:
+    """
+    Names of every executable on PATH, to reject commands naming tools that
+    are not installed.
+
+    The listing is cached in memory and on disk, and rebuilt when PATH or
+    the mtime of a PATH directory changes (installing or removing a
+    package touches its bin directory). The mtimes are checked at most
+    every check_interval seconds, so a lookup is normally a set membership
+    test.
+    """
+
+    def __init__(self, path=None, pkg_manager=None,
+                 check_interval=DEFAULT_INDEX_CHECK_INTERVAL, use_cache=True):
+        """
+        Args:
+            path (str, optional): PATH string (default: $PATH at lookup time)
+            pkg_manager (str, optional): Package manager for install hints
+                (default: detected on the first hint)
+            check_interval (float): Seconds between mtime checks
+            use_cache (bool): Read and write the on-disk listing
+        """
+        self.path = path
+        self.pkg_manager = pkg_manager
+        self.check_interval = check_interval
+        self.use_cache = use_cache
+        self._key = None
+        self._names = frozenset()
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _current_key(self):
+        path = self.path if self.path is not None else os.getenv("PATH", "")
+        return [path, _mtimes(path.split(os.pathsep))]
+
+    def _load(self, key):
+        """Read the listing for `key` from disk, or build and store it."""
+        cache_path = os.path.join(get_cache_dir(), "executables.json")
+        if self.use_cache:
+            cached = read_json(cache_path)
+            if isinstance(cached, dict) and cached.get("key") == key:
+                metrics.incr("cache_hits", source="executables")
+                return frozenset(cached["names"])
+
+        names = list_executables(key[0])
+        if self.use_cache:
+            try:
+                write_json_atomic(cache_path, {"key": key, "names": sorted(names)})
+            except OSError:
+                pass
+        return frozenset(names)
+
+    def names(self):
+        """
+        Get the executables on PATH, rebuilding the listing if PATH changed.
+
+        Returns:
+            frozenset: Executable names
+        """
+        if self._key is not None and time.monotonic() - self._checked < self.check_interval:
+            return self._names
+        with self._lock:
+            key = self._current_key()
+            if key != self._key:
+                self._names = self._load(key)
+                self._key = key
+            self._checked = time.monotonic()
+        return self._names
+
+    def __contains__(self, name):
+        return name in self.names()
+
+    def install_hint(self, name):
+        """
+        Describe how to install a missing executable.
+
+        Args:
+            name (str): Executable name
+
+        Returns:
+            str: e.g. "provided by ripgrep: apt install -y ripgrep", or
+                "try: apt install -y foo" when the package is a guess
+        """
+        if self.pkg_manager is None:
+            self.pkg_manager = get_system_context()["pkg_manager"]
+        package, install = suggest_package(name, self.pkg_manager)
+        if name not in PACKAGE_PROVIDERS:
+            return f"try: {install}" if install else "not installed"
+        return f"provided by {package}: {install}" if install else f"provided by {package}"
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_executable_index(pkg_manager=None):
+    """
+    Get the shared executable index for $PATH.
+
+    Args:
+        pkg_manager (str, optional): Package manager for install hints
+
+    Returns:
+        ExecutableIndex: One instance per package manager, or None if
+            AI_BASH_NO_BINARY_CHECK is set
+    """
+    if os.getenv("AI_BASH_NO_BINARY_CHECK"):
+        return None
+    with _indexes_lock:
+        index = _indexes.get(pkg_manager)
+        if index is None:
+            index = _indexes[pkg_manager] = ExecutableIndex(pkg_manager=pkg_manager)
+        return index
+
+
 if __name__ == "__main__":
     # Test the detection
-    context = get_system_context()
+    context = get_system_context(use_cache=False)
     print("System Context:")
     print(f"  Kernel: {context['kernel']}")
-    print(f"  Distribution: {context['distro']}")
+    print(f"  Distribution: {context['distro']} {context['distro_version']}")
+    print(f"  Like: {' '.join(context['distro_like']) or '-'}")
     print(f"  Package Manager: {context['pkg_manager']}")
+    print(f"  Init System: {context['init_system']}")
+    print(f"  Tools: {' '.join(context['tools'])}")
@@ -3,11 +3,39 @@ Test suite for AI Bash behavioral examples from README.
 Run this to verify the system works as expected.
 """
 
+import asyncio
+import io
 import os
+import re
+import shlex
+import sys
+import tempfile
+import threading
+import time
 os.environ['GEMINI_API_KEY'] = 'test-key-placeholder'  # Set placeholder for testing
 
-from system_detect import get_system_context
-from safety import validate_command, is_dangerous_command
+from system_detect import (get_system_context, parse_os_release, choose_pkg_manager,
+                           ExecutableIndex, suggest_package)
+from cache import GenerationCache, make_key, normalize_request
+from history import HistoryStore, format_entry
+from intents import IntentEngine
+from similarity import SimilarityIndex
+import executor
+from executor import (CANCELLED_STATUS, NO_LIMITS, CommandResult, ExecutionResult, ShellSession,
+                      format_usage, parallel_exit_status, run_command, run_parallel,
+                      stream_command)
+from mock_llm_server import MockLLMServer
+import llm_backend
+from llm_backend import CommandGenerator
+from client import check_private_directory, send_request
+from daemon import CommandDaemon
+import cost
+from cost import Mount, analyze_command, format_estimate, review_command
+import safety
+from safety import (split_independent, validate_command, validate_many, is_dangerous_command,
+                    find_dangerous_matches, find_missing_commands, normalize_command,
+                    parse_command, VerdictCache, clear_verdict_cache, rules_version,
+                    verdict_cache_stats)
 
 
 def test_safety_validation():
@@ -101,7 +129,7 @@ def test_readme_examples():
         },
         {
             "input": "find files larger than 500MB in home directory",
-            "expected": "find /home -type f -size +500M",
+            "expected": "find ~ -type f -size +500M",
         },
         {
             "input": "move into /var/log directory",
@@ -170,6 +198,1418 @@ def test_dangerous_patterns():
     return all_passed
 
 
+def test_rule_matches():
+    """Test rule ids, spans and batch validation."""
+    print("\n" + "=" * 60)
+    print("RULE MATCHES AND BATCH VALIDATION")
+    print("=" * 60)
+    
+    matches = find_dangerous_matches("ls && rm -rf /etc")
+    print(f"\n  ls && rm -rf /etc -> {[m.rule for m in matches]}")
+    assert [m.rule for m in matches] == ["rm:/etc"]
+    assert matches[0].start == 6 and matches[0].text == "rm -rf /etc"
+    
+    # Rules from every simple command are reported
+    rules = {m.rule for m in find_dangerous_matches("rm -rf /boot; mkfs.ext4 /dev/sda")}
+    assert rules == {"rm:/boot", r"mkfs\.", "mkfs:/dev"}
+    
+    assert find_dangerous_matches("ls -la /") == []
+    
+    # The block message names every protected path, not only the first
+    is_safe, message = validate_command("rm -rf /etc /boot")
+    print(f"  rm -rf /etc /boot -> {message}")
+    assert not is_safe
+    assert message == "ERROR: Unsafe or ambiguous request (protected paths: /etc, /boot)"
+    message = validate_command("sudo rm -rf /usr /tmp/x; mkfs.ext4 /dev/sdb; rm -r /usr")[1]
+    assert message.endswith("(protected paths: /usr, /dev)")
+    assert validate_command("rm -rf /var")[1].endswith("(protected path: /var)")
+    
+    results = validate_many(["ls -la", "reboot", ""])
+    assert [safe for safe, _ in results] == [True, False, False]
+    
+    print("\n✓ Rule matches and batch validation working")
+    return True
+
+
+def test_parsed_safety():
+    """Test command parsing, wrapper stripping and per-command rule dispatch."""
+    print("\n" + "=" * 60)
+    print("PARSED SAFETY ANALYSIS")
+    print("=" * 60)
+    
+    parsed = parse_command("FOO=1 sudo -u root /bin/rm -rf '/tmp/a b' 2>&1 | tee log # x")
+    rm, tee = parsed.commands
+    assert (rm.name, rm.argv) == ("rm", ("/bin/rm", "-rf", "/tmp/a b"))
+    assert rm.options == {"-r", "-f"} and rm.operands == ("/tmp/a b",)
+    assert tee.argv == ("tee", "log") and not parsed.opaque
+    assert parse_command("ls -la") is parse_command("ls -la")  # memoized
+    
+    dangerous = [
+        "sudo rm -rf /",
+        "rm -r -f /",
+        "/bin/rm --recursive /etc",
+        "ls; sudo rm -rf /",
+        "true && env FOO=1 nice -n 5 rm -rf /usr/*",
+        "find . -name '*.o' | sudo xargs -n 10 rm -rf /",
+        "bash -c 'rm -rf /'",
+        "bash -c -- 'rm -rf /'",
+        "sh -c -- 'rm -rf /'",
+        "bash -e -o pipefail -c -- 'rm -rf /etc'",
+        "bash --norc -c - 'rm -rf /'",
+        "find / -exec rm -rf / \\;",
+        "echo $(reboot)",
+        'echo "$(reboot)"',
+        "timeout 5 shutdown -h now",
+        "systemctl poweroff",
+        "chown --recursive me /",
+        "dd if=disk.img of=/dev/sda",
+        "mkfs -t ext4 /dev/sdb",
+        # Power-state words are matched anywhere, however they reach a shell
+        "echo reboot",
+        "grep -r shutdown /var/log",
+        "$(echo reboot)",
+        "`echo reboot`",
+        "x=reboot; $x",
+        "echo reboot | sh",
+        "sh <<< reboot",
+        "at now <<< reboot",
+        "ssh localhost reboot",
+        "watch reboot",
+        "chroot / reboot",
+        "strace reboot",
+        "flock f reboot",
+        "unshare reboot",
+        "python3 -c 'import os; os.system(\"reboot\")'",
+        "perl -e 'system(\"reboot\")'",
+        "telinit 0",
+        "systemctl start reboot.target",
+        # Quotes and escapes inside a word do not hide it
+        "re''boot",
+        "r\\eboot",
+        "h''alt",
+        '"shut"down now',
+        "r''m -rf /",
+        # Scripts fed to a shell or runner are scanned as text
+        "echo rm -rf / | sh",
+        "bash <<EOF\nrm -rf /\nEOF",
+        "ssh host rm -rf /",
+    ]
+    # The script after -c and "--" is parsed like any other command
+    names = [c.name for c in parse_command("bash -o pipefail -ec -- 'rm -f x | tee y'").commands]
+    assert names == ["bash", "rm", "tee"]
+    assert not parse_command("sh -c -- 'ls'").opaque
+    
+    safe = [
+        "echo 'rm -rf /'",
+        "rm -rf ./build /home/me/etc",
+        "dd if=disk.img of=backup.img bs=1M",
+    ]
+    for cmd in dangerous:
+        print(f"  blocked: {cmd}")
+        assert is_dangerous_command(cmd), cmd
+    for cmd in safe:
+        print(f"  allowed: {cmd}")
+        assert not is_dangerous_command(cmd), cmd
+    
+    print("\n✓ Parsed safety analysis working")
+    return True
+
+
+def test_verdict_cache():
+    """Test the verdict LRU, its statistics and invalidation on rule changes."""
+    print("\n" + "=" * 60)
+    print("VERDICT CACHE")
+    print("=" * 60)
+    
+    clear_verdict_cache()
+    for _ in range(3):
+        assert validate_command("cached-verdict --now") == (True, "Command validated successfully")
+    stats = verdict_cache_stats()
+    print(f"\n  {stats}")
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert abs(stats["hit_rate"] - 2 / 3) < 1e-9
+    
+    # Editing the rule lists invalidates cached verdicts without reload_rules()
+    version = rules_version()
+    safety.DANGEROUS_PATTERNS.append(r"cached-verdict")
+    try:
+        assert rules_version() != version
+        assert not validate_command("cached-verdict --now")[0]
+    finally:
+        safety.DANGEROUS_PATTERNS.remove(r"cached-verdict")
+    assert rules_version() == version
+    assert validate_command("cached-verdict --now")[0]
+    
+    cache = VerdictCache(max_entries=2)
+    for key in ("a", "b", "a", "c"):
+        cache.put(("v", key), (True, key))
+    assert cache.get(("v", "b")) is None and cache.get(("v", "a")) == (True, "a")
+    assert cache.stats()["size"] == 2
+    
+    print("\n✓ Verdict cache working")
+    return True
+
+
+def test_executable_index():
+    """Test the PATH executable index and rejection of commands naming missing tools."""
+    print("\n" + "=" * 60)
+    print("EXECUTABLE INDEX")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        def install(name):
+            path = os.path.join(tmp, name)
+            with open(path, "w") as f:
+                f.write("#!/bin/sh\n")
+            os.chmod(path, 0o755)
+        
+        for name in ("ls", "grep", "bash", "find"):
+            install(name)
+        with open(os.path.join(tmp, "notes.txt"), "w") as f:
+            f.write("not executable\n")
+        index = ExecutableIndex(path=tmp, pkg_manager="apt", check_interval=0, use_cache=False)
+        assert index.names() == {"ls", "grep", "bash", "find"}
+        
+        cases = [
+            ("ls -la | grep foo", []),
+            ("cd /tmp && ls; export A=1", []),
+            ("ls | rg foo && sudo fd x", ["rg", "fd"]),
+            ("bash -c 'ls | ripgrepx'", ["ripgrepx"]),
+            ("find . -exec shred {} \\;", ["shred"]),
+            ("echo $(whoami)", ["whoami"]),
+            ("$EDITOR notes.txt; ./configure", []),
+            ("f() { ls; }; f", []),
+            # Arithmetic is not a command; here-document bodies are not commands
+            ("a=$((1+2)); ls $a", []),
+            ("ls $(( 1 + 2 ))", []),
+            ("(( n = 2 * (3 + 4) )); ls", []),
+            ("grep -c x <<EOF > n.txt\nserver_name x;\nlisten 80;\nEOF\nls | rg x", ["rg"]),
+            ("grep x <<-'END'\n\tnosuch one\n\tEND", []),
+            # Too nested to tell from a substitution: unknown, not missing
+            ("ls $(( ((((1)))) ))", []),
+        ]
+        for command, expected in cases:
+            got = find_missing_commands(command, index)
+            print(f"  {command} -> {got}")
+            assert got == expected
+        
+        is_safe, message = validate_command("ls | rg foo", index)
+        print(f"  {message}")
+        assert not is_safe and "apt install -y ripgrep" in message
+        assert validate_command("ls | grep foo", index)[0]
+        # Rules still come first
+        assert validate_command("rm -rf /", index)[1] == "ERROR: Unsafe or ambiguous request"
+        
+        # Installing a tool touches the directory, which rebuilds the listing
+        install("rg")
+        future = time.time() + 5
+        os.utime(tmp, (future, future))
+        assert validate_command("ls | rg foo", index)[0]
+    
+    assert suggest_package("dig", "pacman") == ("bind", "pacman -S --noconfirm bind")
+    assert suggest_package("htop", "unknown") == ("htop", None)
+    
+    # The generator regenerates once with feedback, then leaves it to validation
+    overrides = {"AI_BASH_NO_CACHE": "1", "AI_BASH_NO_INTENTS": "1", "AI_BASH_NO_SIMILAR": "1",
+                 "AI_BASH_LLM_RETRIES": "0"}
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    try:
+        from llm_openai import OpenAICompatibleGenerator
+        with MockLLMServer(responses={"cpu": "nosuch-cpu-tool --cores"}) as server:
+            generator = OpenAICompatibleGenerator(get_system_context(), base_url=server.url)
+            assert generator.generate_command("cpu cores") == "nosuch-cpu-tool --cores"
+            assert server.stats()["requests"] == 2
+            assert generator.generate_command("memory") == "ls -la"
+            assert server.stats()["requests"] == 3
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    
+    print("\n✓ Executable index working")
+    return True
+
+
+def test_linear_matching():
+    """Test normalization and that adversarial commands validate in linear time."""
+    print("\n" + "=" * 60)
+    print("LINEAR-TIME MATCHING")
+    print("=" * 60)
+    
+    assert normalize_command("  CHOWN  -R\tuser \n\n /  ") == "chown -r user\n/"
+    assert is_dangerous_command("chown   -R user   /")
+    assert is_dangerous_command("chmod -R 777 \t /")
+    assert not is_dangerous_command("chmod 777 x\n/")  # . does not cross lines
+    assert find_dangerous_matches("cd /tmp;  rm  -rf   /usr")[0].text == "rm -rf /usr"
+    
+    from benchmark import ADVERSARIAL_CASES, run_redos_benchmark
+    
+    results = run_redos_benchmark(sizes=[4096, 32768], repeats=3)["redos"]
+    for name, case in results.items():
+        print(f"  {name:<18} {case['rows'][-1]['ms']:7.2f} ms at 32 KB, "
+              f"growth {case['growth']:.2f}x")
+        # Quadratic matching would grow 8x faster than the input here
+        assert case["growth"] < 3, name
+        assert case["rows"][-1]["ms"] < 500, name
+    assert set(results) == set(ADVERSARIAL_CASES)
+    
+    print("\n✓ Linear-time matching working")
+    return True
+
+
+def test_history_store():
+    """Test history recording, batched writes and recall."""
+    print("\n" + "=" * 60)
+    print("COMMAND HISTORY")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.db")
+        with HistoryStore(path, flush_interval=0.05) as store:
+            start = time.perf_counter()
+            store.record("find big files in home", "find ~ -size +100M", True, "ok", 0, 1.5)
+            store.record("restart nginx", "systemctl restart nginx", True, "ok", 1, 0.2)
+            store.record("wipe the disk", "ERROR: Unsafe or ambiguous request", False, "blocked")
+            store.record("show big files", "find ~ -size +100M", True, "ok")
+            # record() only queues; it must not wait for the disk
+            assert time.perf_counter() - start < 0.05
+            store.flush()
+            
+            assert [e.request for e in store.search("big fi")] == ["show big files"]
+            assert store.prefix("restart")[0].command == "systemctl restart nginx"
+            assert store.recall("!").request == "show big files"
+            assert store.recall("2").exit_status == 1
+            assert store.recall("nginx").command == "systemctl restart nginx"
+            assert store.recall("no such thing") is None
+            assert not store.get(3).safe
+            for entry in store.recent(3):
+                print(format_entry(entry))
+        
+        # Persisted across sessions
+        with HistoryStore(path) as store:
+            assert store.recent_requests(2) == ["show big files", "wipe the disk"]
+    
+    from benchmark import run_history_benchmark
+    results = run_history_benchmark(entries=5000, lookups=50)
+    print(f"\n  5000 entries: search p50 {results['lookups']['search']['p50']:.2f} ms")
+    assert results["lookups"]["search"]["p50"] < 50
+    
+    print("\n✓ Command history working")
+    return True
+
+
+def test_generation_cache():
+    """Test LRU/TTL generation cache and its persistence."""
+    print("\n" + "=" * 60)
+    print("GENERATION CACHE")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "generations.json")
+        context = {"kernel": "6.1", "distro": "ubuntu", "pkg_manager": "apt"}
+        key = make_key(normalize_request("Show  DISK usage"), context, "m", "p")
+        assert key == make_key(normalize_request("show disk usage"), context, "m", "p")
+        
+        cache = GenerationCache(path, max_entries=2, ttl=60)
+        cache.put(key, "df -h")
+        cache.put("b", "ls")
+        assert cache.get(key) == "df -h"
+        cache.put("c", "pwd")  # evicts "b", the least recently used
+        assert cache.get("b") is None
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+        
+        reloaded = GenerationCache(path, max_entries=2, ttl=60)
+        assert reloaded.get(key) == "df -h"
+        
+        expired = GenerationCache(path, max_entries=2, ttl=0.01)
+        time.sleep(0.02)
+        assert expired.get("c") is None
+    
+    print("\n✓ Generation cache working")
+    return True
+
+
+def test_streaming_execution():
+    """Test streaming execution keeps a bounded tail and enforces the cap."""
+    print("\n" + "=" * 60)
+    print("STREAMING EXECUTION")
+    print("=" * 60)
+    
+    relayed = io.StringIO()
+    success, output, error = stream_command("echo hello", stdout=relayed)
+    assert success and output == "hello\n" and relayed.getvalue() == "hello\n"
+    
+    success, output, error = stream_command(
+        "head -c 200000 /dev/zero | tr '\\0' x", stdout=io.StringIO(), tail_size=100
+    )
+    assert success and output.endswith("x" * 100) and "earlier bytes not kept" in output
+    
+    success, output, error = stream_command(
+        "yes", stdout=io.StringIO(), max_output=100000, tail_size=100
+    )
+    assert not success and "Output exceeded" in error
+    
+    print("\n✓ Streaming execution working")
+    return True
+
+
+def test_resource_limits():
+    """Test rlimits, process group kill on timeout and usage reporting."""
+    print("\n" + "=" * 60)
+    print("RESOURCE LIMITS")
+    print("=" * 60)
+    
+    import sys
+    limits = NO_LIMITS._replace(cpu=1, open_files=32, nice=5)
+    result = run_command("ulimit -n; nice", limits=limits)
+    print(f"  ulimit -n, nice -> {result.output.split()}")
+    assert result.output.split() == ["32", str(os.nice(0) + 5)]
+    
+    # Without prlimit and nice the Python wrapper sets them before exec
+    which = executor.shutil.which
+    executor.shutil.which = lambda name: None if name in ("prlimit", "nice") else which(name)
+    try:
+        assert limits.wrap(["bash"])[:2] == [sys.executable, "-c"]
+        result = run_command("ulimit -n; nice", limits=limits)
+        assert result.output.split() == ["32", str(os.nice(0) + 5)]
+    finally:
+        executor.shutil.which = which
+    
+    result = run_command("while :; do :; done", limits=limits, timeout=10)
+    print(f"  busy loop -> {result.error}")
+    assert not result.success and "CPU limit of 1 seconds" in result.error
+    assert 0.5 < result.usage.cpu_time < 5
+    
+    result = run_command(f"{sys.executable} -c 'bytearray(1024 ** 3)'",
+                         limits=NO_LIMITS._replace(memory=512 * 1024 * 1024))
+    assert not result.success and "MemoryError" in result.error
+    
+    touch_64m = "b = bytearray(64 * 1024 * 1024); b[::4096] = bytes(len(b) // 4096)"
+    result = run_command(f"{sys.executable} -c '{touch_64m}'", limits=NO_LIMITS)
+    print(f"  64 MiB allocation -> max RSS {result.usage.max_rss // (1024 * 1024)} MiB")
+    assert result.success and result.usage.max_rss >= 64 * 1024 * 1024
+    
+    # Timeout kills background jobs too, not only the shell
+    with tempfile.TemporaryDirectory() as tmp:
+        pid_file = os.path.join(tmp, "pid")
+        result = run_command(f"sleep 30 & echo $! > {pid_file}; wait", timeout=0.5,
+                             limits=NO_LIMITS)
+        assert not result.success and "timed out" in result.error
+        with open(pid_file) as f:
+            pid = int(f.read())
+        time.sleep(0.2)
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                state = f.read().rsplit(")", 1)[1].split()[0]
+        except OSError:
+            state = "gone"
+        assert state in ("gone", "Z")
+    
+    # Closing its output does not let a command outlive the timeout
+    started = time.monotonic()
+    result = run_command("exec >&- 2>&-; sleep 30", timeout=0.5, limits=NO_LIMITS)
+    assert not result.success and "timed out" in result.error
+    assert time.monotonic() - started < 2
+    
+    with ShellSession(limits=limits) as session:
+        assert session.run("ulimit -n", relay=False).output == "32\n"
+        result = session.run(f"{sys.executable} -c 'sum(range(3 * 10 ** 6))'", relay=False)
+        assert result.success and result.usage.cpu_time > 0
+    
+    print("\n✓ Resource limits working")
+    return True
+
+
+def test_shell_session():
+    """Test the persistent shell session keeps state and survives timeouts."""
+    print("\n" + "=" * 60)
+    print("SHELL SESSION")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as tmp, ShellSession() as session:
+        result = session.run(f"cd {tmp} && export AI_BASH_TEST=kept", relay=False)
+        assert result.success and result.cwd == os.path.realpath(tmp)
+        
+        result = session.run("echo $AI_BASH_TEST; false", relay=False)
+        assert result.output == "kept\n" and result.returncode == 1
+        
+        result = session.run("sleep 5", timeout=0.3, relay=False)
+        assert not result.success and "timed out" in result.error
+        
+        # The shell survived the timeout with its state intact
+        result = session.run("echo $AI_BASH_TEST", relay=False)
+        assert result.output == "kept\n" and result.cwd == os.path.realpath(tmp)
+        
+        # The job's peak RSS is reported although the shell reaps it
+        allocate = "import time; data = b'x' * (64 << 20); time.sleep(0.3)"
+        result = session.run(f"{shlex.quote(sys.executable)} -c {shlex.quote(allocate)}",
+                             relay=False)
+        print(f"  64 MiB job -> {format_usage(result.usage)}")
+        assert result.success and result.usage.max_rss >= 64 << 20
+    
+    print("\n✓ Shell session working")
+    return True
+
+
+def test_distro_mapping():
+    """Test native os-release parsing and package manager mapping."""
+    print("\n" + "=" * 60)
+    print("DISTRO MAPPING")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "os-release")
+        with open(path, "w") as f:
+            f.write('# comment\nID=opensuse-tumbleweed\nID_LIKE="opensuse suse"\n'
+                    'PRETTY_NAME="openSUSE \\"Tumbleweed\\""\n')
+        release = parse_os_release(path)
+    assert release["ID"] == "opensuse-tumbleweed"
+    assert release["ID_LIKE"] == "opensuse suse"
+    assert release["PRETTY_NAME"] == 'openSUSE "Tumbleweed"'
+    
+    cases = [
+        ("opensuse-tumbleweed", ["opensuse", "suse"], set(), "zypper"),
+        ("arch", [], {"pacman"}, "pacman"),
+        ("alpine", [], set(), "apk"),
+        ("amzn", ["centos", "rhel", "fedora"], {"yum"}, "yum"),
+        ("fedora", [], {"dnf", "yum"}, "dnf"),
+        ("linuxmint", ["ubuntu", "debian"], {"apt"}, "apt"),
+        ("custom", [], {"apk"}, "apk"),
+        ("custom", [], set(), "unknown"),
+    ]
+    for distro, like, available, expected in cases:
+        got = choose_pkg_manager(distro, like, available)
+        print(f"  {distro} {like} -> {got}")
+        assert got == expected
+    
+    print("\n✓ Distro mapping working")
+    return True
+
+
+def test_intent_engine():
+    """Test local intent templates, slot extraction and user templates."""
+    print("\n" + "=" * 60)
+    print("LOCAL INTENT ENGINE")
+    print("=" * 60)
+    
+    ubuntu = IntentEngine({"distro": "ubuntu", "pkg_manager": "apt", "tools": ["ss"]},
+                          template_file="")
+    alpine = IntentEngine({"distro": "alpine", "pkg_manager": "apk", "tools": []},
+                          template_file="")
+    
+    cases = [
+        (ubuntu, "install nginx", "apt install -y nginx"),
+        (alpine, "Please install nginx.", "apk add nginx"),
+        (ubuntu, "find files larger than 500MB in home directory",
+         "find ~ -type f -size +500M 2>/dev/null || true"),
+        (ubuntu, "list files in home", "ls -la ~"),
+        (ubuntu, "list files in /home", "ls -la /home"),
+        (ubuntu, "move into /var/log directory", "cd /var/log"),
+        (ubuntu, "show the last 20 lines of /var/log/syslog", "tail -n 20 /var/log/syslog"),
+        (ubuntu, "what is using port 8080", "ss -tulpn | grep -w ':8080' || true"),
+        (alpine, "what is using port 8080", None),  # no ss/netstat/lsof
+        (ubuntu, "restart nginx", None),
+        (ubuntu, "install nginx; rm -rf /", None),
+        (ubuntu, "install the python3-pip package", "apt install -y python3-pip"),
+    ]
+    # Words that fit the package slot but name no package go to the LLM
+    for word in ("updates", "upgrades", "it", "all", "dependencies", "requirements"):
+        assert ubuntu.match(f"install {word}") is None, word
+        assert ubuntu.match(f"install the {word}") is None, word
+    for engine, request, expected in cases:
+        matched = engine.match(request)
+        got = matched[1] if matched else None
+        print(f"  {request} -> {got}")
+        assert got == expected
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "intents.json")
+        with open(path, "w") as f:
+            f.write('[{"name": "restart", "keywords": ["restart"], '
+                    '"patterns": ["restart {package}"], '
+                    '"commands": {"systemd": "systemctl restart {package}"}}]')
+        custom = IntentEngine({"pkg_manager": "apt", "init_system": "systemd"},
+                              template_file=path)
+    assert custom.match("restart nginx") == ("restart", "systemctl restart nginx")
+    
+    print("\n✓ Intent engine working")
+    return True
+
+
+def test_similarity_index():
+    """Test paraphrase lookup and persistence of the similarity index."""
+    print("\n" + "=" * 60)
+    print("SIMILARITY INDEX")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "similar.jsonl")
+        index = SimilarityIndex(path)
+        index.add("show big files in home", "find /home -type f -size +100M 2>/dev/null || true")
+        index.add("install nginx", "apt install -y nginx")
+        index.add("restart the nginx service", "systemctl restart nginx")
+        
+        found = index.lookup("find large files in ~", threshold=0.85)
+        print(f"  find large files in ~ -> {found}")
+        assert found is not None and found[1] == "show big files in home"
+        
+        # Different package: shared verb alone must not be enough
+        assert index.lookup("install apache2", threshold=0.85) is None
+        
+        # Another path, or a negation, needs another command
+        index.add("delete all log files in /var/log", "rm /var/log/*.log")
+        index.add("show files modified today", "find . -mtime 0")
+        assert index.lookup("show big files in /var") is None
+        assert index.lookup("show big files in /home/alice") is None
+        assert index.lookup("do not delete all log files in /var/log") is None
+        assert index.lookup("show files not modified today") is None
+        assert index.lookup("remove log files in /var/log")[2] == "rm /var/log/*.log"
+        
+        # Common verbs get a low IDF, but they still decide the command
+        for n in range(60):
+            for verb in ("start", "stop", "restart"):
+                index.add(f"{verb} unit{n} service", f"systemctl {verb} unit{n}")
+        index.add("restart nginx service", "systemctl restart nginx")
+        assert index.lookup("stop nginx service") is None
+        assert index.lookup("start nginx service") is None
+        assert index.lookup("please restart the nginx service")[2] == "systemctl restart nginx"
+        assert index.lookup("erase log files in /var/log")[2] == "rm /var/log/*.log"
+        
+        # Scores do not depend on the order entries were added in
+        for n in range(200):
+            index.add(f"check service unit{n} status", f"systemctl status unit{n}")
+        reloaded = SimilarityIndex(path)
+        assert len(reloaded) == len(index) == 386
+        for query in ("find large files in ~", "show modified files", "install nginx now"):
+            live, fresh = index.lookup(query, threshold=0), reloaded.lookup(query, threshold=0)
+            assert live[1:] == fresh[1:] and abs(live[0] - fresh[0]) < 1e-9, query
+        assert reloaded.lookup("Install nginx")[2] == "apt install -y nginx"
+    
+    print("\n✓ Similarity index working")
+    return True
+
+
+class FakeBackend(CommandGenerator):
+    """
+    Scripted backend. `replies` maps a model name to its answer, or to a
+    function(prompt, timeout) returning it (or raising).
+    """
+    
+    backend = "fake"
+    
+    def __init__(self, system_context, replies, hedge_models=(), chunks=None):
+        super().__init__(system_context)
+        self.replies = replies
+        self.model_name = next(iter(replies))
+        self.hedge_models = list(hedge_models)
+        self.chunks = chunks
+        self.calls = []
+        self.streamed = []
+        self.stream_closed = False
+    
+    def _complete(self, model_name, prompt, timeout):
+        self.calls.append(model_name)
+        reply = self.replies[model_name]
+        return reply(prompt, timeout) if callable(reply) else reply
+    
+    def _complete_stream(self, model_name, prompt, timeout):
+        self.calls.append(model_name)
+        try:
+            for chunk in self.chunks:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                self.streamed.append(chunk)
+                yield chunk
+        finally:
+            self.stream_closed = True
+
+
+class _environment:
+    """Set environment variables for a block, restoring them afterwards."""
+    
+    OFFLINE = {"AI_BASH_NO_CACHE": "1", "AI_BASH_NO_INTENTS": "1", "AI_BASH_NO_SIMILAR": "1"}
+    
+    def __init__(self, **overrides):
+        self.overrides = dict(self.OFFLINE, **overrides)
+    
+    def __enter__(self):
+        self.saved = {name: os.environ.get(name) for name in self.overrides}
+        os.environ.update(self.overrides)
+    
+    def __exit__(self, *exc_info):
+        for name, value in self.saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def test_hedged_generation():
+    """Test hedging to the next model, jittered retries and the hedge deadline."""
+    print("\n" + "=" * 60)
+    print("HEDGED GENERATION")
+    print("=" * 60)
+    
+    context = get_system_context()
+    
+    def slow(prompt, timeout):
+        time.sleep(1)
+        return "df -h"
+    
+    def broken(prompt, timeout):
+        raise ValueError("bad request")
+    
+    with _environment(AI_BASH_HEDGE_DELAY="0.1", AI_BASH_LLM_RETRIES="0"):
+        # A slow primary is hedged to the next model after the delay
+        generator = FakeBackend(context, {"a": slow, "b": "nproc"}, hedge_models=["b"])
+        started = time.monotonic()
+        assert generator.generate_command("cpu count") == "nproc"
+        elapsed = time.monotonic() - started
+        print(f"  slow primary -> {generator.calls} in {elapsed:.2f}s")
+        assert generator.calls == ["a", "b"] and elapsed < 0.8
+        
+        # A failed primary is hedged at once, even with no call still pending
+        generator = FakeBackend(context, {"a": broken, "b": "nproc"}, hedge_models=["b"])
+        assert generator.generate_command("cpu count") == "nproc"
+        assert generator.calls == ["a", "b"]
+        
+        generator = FakeBackend(context, {"a": broken, "b": broken}, hedge_models=["b"])
+        command = generator.generate_command("cpu count")
+        print(f"  every model failing -> {command}")
+        assert command == "ERROR: Failed to generate command - bad request"
+        assert generator.calls == ["a", "b"]
+        
+        # The hedge delay follows the primary's recent latency percentile
+        generator = FakeBackend(context, {"a": "nproc"})
+        assert generator._hedge_delay() == 0.1
+        for _ in range(20):
+            generator.latency.record("a", 0.4)
+        generator.latency.record("a", 3.0)
+        assert generator._hedge_delay() == 0.4
+        generator = FakeBackend(context, {"a": "nproc"})
+        for _ in range(10):
+            generator.latency.record("a", 0.01)
+        assert generator._hedge_delay() == llm_backend.MIN_HEDGE_DELAY
+    
+    # Transient errors are retried after full-jitter exponential backoff
+    class ServiceUnavailable(Exception):
+        pass
+    
+    attempts = []
+    
+    def flaky(prompt, timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise ServiceUnavailable("overloaded")
+        return "nproc"
+    
+    backoff = []
+    uniform = llm_backend.random.uniform
+    llm_backend.random.uniform = lambda low, high: backoff.append((low, high)) or 0.0
+    try:
+        with _environment(AI_BASH_LLM_RETRIES="2"):
+            generator = FakeBackend(context, {"a": flaky})
+            assert generator.generate_command("cpu count") == "nproc"
+            print(f"  transient errors -> backoff ranges {backoff}")
+            assert backoff == [(0, 0.5), (0, 1.0)] and len(attempts) == 3
+            assert generator.latency_stats()["a"]["count"] == 1
+            
+            attempts.clear()
+            with _environment(AI_BASH_LLM_RETRIES="1"):
+                generator = FakeBackend(context, {"a": flaky})
+                assert generator.generate_command("cpu count").startswith("ERROR:")
+                assert len(attempts) == 2
+    finally:
+        llm_backend.random.uniform = uniform
+    
+    print("\n✓ Hedged generation working")
+    return True
+
+
+def test_async_generation():
+    """Test generate_many(): input order, concurrency and per-request timeouts."""
+    print("\n" + "=" * 60)
+    print("ASYNC GENERATION")
+    print("=" * 60)
+    
+    context = get_system_context()
+    running = []
+    peak = []
+    lock = threading.Lock()
+    
+    def numbered(prompt, timeout):
+        # Later requests answer sooner, so completion order is reversed
+        number = int(re.search(r"step (\d+)", prompt).group(1))
+        with lock:
+            running.append(number)
+            peak.append(len(running))
+        time.sleep((20 - number) * 0.02)
+        with lock:
+            running.remove(number)
+        return f"echo {number}"
+    
+    with _environment():
+        generator = FakeBackend(context, {"a": numbered})
+        commands = generator.generate_batch([f"step {n}" for n in range(12)], concurrency=4)
+        assert commands == [f"echo {n}" for n in range(12)]
+        assert max(peak) == 4
+        
+        # Concurrency is not capped by the generator's shared pool
+        def second(prompt, timeout):
+            with lock:
+                running.append(prompt)
+                peak.append(len(running))
+            time.sleep(1)
+            with lock:
+                running.remove(prompt)
+            return "nproc"
+        
+        peak.clear()
+        generator = FakeBackend(context, {"a": second})
+        started = time.monotonic()
+        commands = generator.generate_batch([f"cpu {n}" for n in range(20)], concurrency=20,
+                                            timeout=1.5)
+        elapsed = time.monotonic() - started
+        print(f"  20 x 1s at concurrency 20 -> {elapsed:.2f}s, peak {max(peak)}")
+        assert commands == ["nproc"] * 20 and max(peak) == 20 and elapsed < 1.45
+        
+        # Time spent queued for a pool thread does not count against the timeout
+        async def queued():
+            return await asyncio.gather(*(
+                generator.generate_command_async(f"cpu {n}", timeout=1.5)
+                for n in range(llm_backend.DEFAULT_CONCURRENCY + 4)))
+        assert asyncio.run(queued()) == ["nproc"] * (llm_backend.DEFAULT_CONCURRENCY + 4)
+        
+        command = generator.generate_batch(["cpu"], timeout=0.2)[0]
+        print(f"  1s answer, 0.2s timeout -> {command}")
+        assert command == "ERROR: Failed to generate command - timed out after 0.2 seconds"
+    
+    print("\n✓ Async generation working")
+    return True
+
+
+class NativeAsyncBackend(FakeBackend):
+    """FakeBackend with a native async client that never touches a thread pool."""
+    
+    def __init__(self, system_context, replies, delay):
+        super().__init__(system_context, replies)
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+        self.threads = set()
+    
+    def _complete(self, model_name, prompt, timeout):
+        raise AssertionError("native async backend fell back to the thread pool")
+    
+    async def _complete_async(self, model_name, prompt, timeout, executor=None):
+        self.calls.append(model_name)
+        self.threads.add(threading.current_thread().name)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.wait_for(asyncio.sleep(self.delay), timeout)
+        finally:
+            self.in_flight -= 1
+        reply = self.replies[model_name]
+        return reply(prompt, timeout) if callable(reply) else reply
+
+
+def test_native_async_generation():
+    """Test generate_command_async() on native async backends, caching and retries."""
+    print("\n" + "=" * 60)
+    print("NATIVE ASYNC GENERATION")
+    print("=" * 60)
+    
+    import types
+    import llm_gemini
+    
+    context = get_system_context()
+    with _environment(), tempfile.TemporaryDirectory() as tmp:
+        # Native calls run on the event loop, all at once
+        generator = NativeAsyncBackend(context, {"a": "uptime"}, delay=0.3)
+        started = time.monotonic()
+        commands = generator.generate_batch([f"load {n}" for n in range(30)], concurrency=30)
+        elapsed = time.monotonic() - started
+        print(f"  30 x 0.3s native calls -> {elapsed:.2f}s, peak {generator.peak}")
+        assert commands == ["uptime"] * 30 and generator.peak == 30 and elapsed < 0.6
+        assert generator.threads == {threading.current_thread().name}
+        
+        generator.delay = 1
+        command = generator.generate_batch(["load"], timeout=0.2)[0]
+        assert command == "ERROR: Failed to generate command - timed out after 0.2 seconds"
+        
+        # A cached answer skips the model
+        generator = FakeBackend(context, {"a": "df -h"})
+        generator.cache = GenerationCache(os.path.join(tmp, "generations.json"))
+        assert asyncio.run(generator.generate_command_async("disk space")) == "df -h"
+        assert asyncio.run(generator.generate_command_async("disk space")) == "df -h"
+        assert generator.calls == ["a"] and generator.last_source == "cache"
+        
+        # Missing executables get one regeneration with feedback
+        def answer(prompt, timeout):
+            return "ls -la" if "not installed" in prompt else "frobnicate --all"
+        generator = FakeBackend(context, {"a": answer})
+        assert asyncio.run(generator.generate_command_async("list files")) == "ls -la"
+        assert generator.calls == ["a", "a"]
+        
+        # Gemini awaits generate_content_async() instead of using a pool thread
+        class FakeModel:
+            def __init__(self, model_name):
+                self.model_name = model_name
+            
+            def generate_content(self, prompt, **kwargs):
+                raise AssertionError("Gemini native async fell back to the thread pool")
+            
+            async def generate_content_async(self, prompt, request_options):
+                await asyncio.sleep(1 if "slow" in prompt else 0.2)
+                return types.SimpleNamespace(text="`uptime`")
+        
+        fake_genai = types.SimpleNamespace(configure=lambda api_key: None,
+                                           GenerativeModel=FakeModel)
+        saved, llm_gemini.genai = llm_gemini.genai, fake_genai
+        try:
+            with _environment(AI_BASH_CACHE_DIR=tmp):
+                gemini = llm_gemini.GeminiCommandGenerator(context, api_key="test",
+                                                           model_name="models/fake")
+                started = time.monotonic()
+                commands = gemini.generate_batch([f"load {n}" for n in range(20)],
+                                                 concurrency=20)
+                elapsed = time.monotonic() - started
+                print(f"  Gemini, 20 x 0.2s -> {elapsed:.2f}s")
+                assert commands == ["uptime"] * 20 and elapsed < 0.5
+                command = gemini.generate_batch(["slow load"], timeout=0.2)[0]
+                assert command == "ERROR: Failed to generate command - timed out after 0.2 seconds"
+        finally:
+            llm_gemini.genai = saved
+    
+    print("\n✓ Native async generation working")
+    return True
+
+
+def test_streaming_generation():
+    """Test generate_command_stream() stopping early and abandoning the response."""
+    print("\n" + "=" * 60)
+    print("STREAMING GENERATION")
+    print("=" * 60)
+    
+    context = get_system_context()
+    with _environment():
+        # The first complete line ends the stream; the rest is never read
+        generator = FakeBackend(context, {"a": "unused"},
+                                chunks=["df", " -h", "\nThis shows", " disk usage", "\n"])
+        updates = []
+        assert generator.generate_command_stream("disk space", on_update=updates.append) == "df -h"
+        print(f"  read {generator.streamed} -> {updates}")
+        assert generator.streamed == ["df", " -h", "\nThis shows"]
+        assert updates == ["df", "df -h"] and generator.stream_closed
+        
+        # A refusal is recognised from its prefix, without flashing it
+        generator = FakeBackend(context, {"a": "unused"},
+                                chunks=["ERR", "OR: that would", " wipe the disk", "\n"])
+        updates = []
+        command = generator.generate_command_stream("wipe", on_update=updates.append)
+        assert command == llm_backend.REFUSAL
+        assert generator.streamed == ["ERR", "OR: that would"] and updates == []
+        assert generator.stream_closed
+        
+        # A dangerous match that more text cannot undo stops the stream
+        generator = FakeBackend(context, {"a": "unused"},
+                                chunks=["rm -rf / ", "&& echo", " done", "\n"])
+        command = generator.generate_command_stream("clean up")
+        print(f"  dangerous partial -> {command!r} after {len(generator.streamed)} chunks")
+        assert generator.streamed == ["rm -rf / ", "&& echo"] and generator.stream_closed
+        assert not validate_command(command)[0]
+        
+        # A failure before any text falls back to the non-streaming path
+        generator = FakeBackend(context, {"a": "uptime"},
+                                chunks=[ConnectionError("connection reset")])
+        assert generator.generate_command_stream("load") == "uptime"
+        assert generator.calls == ["a", "a"]
+        
+        # ... but not once text has been shown
+        generator = FakeBackend(context, {"a": "uptime"},
+                                chunks=["up", ConnectionError("connection reset")])
+        command = generator.generate_command_stream("load")
+        assert command == "ERROR: Failed to generate command - connection reset"
+        assert generator.calls == ["a"] and generator.stream_closed
+    
+    print("\n✓ Streaming generation working")
+    return True
+
+
+class ScriptedGenerator:
+    """Generator stand-in answering from a request -> command dict."""
+    
+    def __init__(self, commands, delay=0.0):
+        self.commands = commands
+        self.delay = delay
+        self.requests = []
+    
+    def generate_command(self, request):
+        self.requests.append(request)
+        time.sleep(self.delay)
+        return self.commands[request]
+
+
+def test_batch_mode():
+    """Test run_batch(): records, order, skipped lines, pipelining and exit codes."""
+    print("\n" + "=" * 60)
+    print("BATCH MODE")
+    print("=" * 60)
+    
+    import json
+    import cli
+    
+    lines = ["# provisioning\n", "cpu count\n", "\n", "  wipe  \n", "say hi"]
+    generator = ScriptedGenerator({"cpu count": "nproc", "wipe": "rm -rf /", "say hi": "echo hi"})
+    out = io.StringIO()
+    assert not cli.run_batch(generator, lines, out)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    print(f"  {records[0]}")
+    assert [r["line"] for r in records] == [2, 4, 5]
+    assert [r["request"] for r in records] == ["cpu count", "wipe", "say hi"]
+    assert set(records[0]) == {"line", "request", "command", "safe", "message", "executed"}
+    assert records[0]["command"] == "nproc" and records[0]["safe"]
+    assert not records[1]["safe"] and records[1]["message"].startswith("ERROR:")
+    assert not any(r["executed"] for r in records)
+    
+    # Generation of the next requests overlaps execution of the current one
+    steps = {f"step {n}": f"sleep 0.2; echo {n}" for n in range(5)}
+    generator = ScriptedGenerator(steps, delay=0.2)
+    out = io.StringIO()
+    started = time.monotonic()
+    assert cli.run_batch(generator, [f"step {n}\n" for n in range(5)], out, execute=True)
+    elapsed = time.monotonic() - started
+    print(f"  5 x (0.2s generate + 0.2s run) -> {elapsed:.2f}s")
+    assert elapsed < 1.6
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r["output"] for r in records] == [f"{n}\n" for n in range(5)]
+    assert all(r["executed"] and r["success"] and r["returncode"] == 0 for r in records)
+    assert {"error", "cpu_time", "max_rss"} <= set(records[0])
+    
+    out = io.StringIO()
+    assert not cli.run_batch(ScriptedGenerator({"fail": "false"}), ["fail"], out, execute=True)
+    assert json.loads(out.getvalue())["returncode"] == 1
+    
+    # batch_main() exits 0 only if every command was safe
+    create_generator = cli.create_generator
+    with tempfile.TemporaryDirectory() as tmp:
+        source, target = os.path.join(tmp, "requests.txt"), os.path.join(tmp, "out.jsonl")
+        try:
+            for commands, code in (({"cpu count": "nproc"}, 0), ({"cpu count": "rm -rf /"}, 1)):
+                cli.create_generator = lambda context: ScriptedGenerator(commands)
+                with open(source, "w") as f:
+                    f.write("# one request\ncpu count\n")
+                args = cli.parse_args(["--batch", source, "--output", target])
+                assert cli.batch_main(args) == code
+                with open(target) as f:
+                    assert json.loads(f.read())["line"] == 2
+        finally:
+            cli.create_generator = create_generator
+    
+    print("\n✓ Batch mode working")
+    return True
+
+
+def test_startup_warmup():
+    """Test GeneratorWarmup overlapping backend start-up with context detection."""
+    print("\n" + "=" * 60)
+    print("STARTUP WARM-UP")
+    print("=" * 60)
+    
+    import cli
+    
+    class SlowBackend:
+        def preload(self):
+            time.sleep(0.2)
+    
+    def build(context):
+        time.sleep(0.1)
+        return ("generator", context)
+    
+    def refuse(context):
+        raise ValueError("GEMINI_API_KEY environment variable not set")
+    
+    load_backend, create_generator = llm_backend.load_backend, cli.create_generator
+    llm_backend.load_backend = lambda: SlowBackend()
+    try:
+        cli.create_generator = build
+        profile = cli.StartupProfile(enabled=True)
+        started = time.monotonic()
+        warmup = cli.GeneratorWarmup(profile)
+        with profile.phase("system context"):
+            time.sleep(0.2)
+        assert not warmup.ready  # still waiting for the context
+        warmup.set_context("linux")
+        assert warmup.result() == ("generator", "linux")
+        elapsed = time.monotonic() - started
+        print(f"  0.2s import || 0.2s context, then 0.1s init -> {elapsed:.2f}s")
+        assert warmup.ready and elapsed < 0.45
+        
+        phases = {name: thread for name, thread, _, _ in profile.phases}
+        assert phases == {"import backend": "warmup", "generator init": "warmup",
+                          "system context": threading.current_thread().name}
+        report = io.StringIO()
+        profile.report(report)
+        print(report.getvalue())
+        rows = report.getvalue().splitlines()[3:]
+        assert rows[-1].split()[:2] == ["generator", "init"]
+        assert {row.split()[0] for row in rows} == {"import", "system", "generator"}
+        
+        cli.create_generator = refuse
+        warmup = cli.GeneratorWarmup(cli.StartupProfile())
+        warmup.set_context("linux")
+        try:
+            warmup.result()
+            assert False, "construction error was swallowed"
+        except ValueError as e:
+            print(f"  result() re-raised: {e}")
+        assert warmup.ready and warmup.generator is None
+    finally:
+        llm_backend.load_backend, cli.create_generator = load_backend, create_generator
+    
+    print("\n✓ Startup warm-up working")
+    return True
+
+
+def test_openai_backend():
+    """Test the OpenAI-compatible backend against the bundled mock server."""
+    print("\n" + "=" * 60)
+    print("OPENAI-COMPATIBLE BACKEND")
+    print("=" * 60)
+    
+    from llm_openai import OpenAICompatibleGenerator
+    
+    overrides = {"AI_BASH_NO_CACHE": "1", "AI_BASH_NO_INTENTS": "1", "AI_BASH_NO_SIMILAR": "1",
+                   "AI_BASH_LLM_RETRIES": "0"}
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    try:
+        context = get_system_context()
+        with MockLLMServer(fence=True) as server:
+            generator = OpenAICompatibleGenerator(context, base_url=server.url)
+            command = generator.generate_command("how many cpu cores")
+            print(f"  cpu cores -> {command}")
+            assert command == "nproc"
+            
+            updates = []
+            assert generator.generate_command_stream("check disk", on_update=updates.append) == "df -h"
+            assert updates[-1] == "df -h"
+            
+            assert generator.generate_batch(["cpu"] * 20) == ["nproc"] * 20
+            # Keep-alive: connections are reused, not opened per request
+            assert generator.connections.created < 20
+            print(f"  {server.stats()['requests']} requests over {generator.connections.created} connections")
+        
+        with MockLLMServer(error_rate=1.0) as server:
+            generator = OpenAICompatibleGenerator(context, base_url=server.url)
+            command = generator.generate_command("cpu")
+            print(f"  failing server -> {command}")
+            assert command.startswith("ERROR:") and "503" in command
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    
+    print("\n✓ OpenAI-compatible backend working")
+    return True
+
+
+def test_benchmark_harness():
+    """Test a short benchmark run and the baseline comparison."""
+    print("\n" + "=" * 60)
+    print("BENCHMARK HARNESS")
+    print("=" * 60)
+    
+    from benchmark import compare, run_benchmark
+    
+    results = run_benchmark(requests=5, warmup=1, startup_runs=0, llm_latency="fixed:0")
+    print(f"  total p50: {results['stages']['total']['p50']:.2f} ms")
+    assert results["failures"] == 0
+    assert all(results["stages"][stage]["count"] == 5 for stage in results["stages"])
+    assert compare(results, results) == []
+    
+    # Against a baseline twice as fast, generate has regressed
+    faster = {"stages": {"generate": {"p50": results["stages"]["generate"]["p50"] / 2}}}
+    assert any(r.startswith("generate p50") for r in compare(results, faster, threshold=0.2))
+    
+    print("\n✓ Benchmark harness working")
+    return True
+
+
+def test_metrics():
+    """Test span tracing and the Prometheus text file."""
+    print("\n" + "=" * 60)
+    print("METRICS")
+    print("=" * 60)
+    
+    import json
+    import metrics
+    
+    assert metrics.span("detect") is metrics.span("generate")  # shared no-op while off
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_path = os.path.join(tmp, "trace.jsonl")
+        prom_path = os.path.join(tmp, "ai_bash.prom")
+        try:
+            metrics.configure(trace_path, prom_path)
+            with metrics.span("generate", backend="test"):
+                with metrics.span("llm"):
+                    pass
+            metrics.incr("cache_hits", source="intent")
+            metrics.flush()
+            
+            # A second process adds to the totals instead of replacing them
+            metrics.configure(trace_path, prom_path)
+            metrics.incr("cache_hits", source="intent")
+            metrics.incr("blocked_commands")
+            metrics.flush()
+        finally:
+            metrics.configure()
+        
+        with open(trace_path) as f:
+            spans = {record["span"]: record for record in map(json.loads, f)}
+        assert spans["llm"]["parent"] == spans["generate"]["id"]
+        assert spans["generate"]["attrs"] == {"backend": "test"}
+        
+        with open(prom_path) as f:
+            text = f.read()
+        print("  " + "\n  ".join(text.strip().splitlines()[:4]))
+        assert 'ai_bash_cache_hits_total{source="intent"} 2' in text
+        assert "ai_bash_blocked_commands_total 1" in text
+        assert 'ai_bash_stage_seconds_count{stage="llm"} 1' in text
+        assert "# TYPE ai_bash_stage_seconds summary" in text
+    
+    print("\n✓ Metrics working")
+    return True
+
+
+def test_cost_analysis():
+    """Test detection and rewriting of expensive recursive scans."""
+    print("\n" + "=" * 60)
+    print("COST ANALYSIS")
+    print("=" * 60)
+    
+    mounts = [Mount("/", "ext4"), Mount("/proc", "proc"), Mount("/sys", "sysfs"),
+              Mount("/sys/fs/cgroup", "cgroup2"), Mount("/mnt/nfs", "nfs4")]
+    saved = cost.EXPENSIVE_INODES, cost.LOCATE_DATABASES
+    cost.EXPENSIVE_INODES, cost.LOCATE_DATABASES = 0, []
+    try:
+        report = analyze_command('find / -name "*.log" 2>/dev/null | head', mounts=mounts)
+        print(f"  {report.rewrite}")
+        print(f"  estimate: {format_estimate(report)}")
+        assert "find scans from / with no -maxdepth" in report.reasons
+        assert "find crosses into /proc, /sys" in report.reasons
+        assert report.network == ("/mnt/nfs",) and report.filesystems == 1
+        assert report.rewrite == (
+            'ionice -c3 nice find / -path /mnt/nfs -prune -o -path /proc -prune -o '
+            '-path /sys -prune -o \\( -name "*.log" \\) -print 2>/dev/null | head')
+        
+        # Global options stay in front; an explicit action needs no -print
+        report = analyze_command("find / -maxdepth 3 -name x -exec ls {} +", mounts=mounts)
+        assert report.rewrite.startswith("ionice -c3 nice find / -maxdepth 3 -path /mnt/nfs")
+        assert report.rewrite.endswith("-o -name x -exec ls {} +")
+        
+        # Prune paths are spelled from the start path as written
+        report = analyze_command("find . -name x", cwd="/", mounts=mounts)
+        assert "find crosses into /proc, /sys" in report.reasons
+        assert report.rewrite == ("ionice -c3 nice find . -path ./mnt/nfs -prune -o -path ./proc "
+                                  "-prune -o -path ./sys -prune -o \\( -name x \\) -print")
+        report = analyze_command("find ../.. -path ../../proc -prune -o -name x -print",
+                                 cwd="/var/log", mounts=mounts)
+        assert "find crosses into /proc, /sys" not in report.reasons
+        assert "-path ../../sys -prune" in report.rewrite
+        report = analyze_command("find * -name x", cwd="/", mounts=mounts)
+        assert report.reasons and report.rewrite == "ionice -c3 nice find * -name x"
+        
+        # A redirection among the arguments is neither a start path nor expression
+        report = analyze_command("find / 2> errors.txt -name x", mounts=mounts)
+        assert report.reasons[0] == "find scans from / with no -maxdepth"
+        assert report.rewrite.endswith("-o \\( -name x \\) -print 2> errors.txt")
+        
+        # Only the scan is rewritten; whitespace in quotes and elsewhere is kept
+        report = analyze_command('grep -r "foo  bar" /', mounts=mounts)
+        assert report.rewrite.endswith('grep -r "foo  bar" /')
+        report = analyze_command("echo 'x   y';  du  -sh /\n\n", mounts=mounts)
+        assert report.rewrite == "echo 'x   y';  ionice -c3 nice du -x -sh /\n\n"
+        
+        report = analyze_command("du -sh /* | sort -h", mounts=mounts)
+        assert report.rewrite == "ionice -c3 nice du -x -sh /* | sort -h"
+        report = analyze_command("grep -rn TODO /mnt", mounts=mounts)
+        assert "grep enters network mounts /mnt/nfs" in report.reasons
+        
+        # Bounded scans are estimated but left alone
+        for command in ("find . -name '*.py'", "find /home -xdev -name x", "du -sh /var"):
+            report = analyze_command(command, cwd="/home/user", mounts=mounts)
+            assert report.reasons == () and report.rewrite is None, command
+        assert analyze_command("find -name x", cwd="/mnt/nfs", mounts=mounts).network == ("/mnt/nfs",)
+        assert analyze_command("grep foo /etc/hosts", mounts=mounts) is None
+        assert analyze_command("ls -la", mounts=mounts) is None
+        
+        cost.read_mounts, read_mounts = (lambda: mounts), cost.read_mounts
+        try:
+            command = "find / -type f -size +1G"
+            offered = []
+            assert review_command(command, mode="suggest")[0] == command
+            assert review_command(command, mode="off") == (command, None)
+            rewritten, estimate = review_command(command, ask=lambda r: offered.append(r) or True)
+            assert offered and rewritten == offered[0].rewrite
+            assert "network" not in estimate
+            assert review_command(command, mode="auto")[0] == rewritten
+            assert review_command(command, ask=lambda r: False)[0] == command
+        finally:
+            cost.read_mounts = read_mounts
+    finally:
+        cost.EXPENSIVE_INODES, cost.LOCATE_DATABASES = saved
+    
+    print("\n✓ Cost analysis working")
+    return True
+
+
+def test_parallel_execution():
+    """Test splitting of independent commands and their concurrent execution."""
+    print("\n" + "=" * 60)
+    print("PARALLEL EXECUTION")
+    print("=" * 60)
+    
+    split_cases = [
+        ("df -h; free -h; systemctl --failed", ["df -h", "free -h", "systemctl --failed"]),
+        ("df -h\nps aux | grep -c ssh 2>/dev/null\n", ["df -h", "ps aux | grep -c ssh 2>/dev/null"]),
+        ("echo $(date; uname) && uptime; who", ["echo $(date; uname) && uptime", "who"]),
+        ("df -h", None),
+        ("cd /tmp; ls", None),
+        ("ls > files.txt; wc -l files.txt", None),
+        ("systemctl restart nginx; systemctl status nginx", None),
+        ("find . -name '*.tmp' -delete; ls", None),
+        ("sleep 5 & df", None),
+        ("(cd /var; ls); df", None),
+        ("for d in /var /tmp; do du -sh $d; done", None),
+    ]
+    for command, expected in split_cases:
+        pieces = split_independent(command)
+        print(f"  {command!r} -> {len(pieces)}")
+        assert pieces == (expected or [command]), (command, pieces)
+    
+    # Three half-second commands share the pool; the first is not kept waiting
+    out = io.StringIO()
+    started = time.monotonic()
+    results = run_parallel(["sleep 0.5; echo one", "sleep 0.5; echo two", "echo three; sleep 0.5"],
+                           stream=True, workers=3, limits=NO_LIMITS, stdout=out, stderr=out)
+    elapsed = time.monotonic() - started
+    print(f"  3 x 0.5s with 3 workers -> {elapsed:.2f}s")
+    assert elapsed < 1.2
+    assert [item.label for item in results] == ["1", "2", "3"]
+    assert all(item.result.success and item.result.returncode == 0 for item in results)
+    assert sorted(out.getvalue().splitlines()) == ["[1] one", "[2] two", "[3] three"]
+    assert results[0].result.output == "one\n"
+    
+    # Per-command timeouts, structured failures, cwd, buffered output
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_parallel(["sleep 5", "pwd", "exit 3"], timeout=[0.3, 5, 5],
+                               cwd=tmp, limits=NO_LIMITS, labels=["slow", "pwd", "fail"])
+        assert not results[0].result.success and "timed out" in results[0].result.error
+        assert results[0].duration < 2
+        assert results[1].result.output.strip() == os.path.realpath(tmp)
+        assert results[2].result.returncode == 3 and not results[2].result.success
+    
+    # Limits hold in worker threads too
+    limits = NO_LIMITS._replace(open_files=32, nice=3)
+    results = run_parallel(["ulimit -n", "nice"], limits=limits)
+    assert [item.result.output.strip() for item in results] == ["32", str(os.nice(0) + 3)]
+    
+    # Cancelled commands are recorded as interrupted, not as never run
+    def outcome(error, returncode):
+        return CommandResult("df", "1", ExecutionResult(False, "", error, returncode, None), 0.0)
+    assert parallel_exit_status([outcome("", 0), outcome("", 2)]) == 2
+    assert parallel_exit_status([outcome("", 0), outcome("ERROR: Command cancelled", None)]) \
+        == parallel_exit_status([outcome("x\nERROR: Command cancelled", -9)]) == CANCELLED_STATUS
+    assert parallel_exit_status([outcome("ERROR: Execution failed - no bash", None)]) == 127
+    
+    # A single worker runs them one after another
+    started = time.monotonic()
+    run_parallel(["sleep 0.3"] * 3, workers=1, limits=NO_LIMITS)
+    assert time.monotonic() - started >= 0.9
+    assert run_parallel([]) == []
+    
+    print("\n✓ Parallel execution working")
+    return True
+
+
+def test_daemon_socket():
+    """Test that the daemon socket is only used when private to the user."""
+    print("\n" + "=" * 60)
+    print("DAEMON SOCKET")
+    print("=" * 60)
+    
+    class EchoGenerator:
+        def generate_command(self, request):
+            return "df -h"
+    
+    context = {"distro_id": "ubuntu", "pkg_manager": "apt"}
+    with tempfile.TemporaryDirectory() as tmp:
+        run_dir = os.path.join(tmp, "run")
+        socket_path = os.path.join(run_dir, "ai-bash.sock")
+        assert send_request({"op": "ping"}, socket_path) is None
+        
+        # The daemon creates a missing directory 0700 and serves from it
+        daemon = CommandDaemon(generator=EchoGenerator(), system_context=context)
+        server = threading.Thread(target=daemon.serve, args=(socket_path,), daemon=True)
+        server.start()
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.02)
+        assert os.stat(run_dir).st_mode & 0o777 == 0o700
+        check_private_directory(run_dir)
+        reply = send_request({"op": "generate", "request": "disk usage"}, socket_path)
+        print(f"  private directory -> {reply['command']}")
+        assert reply["command"] == "df -h" and reply["safe"]
+        
+        # Anyone else able to write to the directory could swap the socket
+        os.chmod(run_dir, 0o755)
+        try:
+            send_request({"op": "ping"}, socket_path)
+            assert False, "client trusted a non-private directory"
+        except PermissionError as e:
+            print(f"  0755 directory -> refused ({e})")
+        os.chmod(run_dir, 0o700)
+        
+        # A socket that belongs to someone else is never connected to
+        if os.getuid() == 0:
+            os.chown(socket_path, 65534, -1)
+            try:
+                send_request({"op": "ping"}, socket_path)
+                assert False, "client trusted a socket owned by another user"
+            except PermissionError:
+                print("  foreign socket -> refused")
+            os.chown(socket_path, 0, -1)
+        
+        send_request({"op": "shutdown"}, socket_path)
+        server.join(timeout=5)
+        assert not server.is_alive() and not os.path.exists(socket_path)
+        
+        # The daemon will not start in a shared directory
+        shared = os.path.join(tmp, "shared")
+        os.mkdir(shared)
+        os.chmod(shared, 0o1777)
+        try:
+            CommandDaemon(generator=EchoGenerator(), system_context=context).serve(
+                os.path.join(shared, "ai-bash.sock"))
+            assert False, "daemon served from a shared directory"
+        except RuntimeError as e:
+            print(f"  1777 directory -> {e}")
+            assert "not private" in str(e)
+        assert not os.path.exists(os.path.join(shared, "ai-bash.sock"))
+    
+    print("\n✓ Daemon socket checks working")
+    return True
+
+
 def run_all_tests():
     """Run all test suites."""
     print("\n╔═══════════════════════════════════════════╗")
@@ -180,8 +1620,33 @@ def run_all_tests():
     
     # Run tests
     results.append(("System Detection", test_system_detection()))
+    results.append(("Distro Mapping", test_distro_mapping()))
     results.append(("Safety Validation", test_safety_validation()))
     results.append(("Dangerous Patterns", test_dangerous_patterns()))
+    results.append(("Rule Matches", test_rule_matches()))
+    results.append(("Parsed Safety", test_parsed_safety()))
+    results.append(("Verdict Cache", test_verdict_cache()))
+    results.append(("Executable Index", test_executable_index()))
+    results.append(("Linear Matching", test_linear_matching()))
+    results.append(("Generation Cache", test_generation_cache()))
+    results.append(("Command History", test_history_store()))
+    results.append(("Intent Engine", test_intent_engine()))
+    results.append(("Similarity Index", test_similarity_index()))
+    results.append(("Streaming Execution", test_streaming_execution()))
+    results.append(("Shell Session", test_shell_session()))
+    results.append(("Resource Limits", test_resource_limits()))
+    results.append(("Cost Analysis", test_cost_analysis()))
+    results.append(("Parallel Execution", test_parallel_execution()))
+    results.append(("Daemon Socket", test_daemon_socket()))
+    results.append(("Hedged Generation", test_hedged_generation()))
+    results.append(("Async Generation", test_async_generation()))
+    results.append(("Native Async Generation", test_native_async_generation()))
+    results.append(("Streaming Generation", test_streaming_generation()))
+    results.append(("Batch Mode", test_batch_mode()))
+    results.append(("Startup Warm-up", test_startup_warmup()))
+    results.append(("OpenAI Backend", test_openai_backend()))
+    results.append(("Metrics", test_metrics()))
+    results.append(("Benchmark Harness", test_benchmark_harness()))
     results.append(("README Examples", test_readme_examples()))
     
     # Summary